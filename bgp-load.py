@@ -0,0 +1,388 @@
+#! /usr/bin/env python2.7
+
+##     PyRT: Python Routeing Toolkit
+
+##     A stand-in BGP peer: completes a session with a collector (bgp.py),
+##     then pushes synthetic UPDATE load at it -- a full table, steady
+##     churn, bursts -- and reports the rate achieved.
+
+##     Copyright (C) 2001 Richard Mortier <mort@sprintlabs.com>, Sprint ATL
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+import time, getopt, sys, string, os, socket, select, random
+import bgp
+from mutils import *
+
+# octets handed to the socket at a time, and the socket's send buffer: kept
+# small, so that what's reported as sent has mostly been received too
+
+SEND_CHUNK = 65536
+SEND_BUF   = 65536
+
+# the most hops added to our AS in a synthetic AS_PATH, and the largest
+# (non-private) AS to use
+
+MAX_HOPS   = 6
+MAX_AS     = 64511
+
+################################################################################
+
+class Load:
+
+    # A synthetic routeing table, and UPDATE load drawn from it: pfxs
+    # prefixes of length plen, counting up from base, each on one of paths
+    # AS_PATHs (asn and up to MAX_HOPS more), per_msg prefixes to an UPDATE.
+    # Everything's drawn from a generator seeded by seed, so runs are
+    # reproducible.  The UPDATEs are packed ahead of time, so that packing
+    # them isn't measured.
+
+    def __init__(self, asn, next_hop, pfxs, paths, per_msg, base, plen,
+                 seed=0):
+
+        self._rng     = random.Random(seed)
+        self._per_msg = per_msg
+
+        seq = bgp.AS_PATH_SEG_TYPES["SEQUENCE"]
+        self._attrs = []
+        for i in range(paths):
+            asns = [asn] + [ self._rng.randint(1, MAX_AS)
+                             for j in range(self._rng.randint(0, MAX_HOPS)) ]
+            self._attrs.append(bgp.packAttrs(bgp.NLRI_SRC["IGP"],
+                                             ((seq, asns), ), next_hop))
+
+        step = 1L << (32-plen)
+        self._pfxs = [ ((base + i*step) & 0xffffffffL, plen)
+                       for i in range(pfxs) ]
+        self._path = [ self._rng.randrange(paths) for i in range(pfxs) ]
+
+    def table(self):
+
+        # the whole table, prefixes on the same path packed together
+
+        paths = {}
+        for i in range(len(self._pfxs)):
+            paths.setdefault(self._path[i], []).append(self._pfxs[i])
+
+        msgs = []
+        upd  = bgp.MSG_TYPES["UPDATE"]
+        for (path, pfxs) in sorted(paths.items()):
+            for i in range(0, len(pfxs), self._per_msg):
+                nlri = bgp.packPfxs(pfxs[i:i+self._per_msg])
+                msgs.append(bgp.packMsg(upd, bgp.packUpdate("",
+                                                            self._attrs[path],
+                                                            nlri)))
+        return msgs
+
+    def churn(self, n):
+
+        # n UPDATEs, each for a prefix drawn at random: half withdraw it,
+        # half announce it again, on a path drawn at random
+
+        msgs = []
+        upd  = bgp.MSG_TYPES["UPDATE"]
+        for k in range(n):
+            i   = self._rng.randrange(len(self._pfxs))
+            pfx = bgp.packPfxs((self._pfxs[i], ))
+            if self._rng.random() < 0.5:
+                msgs.append(bgp.packMsg(upd, bgp.packUpdate(pfx)))
+            else:
+                self._path[i] = self._rng.randrange(len(self._attrs))
+                msgs.append(bgp.packMsg(upd,
+                                        bgp.packUpdate("",
+                                                       self._attrs[self._path[i]],
+                                                       pfx)))
+        return msgs
+
+#-------------------------------------------------------------------------------
+
+def service(speaker, verbose=1, level=0):
+
+    # keep the session up: handle whatever the collector's sent, and run the
+    # timers
+
+    while select.select([speaker._sock], [], [], 0)[0]:
+        speaker.process(verbose, level)
+    speaker.timers(time.time(), verbose, level)
+
+def send(speaker, msgs, rate=0, burst=0, interval=0, verbose=1, level=0):
+
+    # Send msgs: at rate a second, or burst at a time every interval
+    # seconds, or else as fast as they'll go.  Returns the octets sent, and
+    # how long it took.
+
+    octets = 0
+    t0     = time.time()
+    k      = 0
+    while k < len(msgs):
+        now = time.time()
+        if rate:
+            due = min(int((now - t0) * rate) + 1, len(msgs))
+        elif burst:
+            due = min((int((now - t0) / interval) + 1) * burst, len(msgs))
+        else:
+            due = len(msgs)
+
+        if due <= k:
+            service(speaker, verbose, level)
+            if rate:
+                wait = (k + 1) / float(rate) - (now - t0)
+            else:
+                wait = (k / burst) * interval - (now - t0)
+            time.sleep(max(0, min(wait, 0.1)))
+            continue
+
+        j = k
+        n = 0
+        while j < due and n < SEND_CHUNK:
+            n = n + len(msgs[j])
+            j = j + 1
+
+        speaker._sock.sendall(string.join(msgs[k:j], ""))
+        speaker._sent_t = time.time()
+        octets = octets + n
+        k      = j
+        service(speaker, verbose, level)
+
+    return (octets, time.time() - t0)
+
+def report(phase, msgs, octets, secs):
+
+    print "%s: %d UPDATEs, %d octets in %.3fs: %.0f msgs/s, %.0f octets/s" %\
+          (phase, msgs, octets, secs, msgs / max(secs, 1e-6),
+           octets / max(secs, 1e-6))
+    sys.stdout.flush()
+
+################################################################################
+
+if __name__ == "__main__":
+
+    VERBOSE   = 1
+
+    loc_name  = None
+    rem_name  = None
+    asn       = None
+    port      = bgp.BGP_LISTEN_PORT
+    holdtime  = 0
+
+    pfxs      = 10000
+    pfx_base  = "16.0.0.0/24"
+    paths     = 1000
+    per_msg   = 4
+    seed      = 0
+
+    table     = 0
+    rate      = 0
+    churn     = 0
+    burst     = 0
+    interval  = 1.0
+    duration  = 10.0
+    wait      = 0
+
+    #---------------------------------------------------------------------------
+
+    def usage():
+
+        print """Usage: %s [ options ] ([*] options required):
+        -h|--help       : Help
+        -q|--quiet      : Be quiet
+        -v|--verbose    : Be verbose
+        -V|--VERBOSE    : Be very verbose
+
+        -a|--as         : [*] Local AS number
+        -l|--local      : Address/name to listen on, or bind to
+        -t|--port       : BGP port [def: %d]
+        -p|--peer       : Connect to the collector at this address/name,
+                          rather than waiting for it to connect
+        -o|--holdtime   : Hold time to offer [def: 0, none]
+
+        -n|--prefixes   : Prefixes in the table [def: %d]
+        -P|--prefix-base: First prefix, and length of all [def: %s]
+        -d|--paths      : Distinct AS_PATHs among them [def: %d]
+        -k|--per-update : Prefixes per UPDATE in the table [def: %d]
+        -s|--seed       : Seed for the random choices [def: %d]
+
+        -T|--table      : Send the table [def., if nothing else is
+                          asked for]
+        -r|--rate       : ...at most this many UPDATEs a second
+                          [def: as fast as it'll go]
+        -c|--churn      : Then churn, this many UPDATEs a second
+        -b|--burst      : Then bursts of this many UPDATEs...
+        -i|--interval   : ...this many seconds apart [def: %g]
+        -D|--duration   : Churn, or burst, for this many seconds
+                          [def: %g]
+        -w|--wait       : Hold the session up this many seconds after,
+                          before closing it [def: %d]""" %\
+            (os.path.basename(sys.argv[0]), bgp.BGP_LISTEN_PORT,
+             pfxs, pfx_base, paths, per_msg, seed, interval, duration, wait)
+        sys.exit(0)
+
+    #---------------------------------------------------------------------------
+
+    if len(sys.argv) < 2:
+        usage()
+
+    try:
+        opts, args =\
+              getopt.getopt(sys.argv[1:],
+                            "hqvVa:l:t:p:o:n:P:d:k:s:Tr:c:b:i:D:w:",
+                            ("help", "quiet", "verbose", "VERBOSE",
+                             "as=", "local=", "port=", "peer=", "holdtime=",
+                             "prefixes=", "prefix-base=", "paths=",
+                             "per-update=", "seed=", "table", "rate=",
+                             "churn=", "burst=", "interval=", "duration=",
+                             "wait=" ))
+    except (getopt.error):
+        usage()
+
+    for (x, y) in opts:
+        if x in ('-h', '--help'):
+            usage()
+
+        elif x in ('-q', '--quiet'):
+            VERBOSE = 0
+
+        elif x in ('-v', '--verbose'):
+            VERBOSE = 2
+
+        elif x in ('-V', '--VERBOSE'):
+            VERBOSE = 3
+
+        elif x in ('-a', '--as'):
+            asn = string.atoi(y)
+
+        elif x in ('-l', '--local'):
+            loc_name = y
+
+        elif x in ('-t', '--port'):
+            port = string.atoi(y)
+
+        elif x in ('-p', '--peer'):
+            rem_name = y
+
+        elif x in ('-o', '--holdtime'):
+            holdtime = string.atoi(y)
+
+        elif x in ('-n', '--prefixes'):
+            pfxs = string.atoi(y)
+
+        elif x in ('-P', '--prefix-base'):
+            pfx_base = y
+
+        elif x in ('-d', '--paths'):
+            paths = max(string.atoi(y), 1)
+
+        elif x in ('-k', '--per-update'):
+            per_msg = max(string.atoi(y), 1)
+
+        elif x in ('-s', '--seed'):
+            seed = string.atoi(y)
+
+        elif x in ('-T', '--table'):
+            table = 1
+
+        elif x in ('-r', '--rate'):
+            rate = string.atoi(y)
+
+        elif x in ('-c', '--churn'):
+            churn = string.atoi(y)
+
+        elif x in ('-b', '--burst'):
+            burst = string.atoi(y)
+
+        elif x in ('-i', '--interval'):
+            interval = string.atof(y)
+
+        elif x in ('-D', '--duration'):
+            duration = string.atof(y)
+
+        elif x in ('-w', '--wait'):
+            wait = string.atof(y)
+
+        else:
+            usage()
+
+    if not asn or not pfxs:
+        usage()
+
+    if not loc_name:
+        loc_name = socket.gethostname()
+
+    if not (churn or burst):
+        table = 1
+
+    #---------------------------------------------------------------------------
+
+    (base, plen) = string.split(pfx_base, '/')
+    load = Load(asn, str2id(socket.gethostbyname(loc_name)), pfxs, paths,
+                per_msg, str2id(base), string.atoi(plen), seed)
+
+    phases = []
+    if table:
+        phases.append(("table", load.table(), rate, 0))
+    if churn:
+        phases.append(("churn", load.churn(int(churn * duration)), churn, 0))
+    if burst:
+        phases.append(("burst",
+                       load.churn(burst * int(max(duration / interval, 1))),
+                       0, burst))
+
+    if rem_name:
+        speaker = bgp.Bgp(loc_name, asn, rem_name, port, holdtime)
+    else:
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((loc_name, port))
+        listener.listen(1)
+        (sock, (addr, prt)) = listener.accept()
+        listener.close()
+        speaker = bgp.Bgp(loc_name, asn, addr, prt, holdtime, sock)
+
+    speaker._sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUF)
+
+    try:
+        speaker.start(VERBOSE, 0)
+        while speaker._state != bgp.FSM_STATES["ESTABLISHED"]:
+            speaker.parseMsg(VERBOSE, 0)
+
+        if VERBOSE > 0:
+            print `speaker`
+
+        for (phase, msgs, rate, burst) in phases:
+            (octets, secs) = send(speaker, msgs, rate, burst, interval,
+                                  VERBOSE, 0)
+            report(phase, len(msgs), octets, secs)
+
+        end = time.time() + wait
+        while time.time() < end:
+            service(speaker, VERBOSE, 0)
+            time.sleep(min(0.1, max(0, end - time.time())))
+
+    except (bgp.ClosedExc, socket.error):
+        error("[ %s ]\n" % sys.exc_info()[1])
+        speaker.close(0)
+        sys.exit(1)
+
+    except (KeyboardInterrupt):
+        speaker.close(0)
+        sys.exit(1)
+
+    speaker.close(0)
+
+    #---------------------------------------------------------------------------
+
+################################################################################
+################################################################################
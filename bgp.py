@@ -1,4 +1,4 @@
-#! /usr/bin/env python2.5
+#! /usr/bin/env python2.7
 
 ##     PyRT: Python Routeing Toolkit
 
@@ -21,23 +21,116 @@
 ##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
 ##     02111-1307 USA
 
-import struct, socket, sys, math, getopt, string, os.path, time
+import struct, socket, sys, getopt, string, os.path, time, array
+import select, errno, collections, signal, Queue
 from mutils import *
 
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
 #-------------------------------------------------------------------------------
 
 INDENT          = "    "
 VERSION         = "3.0"
 
 RCV_BUF_SZ      = 8192
+RCV_RING_SZ     = 8*RCV_BUF_SZ # receive buffer; must hold a BGP_MAX_LEN message
 BGP_LISTEN_PORT = 179
 BGP_HDR_LEN     = 19
+BGP_MAX_LEN     = 4096
 BGP_MARKER      = struct.pack(">LLLL",
                               0xffffffff, 0xffffffff, 0xffffffff, 0xffffffff)
 BGP_MARKER_LEN  = len(BGP_MARKER)
 
+# collector: sessions to configured peers are retried this long after they
+# fail or close (cf. RFC 4271's ConnectRetryTime); backlog when listening
+
+CONNECT_RETRY   = 120
+LISTEN_BACKLOG  = 16
+
+# hold time until the peer's OPEN says otherwise (cf. RFC 4271's "large
+# value"); and deferred UPDATEs decoded per session before the collector
+# goes back to its timers and sockets
+
+HOLD_OPEN       = 240
+DECODE_SLICE    = 64
+
+# runs of UPDATEs handed to a decoding worker process per batch, and
+# batches queued for each before more are dropped; see decodeWorker()
+
+DECODE_BATCH    = 64
+DECODE_QUEUE    = 256
+
+# ...which run at lower priority than the collector: capture first
+
+DECODE_NICE     = 10
+
 TABLE_DUMP_ENTRY_HDR_LEN = 18
 
+# which MRT format the main program records sessions in, if any; see
+# Bgp.record()
+
+DUMP_MRTD       = 0
+
+# decoded path attributes memoised, keyed by their raw octets; see
+# decodeAttrs()
+
+ATTR_MEMO_SZ    = 4096
+
+# precompiled formats for the per-message and per-attribute paths
+
+UBYTE_S       = struct.Struct("B")
+USHORT_S      = struct.Struct(">H")
+ULONG_S       = struct.Struct(">L")
+TLV_HDR_S     = struct.Struct("BB")
+ATTR_HDR_S    = struct.Struct("BBB")
+PDU_HDR_S     = struct.Struct(">HB")
+OPEN_S        = struct.Struct(">BHHL")
+MP_CAP_S      = struct.Struct(">HH")
+GR_CAP_S      = struct.Struct(">HHBB")
+AGGREGATOR_S  = struct.Struct(">HL")
+COMMUNITY_S   = struct.Struct(">HH")
+TABLE_ENTRY_S = struct.Struct(">LBBLLHH")
+PFX3_S        = struct.Struct(">HB")
+PFX6_S        = struct.Struct(">LLLL")
+MP_REACH_S    = struct.Struct(">HBB")
+MP_UNREACH_S  = struct.Struct(">HB")
+
+# array typecode for 32 bit unsigned integers; "L" is 8 octets on most 64
+# bit platforms
+
+U32_CODE = [ c for c in "ILH" if array.array(c).itemsize == 4 ][0]
+
+# octets in a prefix of each length, and the mask for each IPv4 prefix
+# length (longer ones are bogus, and left unmasked)
+
+PFX_OCTETS = tuple([ (plen+7)/8 for plen in range(256) ])
+PFX_MASKS  = tuple([ (0xffffffffL << (32-plen)) & 0xffffffffL
+                     for plen in range(33) ] + [ 0xffffffffL ]*(256-33))
+
+# ...and the masks for the four words of each IPv6 prefix length
+
+PFX6_MASKS = tuple([ tuple([ PFX_MASKS[min(max(plen - 32*i, 0), 32)]
+                             for i in range(4) ])
+                     for plen in range(129) ] +
+                   [ (0xffffffffL, )*4 ]*(256-129))
+
+# AS_PATH segments and CLUSTER_LISTs are variable length; compile each size
+# once, on first sight
+
+ASNS_S = {}
+IDS_S  = {}
+
+def nStruct(cache, code, n):
+
+    try:
+        return cache[n]
+    except KeyError:
+        s = cache[n] = struct.Struct(">%d%s" % (n, code))
+        return s
+
 ################################################################################
 
 DLIST = []
@@ -113,12 +206,33 @@ AS_PATH_SEG_TYPES = { 1L: "SET",
                       }
 DLIST = DLIST + [AS_PATH_SEG_TYPES]
 
+# session states; numbered as for the MRT STATE_CHANGE records
+
+FSM_STATES = { 1L: "IDLE",
+               2L: "CONNECT",
+               3L: "ACTIVE",
+               4L: "OPENSENT",
+               5L: "OPENCONFIRM",
+               6L: "ESTABLISHED"
+               }
+DLIST = DLIST + [FSM_STATES]
+
 for d in DLIST:
     for k in d.keys():
         d[ d[k] ] = k
 
 #-------------------------------------------------------------------------------
 
+NOTIFY_CODES = { 1L: "MSG_HDR_ERROR",
+                 2L: "OPEN_MSG_ERROR",
+                 3L: "UPDATE_MSG_ERROR",
+                 4L: "HOLD_TIMER_EXPIRED",
+                 5L: "FSM_ERROR",
+                 6L: "CEASE"
+                 }
+for k in NOTIFY_CODES.keys():
+    NOTIFY_CODES[ NOTIFY_CODES[k] ] = k
+
 # index via [code][subcode]
 NOTIFY_STRINGS = [
     [ "message header error",
@@ -168,27 +282,275 @@ NOTIFY_STRINGS = [
 
 ################################################################################
 
-def parseBgpPdu(msg_type, msg_len, msg, verbose=1, level=0):
+# Compact RVs; see mutils.Slots.  An UPDATE is an Rv whose value is an
+# Update, whose PATH_ATTRS is a PathAttrs mapping type codes to PathAttrs.
 
-    msg     = msg[BGP_HDR_LEN:]
-    msg_len = msg_len - BGP_HDR_LEN
-    if   msg_type == MSG_TYPES["OPEN"]:
-        rv = parseOpen(msg_len, msg, verbose, level)
+class Update(Slots):
+
+    __slots__ = ("UNFEASIBLE", "PATH_ATTRS", "FEASIBLE")
+
+class PathAttr(Slots):
+
+    __slots__ = ("T", "L", "V", "FLAGS")
+
+    def __init__(self, T, L, V):
+
+        self.T = T
+        self.L = L
+        self.V = V
+
+class AttrFlags(Slots):
+
+    # There are only sixteen of these, so they're shared (see attrFlags()),
+    # and so can't be modified.
+
+    __slots__ = ("optional", "transitive", "partial", "extlen")
+
+    def __setitem__(self, k, v):
+
+        raise TypeError, "attribute flags are shared"
 
-    elif msg_type == MSG_TYPES["UPDATE"]:
-        rv = parseUpdate(msg_len, msg, verbose, level)
+    def __delitem__(self, k):
 
-    elif msg_type == MSG_TYPES["NOTIFICATION"]:
-        rv = parseNotify(msg_len, msg, verbose, level)
+        raise TypeError, "attribute flags are shared"
 
-    elif msg_type == MSG_TYPES["KEEPALIVE"]:
-        rv = parseKeepalive(msg_len, msg, verbose, level)
+ATTR_FLAGS = {}
+
+def attrFlags(aflags):
+
+    aflags = aflags & 0xf0
+    try:
+        return ATTR_FLAGS[aflags]
+    except KeyError:
+        f = ATTR_FLAGS[aflags] = AttrFlags(
+            optional   = (aflags & (1<<7)) >> 7,
+            transitive = (aflags & (1<<6)) >> 6,
+            partial    = (aflags & (1<<5)) >> 5,
+            extlen     = (aflags & (1<<4)) >> 4)
+        return f
+
+class PathAttrs(Slots):
+
+    # Path attributes keyed by type code, held as a flat tuple of type,
+    # attr, type, attr... in the order they came off the wire, rather than
+    # as a dictionary.  There are rarely more than a handful, so lookup is a
+    # linear search.
+
+    __slots__ = ("_kv",)
+
+    def __init__(self, kv=()):
+
+        self._kv = ()
+        ks = kv[0::2]
+        if len(dict.fromkeys(ks)) == len(ks):
+            self._kv = tuple(kv)
+        else:
+            # repeated type codes: the last one wins, as for a dictionary
+            for i in range(0, len(kv), 2):
+                self[kv[i]] = kv[i+1]
+
+    def __getitem__(self, k):
+
+        kv = self._kv
+        for i in range(0, len(kv), 2):
+            if kv[i] == k:
+                return kv[i+1]
+        raise KeyError, k
+
+    def __setitem__(self, k, v):
+
+        kv = list(self._kv)
+        ks = kv[0::2]
+        if k in ks:
+            kv[2*ks.index(k)+1] = v
+        else:
+            kv = kv + [k, v]
+        self._kv = tuple(kv)
+
+    def __delitem__(self, k):
+
+        kv = list(self._kv)
+        ks = kv[0::2]
+        if k not in ks:
+            raise KeyError, k
+        i = 2*ks.index(k)
+        self._kv = tuple(kv[:i] + kv[i+2:])
+
+    def keys(self):
+
+        return list(self._kv[0::2])
+
+# Decoded path attributes are memoised (see decodeAttrs()), so the same
+# objects turn up in many RVs, and can't be modified.
+
+class SharedPathAttr(PathAttr):
+
+    __slots__ = ()
+
+    def __setitem__(self, k, v):
+
+        raise TypeError, "path attributes are shared"
+
+    def __delitem__(self, k):
+
+        raise TypeError, "path attributes are shared"
+
+# (no new slots, but Slots finds the keys in __slots__)
+SharedPathAttr.__slots__ = PathAttr.__slots__
+
+class SharedPathAttrs(PathAttrs):
+
+    __slots__ = ()
+
+    def __init__(self, kv=()):
+
+        self._kv = PathAttrs(kv)._kv
+
+    def __setitem__(self, k, v):
+
+        raise TypeError, "path attributes are shared"
+
+    def __delitem__(self, k):
+
+        raise TypeError, "path attributes are shared"
+
+class TableEntry(Slots):
+
+    # a TABLE_DUMP entry; path attributes are keyed by type code alongside
+    # the named fields
+
+    __slots__ = ("PREFIX", "STATUS", "UPTIME", "PEER_IP", "PEER_AS", "ATTRS",
+                 "_pa")
+
+    def __init__(self, **kw):
+
+        Slots.__init__(self, **kw)
+        self._pa = PathAttrs()
+
+    def __getitem__(self, k):
+
+        if k.__class__ is str:
+            return Slots.__getitem__(self, k)
+        return self._pa[k]
+
+    def __setitem__(self, k, v):
+
+        if k.__class__ is str:
+            Slots.__setitem__(self, k, v)
+        else:
+            self._own()
+            self._pa[k] = v
+
+    def __delitem__(self, k):
+
+        if k.__class__ is str:
+            Slots.__delitem__(self, k)
+        else:
+            self._own()
+            del self._pa[k]
 
-    elif msg_type == MSG_TYPES["ROUTE_REFRESH"]:
-        rv = parseRouteRefresh(msg_len, msg, verbose, level)
+    def _own(self):
+
+        # copy shared path attributes before changing them
+
+        if self._pa.__class__ is not PathAttrs:
+            self._pa = PathAttrs(self._pa._kv)
+
+    def keys(self):
+
+        return Slots.keys(self) + self._pa.keys()
+
+def words2id6(w, i=0):
+
+    # the IPv6 address in the four 32 bit words w[i:i+4]
+
+    return ((long(w[i]) << 96) | (long(w[i+1]) << 64) |
+            (long(w[i+2]) << 32) | w[i+3])
+
+class MpNlri(Slots):
+
+    # the value of an MP_REACH_NLRI or MP_UNREACH_NLRI (which has no
+    # NEXT_HOP); NLRI are (prefix, length) pairs, as for an UPDATE's
+
+    __slots__ = ("AFI", "SAFI", "NEXT_HOP", "NLRI")
+
+class PfxIds(object):
+
+    # A batch of prefixes of one address family, as (prefix, length)
+    # integer pairs (see decodePfxIds()), packed into arrays: the lengths
+    # one octet each, and the prefixes as one (IPv4) or four (IPv6) 32 bit
+    # words each.  Indexes and iterates as a list of the pairs, and compares
+    # equal to one.
+
+    __slots__ = ("afi", "words", "plens")
+    __hash__  = None
+
+    def __init__(self, afi=1):
+
+        self.afi   = afi
+        self.words = array.array(U32_CODE)
+        self.plens = array.array("B")
+
+    def __len__(self):
+
+        return len(self.plens)
+
+    def __getitem__(self, i):
+
+        if i < 0:
+            i = i + len(self.plens)
+        plen = self.plens[i]
+        if self.afi != AFI_TYPES["IP6"]:
+            return (self.words[i], plen)
+
+        return (words2id6(self.words, 4*i), plen)
+
+    def __iter__(self):
+
+        for i in xrange(len(self.plens)):
+            yield self[i]
+
+    def extend(self, other):
+
+        self.words.extend(other.words)
+        self.plens.extend(other.plens)
+
+    def __eq__(self, other):
+
+        if isinstance(other, (PfxIds, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+
+        rv = self.__eq__(other)
+        if rv is NotImplemented:
+            return rv
+        return not rv
+
+    def __repr__(self):
+
+        return repr(list(self))
+
+################################################################################
+
+def parseBgpPdu(msg_type, msg_len, msg, verbose=1, level=0, attrs=None):
+
+    # attrs, if given, projects the path attributes of an UPDATE; see
+    # decodeAttrs()
+
+    msg     = msg[BGP_HDR_LEN:]
+    msg_len = msg_len - BGP_HDR_LEN
+
+    parser = PDU_PARSERS.get(msg_type)
+    if parser and attrs is not None and msg_type == MSG_TYPES["UPDATE"]:
+        rv = parser(msg_len, msg, verbose, level, attrs)
+
+    elif parser:
+        rv = parser(msg_len, msg, verbose, level)
 
     else:
-        rv = {"T": None, "L": 0, "V": None}
+        rv = Rv(T=None, L=0, V=None)
         if verbose > 0:
             print level*INDENT + "[ *** UNKNOWN MESSAGE TYPE *** ]"
 
@@ -198,15 +560,12 @@ def parseBgpPdu(msg_type, msg_len, msg, verbose=1, level=0):
 
 def parseOpen(msg_len, msg, verbose=1, level=0):
 
-    rv = {"T": MSG_TYPES["OPEN"],
-          "L": msg_len,
-          "V": {}
-          }
+    rv = Rv(T=MSG_TYPES["OPEN"], L=msg_len, V={})
 
     if verbose > 1:
         print prtbin(level*INDENT, msg[:msg_len])
 
-    version, asn, holdtime, bgp_id = struct.unpack(">BHHL", msg[0:9])
+    version, asn, holdtime, bgp_id = OPEN_S.unpack(msg[0:9])
 
     if verbose > 0:
         print level*INDENT +\
@@ -231,7 +590,7 @@ def parseBgpOpts(opts, verbose=1, level=0):
 
     rv = []
 
-    opts_len = struct.unpack("B", opts[0])
+    opts_len = UBYTE_S.unpack(opts[0])
     if verbose > 1:
         print prtbin(level*INDENT, opts[0])
 
@@ -240,7 +599,7 @@ def parseBgpOpts(opts, verbose=1, level=0):
 
     opts = opts[1:]
     while len(opts) > 0:
-        opt_type, opt_len = struct.unpack("BB", opts[0:2])
+        opt_type, opt_len = TLV_HDR_S.unpack(opts[0:2])
         trv = { "T": opt_type,
                 "L": opt_len,
                 "V": {},
@@ -254,349 +613,842 @@ def parseBgpOpts(opts, verbose=1, level=0):
 
         opts = opts[2:]
 
-        if opt_type == OPT_PARAMS["CAPABILITY"]:
+        if opt_type == OPT_PARAMS["CAPABILITY"]:
+
+            level = level + 1
+            cap_code, cap_len = TLV_HDR_S.unpack(opts[0:2])
+
+            trv["V"] = { "T": cap_code,
+                         "L": cap_len,
+                         "V": {}
+                         }
+
+            if verbose > 1:
+                print prtbin(level*INDENT, opts[0:2+cap_len])
+            if verbose > 0:
+                print level*INDENT +\
+                      "capability:", CAP_CODES[cap_code], "len=" + `cap_len`
+            if verbose > 1:
+                print prtbin(level*INDENT, opts[2:2+cap_len])
+
+            if cap_code == CAP_CODES["MULTIPROTOCOL_EXT"]:
+                afi, safi = MP_CAP_S.unpack(opts[2:2+cap_len])
+                if verbose > 0:
+                    print level*INDENT +\
+                          "afi:", AFI_TYPES[afi], "safi:", SAFI_TYPES[safi]
+
+                trv["V"]["V"] = { "AFI": afi, "SAFI": safi }
+
+            elif cap_code == CAP_CODES["GRACEFUL_RESTART"]:
+                rinfo, afi, safi, af_flags = GR_CAP_S.unpack(opts[2:2+cap_len])
+                flg_preserve_fwd_st = (af_flags & (1<<7)) >> 7
+                if verbose > 0:
+                    print level*INDENT +\
+                          "restart flags:", (rinfo >> 12), \
+                          "restart time:", (rinfo & 0xFFF), \
+                          "afi:", AFI_TYPES[afi], "safi:", SAFI_TYPES[safi]
+                    print level*INDENT +\
+                          "address family flags: [ %s ]" % \
+                          ("forwarding state preserved"*flg_preserve_fwd_st)
+
+                trv["V"]["V"] = { "AFI": afi, "SAFI": safi,
+                                  "RESTART_FLAGS": rinfo >> 12,
+                                  "RESTART_TIME":  rinfo & 0xfff,
+                                  "PRESERVED": flg_preserve_fwd_st,
+                                  }
+
+            elif cap_code == CAP_CODES["ROUTE_REFRESH"]:
+                pass
+
+            elif cap_code == CAP_CODES["ROUTE_REFRESH_Z"]:
+                pass
+
+            else:
+                if verbose > 0:
+                    print level*INDENT +\
+                          "[ *** UNKNOWN CAPABILITY CODE: %d *** ]" % cap_code
+            level = level - 1
+
+        else:
+            if verbose > 0:
+                print level*INDENT +\
+                      "[ *** UNKNOWN OPTIONAL PARAMETER: %d *** ]" % opt_type
+
+        rv.append(trv)
+        opts = opts[opt_len:]
+
+    return rv
+
+#-------------------------------------------------------------------------------
+
+def parseUpdate(msg_len, msg, verbose=1, level=0, attrs=None):
+
+    # decodes only; the human readable version is built by prtUpdate(), and
+    # only if we're going to print it.  attrs, if given, are the only path
+    # attributes decoded; see decodeAttrs()
+
+    (up, ap, np, endp) = updateBounds(msg)
+
+    rv = Rv(T=MSG_TYPES["UPDATE"],
+            L=msg_len,
+            V=Update(UNFEASIBLE=decodePfxs(msg, up, ap-2),
+                     PATH_ATTRS=decodeAttrs(msg, ap, np, attrs),
+                     FEASIBLE=decodePfxs(msg, np, endp)))
+
+    if verbose > 0:
+        prtUpdate(msg_len, msg, rv, verbose, level)
+
+    return rv
+
+#-------------------------------------------------------------------------------
+
+def updateBounds(msg, curp=0):
+
+    # the offsets in msg of the unfeasible routes, path attributes and NLRI
+    # of the UPDATE (less common header) starting at curp, and of its end;
+    # each part runs up to 2 octets short of the next (its length field)
+
+    endp = len(msg)
+    (unfeasible_len, ) = USHORT_S.unpack_from(msg, curp)
+    ap = min(curp + 2 + unfeasible_len, endp)
+    (path_attr_len, )  = USHORT_S.unpack_from(msg, ap)
+    np = min(ap + 2 + path_attr_len, endp)
+
+    return (curp+2, ap+2, np, endp)
+
+def splitUpdate(msg):
+
+    # split an UPDATE (less common header) into its raw unfeasible routes,
+    # path attributes and NLRI, so that each can be decoded only if needed
+
+    (up, ap, np, endp) = updateBounds(msg)
+    return (msg[up:ap-2], msg[ap:np], msg[np:endp])
+
+def decodePfxs(pfxs, curp=0, endp=None):
+
+    # "BGP4: Inter-domain routing in the Internet" John W. Stewart III.
+    # Unfeasible (withdrawn) routes are a sequence of (len, pfx) pairs, where
+    # len is the length of the prefix in _bits_, and pfx is the prefix, padded
+    # to a whole number of octets.  All such padding must be ignored.  NLRI
+    # information, the prefixes to which path attributes apply, are encoded
+    # the same way.  Decodes pfxs[curp:endp], without copying it.
+
+    if endp is None:
+        endp = len(pfxs)
+
+    rv = []
+    while curp < endp:
+
+        (plen, ) = UBYTE_S.unpack_from(pfxs, curp)
+        curp = curp + 1
+        nxtp = curp + PFX_OCTETS[plen]
+        if nxtp > endp:
+            nxtp = endp
+
+        rv.append((pfxs[curp:nxtp], plen))
+        curp = curp + PFX_OCTETS[plen]
+
+    return rv
+
+def decodePfxIds(pfxs, curp=0, endp=None, afi=1):
+
+    # as decodePfxs(), but straight to (prefix, length) integer pairs, the
+    # prefix masked to its length (see mutils.pfx2id()), batched as a
+    # PfxIds; IPv4 or IPv6
+
+    if endp is None:
+        endp = len(pfxs)
+
+    rv = PfxIds(afi)
+    if afi == AFI_TYPES["IP6"]:
+        return decodePfx6Ids(pfxs, curp, endp, rv)
+
+    words = rv.words
+    plens = rv.plens
+    while curp < endp:
+
+        (plen, ) = UBYTE_S.unpack_from(pfxs, curp)
+        curp = curp + 1
+        n    = min(PFX_OCTETS[plen], endp - curp)
+
+        if n >= 4:
+            (pfx, ) = ULONG_S.unpack_from(pfxs, curp)
+        elif n == 3:
+            hi, lo = PFX3_S.unpack_from(pfxs, curp)
+            pfx = (hi << 16) | (lo << 8)
+        elif n == 2:
+            pfx = USHORT_S.unpack_from(pfxs, curp)[0] << 16
+        elif n == 1:
+            pfx = UBYTE_S.unpack_from(pfxs, curp)[0] << 24
+        else:
+            pfx = 0
+
+        words.append(pfx & PFX_MASKS[plen])
+        plens.append(plen)
+        curp = curp + PFX_OCTETS[plen]
+
+    return rv
+
+def decodePfx6Ids(pfxs, curp, endp, rv):
+
+    # decodePfxIds() for IPv6, into rv
+
+    words = rv.words
+    plens = rv.plens
+    while curp < endp:
+
+        (plen, ) = UBYTE_S.unpack_from(pfxs, curp)
+        curp = curp + 1
+        n    = min(PFX_OCTETS[plen], endp - curp, 16)
+
+        if n == 16:
+            w = PFX6_S.unpack_from(pfxs, curp)
+        else:
+            w = PFX6_S.unpack(pfxs[curp:curp+n] + "\0"*(16-n))
+
+        m = PFX6_MASKS[plen]
+        words.extend((w[0] & m[0], w[1] & m[1], w[2] & m[2], w[3] & m[3]))
+        plens.append(plen)
+        curp = curp + PFX_OCTETS[plen]
+
+    return rv
+
+def updatePfxIds(msg, bounds, afi=1):
+
+    # (withdrawn, announced) prefixes of an UPDATE of the given address
+    # family, as PfxIds: from the UPDATE's own fields for IPv4, and from
+    # any MP_UNREACH_NLRI and MP_REACH_NLRI for that family.  bounds are the
+    # UPDATE's offsets in msg, as updateBounds().  Only the MP_* attributes
+    # are looked at, and none are decoded; as the UPDATE's own fields are
+    # what's wanted, a broken attribute ends the search rather than raising
+
+    (up, ap, np, endp) = bounds
+    if afi == AFI_TYPES["IP"]:
+        wrv = decodePfxIds(msg, up, ap-2)
+        nrv = decodePfxIds(msg, np, endp)
+    else:
+        wrv = PfxIds(afi)
+        nrv = PfxIds(afi)
+
+    # (no MP_* type code octet anywhere, no MP_* attribute)
+    octets = msg[ap:np]
+    if "\x0e" not in octets and "\x0f" not in octets:
+        return (wrv, nrv)
+
+    curp = ap
+    try:
+        while curp < np:
+            aflags, atype, alen = ATTR_HDR_S.unpack_from(msg, curp)
+            if aflags & (1<<4):
+                (alen, ) = USHORT_S.unpack_from(msg, curp+2)
+                curp = curp + 4
+            else:
+                curp = curp + 3
+            vendp = min(curp + alen, np)
+
+            if atype == MP_REACH_NLRI:
+                mp_afi, mp_safi, nhlen = MP_REACH_S.unpack_from(msg, curp)
+                if mp_afi == afi:
+                    nrv.extend(decodePfxIds(msg, mpNlriOffset(msg, curp),
+                                            vendp, afi))
+
+            elif atype == MP_UNREACH_NLRI:
+                mp_afi, mp_safi = MP_UNREACH_S.unpack_from(msg, curp)
+                if mp_afi == afi:
+                    wrv.extend(decodePfxIds(msg, curp + MP_UNREACH_S.size,
+                                            vendp, afi))
+
+            curp = curp + alen
+
+    except (struct.error):
+        pass
+
+    return (wrv, nrv)
+
+def walkAttrs(attrs, curp, endp):
+
+    # generate (flags, type, header offset, value offset, length) for each
+    # attribute in attrs[curp:endp], without decoding anything; for
+    # printing, which wants the layout as well as the values
+
+    while curp < endp:
+        aflags, atype, alen = ATTR_HDR_S.unpack_from(attrs, curp)
+        if aflags & (1<<4):
+            (alen, ) = USHORT_S.unpack_from(attrs, curp+2)
+            valp = curp + 4
+        else:
+            valp = curp + 3
+
+        yield (aflags, atype, curp, valp, alen)
+        curp = valp + alen
+
+ATTR_MEMO = Lru(ATTR_MEMO_SZ)
+
+# decodeAttrs() projections: just the prefixes, or just what's needed to
+# follow paths and origins
+
+NLRI_ONLY  = frozenset()
+PATHS_ONLY = frozenset([ PATH_ATTRIBUTES["AS_PATH"],
+                         PATH_ATTRIBUTES["NEXT_HOP"] ])
+
+def decodeAttrs(attrs, curp=0, endp=None, wanted=None):
+
+    # "BGP4: Inter-domain routing in the Internet" John W. Stewart III,
+    # pp.37--40.  (T,L,V) encoded.  TYPE is 2 octets, split into FLAGS and
+    # TYPECODE.  LENGTH is 1 or 2 octets based on EXTENDED-LENGTH field in FLAGS
+    # and is in octets (bottom p.39).  VALUE is parsed as given by TYPE-CODE,
+    # cf. section 2.4.  Decodes attrs[curp:endp].
+    #
+    # Many prefixes share one set of attributes, so a table dump or a run of
+    # UPDATEs carries the same attribute octets over and over.  Each distinct
+    # set is decoded once, and the result shared, via ATTR_MEMO; a memo of
+    # size 0 turns this off.
+    #
+    # If wanted is given, only attributes whose type codes are in it are
+    # decoded; the rest are skipped by their lengths, and are absent from
+    # the result.  NLRI_ONLY skips them all without looking.
+
+    if endp is None:
+        endp = len(attrs)
+
+    if wanted is not None:
+        if not wanted:
+            return PathAttrs()
+        if wanted.__class__ is not frozenset:
+            wanted = frozenset(wanted)
+
+    memo = ATTR_MEMO
+    if memo.size <= 0:
+        return _decodeAttrs(attrs, curp, endp, wanted, PathAttr, PathAttrs)
+
+    octets = attrs[curp:endp]
+    if wanted is None:
+        key = octets
+    else:
+        key = (octets, wanted)
+    rv = memo.get(key)
+    if rv is None:
+        rv = memo.put(key, _decodeAttrs(octets, 0, len(octets), wanted,
+                                        SharedPathAttr, SharedPathAttrs))
+    return rv
+
+def _decodeAttrs(attrs, curp, endp, wanted, attr_cls, attrs_cls):
+
+    # values are decoded in place, and only copied out where they're kept as
+    # strings; this is decodeBgpAttr() inline, as it's the innermost loop
+
+    rv = []
+    while curp < endp:
+
+        aflags, atype, alen = ATTR_HDR_S.unpack_from(attrs, curp)
+        if aflags & (1<<4):
+            if curp + 4 > endp:
+                raise struct.error, "truncated path attribute header"
+            (alen, ) = USHORT_S.unpack_from(attrs, curp+2)
+            curp = curp + 4
+        else:
+            if curp + 3 > endp:
+                raise struct.error, "truncated path attribute header"
+            curp = curp + 3
+
+        if wanted is not None and atype not in wanted:
+            curp = curp + alen
+            continue
+
+        pa_trv  = attr_cls(atype, alen, None)
+        decoder = ATTR_DECODERS.get(atype)
+        if alen and decoder:
+            if curp + alen <= endp:
+                pa_trv.V = decoder(alen, attrs, curp)
+            elif curp < endp:
+                # truncated: the decoder gets only what there is
+                pa_trv.V = decoder(alen, attrs[curp:endp], 0)
+
+        pa_trv.FLAGS = attrFlags(aflags)
+        rv.append(atype)
+        rv.append(pa_trv)
+
+        curp = curp + alen
+
+    return attrs_cls(rv)
+
+#-------------------------------------------------------------------------------
+
+def prtUpdate(msg_len, msg, rv, verbose=1, level=0):
+
+    # print an UPDATE already decoded by parseUpdate(); the raw message is
+    # only walked for layout (lengths, attribute order, binary dumps) -- the
+    # values all come from rv
+
+    (unfeasible_len, ) = USHORT_S.unpack_from(msg, 0)
+    unfeasible_pfxs = "\n"
+    if verbose > 1:
+        unfeasible_pfxs = unfeasible_pfxs +\
+                          prtbin((level+1)*INDENT, msg[0:2+unfeasible_len])
+    unfeasible_pfxs = unfeasible_pfxs +\
+                      "\n" + (level+1)*INDENT + "UNFEASIBLE ROUTES:\n"
+
+    rn = 0
+    for (pfx, plen) in rv["V"]["UNFEASIBLE"]:
+        rn = rn + 1
+        unfeasible_pfxs = unfeasible_pfxs + (level+2)*INDENT +\
+                          "%d: %s\n" % (rn, pfx2str(pfx, plen))
+
+    curp = 2 + unfeasible_len
+    (path_attr_len, ) = USHORT_S.unpack_from(msg, curp)
+    path_attrs = ""
+    if verbose > 1:
+        path_attrs = path_attrs +\
+                     prtbin((level+1)*INDENT, msg[curp:curp+2+path_attr_len])
+    path_attrs = path_attrs + "\n" + (level+1)*INDENT + "PATH ATTRIBUTES:\n"
+
+    curp = curp + 2
+    endp = curp + path_attr_len
+    for (aflags, atype, hdrp, valp, alen) in walkAttrs(msg, curp, endp):
+        if atype in rv["V"]["PATH_ATTRS"]:
+            path_attrs = path_attrs +\
+                         fmtBgpAttr(rv["V"]["PATH_ATTRS"][atype], level+2) +\
+                         fmtAttrFlags(aflags) + "\n"
+        curp = valp + alen
+
+    nlri_pfxs = (level+1)*INDENT + "FEASIBLE ROUTES:\n"
+    rn   = 0
+    for (pfx, plen) in rv["V"]["FEASIBLE"]:
+        rn = rn + 1
+        plen_octets = (plen+7)/8
+
+        if verbose > 1:
+            nlri_pfxs = nlri_pfxs + prtbin((level+2)*INDENT,
+                                           msg[curp:curp+1+plen_octets]) + "\n"
+
+        nlri_pfxs = nlri_pfxs +\
+                    (level+2)*INDENT + "%d: %s %s\n" %\
+                    (rn, pfx2str(pfx, plen),
+                     (len(pfx) != plen_octets)*
+                     '[ *** bogus NLRI field: plen_octets did not match *** ]')
+
+        curp = curp + 1 + plen_octets
+
+    print level*INDENT +\
+          "Update (len=%d): unfeasible_len=%d path_attr_len=%d%s%s%s" %\
+          (msg_len+BGP_HDR_LEN, unfeasible_len, path_attr_len,
+           unfeasible_pfxs, path_attrs, nlri_pfxs)
+
+#-------------------------------------------------------------------------------
+
+def parseBgpAttr(atype, alen, adata, verbose=1, level=0):
+
+    rv = decodeBgpAttr(atype, alen, adata)
+    if verbose > 0:
+        return (fmtBgpAttr(rv, level), rv)
+    return ("", rv)
+
+#-------------------------------------------------------------------------------
+
+def decodeBgpAttr(atype, alen, adata, off=0):
+
+    # the attribute's value is the alen octets of adata from off
+
+    rv = PathAttr(atype, alen, None)
+
+    # ATOMIC_AGGREGATOR hit by null check...
+    if alen == 0 or off >= len(adata):
+        return rv
+
+    decoder = ATTR_DECODERS.get(atype)
+    if decoder:
+        rv.V = decoder(alen, adata, off)
+
+    return rv
+
+#-------------------------------------------------------------------------------
+
+def fmtBgpAttr(rv, level=0):
+
+    atype = rv["T"]
+
+    if rv["L"] == 0:
+        return level*INDENT + "%s: null" % PATH_ATTRIBUTES.get(atype, atype)
+
+    formatter = ATTR_FORMATTERS.get(atype)
+    if formatter:
+        return formatter(rv["V"], level)
+
+    elif atype in PATH_ATTRIBUTES:
+        return level*INDENT + "[ *** %s *** ]" % PATH_ATTRIBUTES[atype]
+
+    return level*INDENT + "[ *** UNKNOWN BGP path attribute: %d *** ]" % atype
+
+#-------------------------------------------------------------------------------
+
+def decodeAsPath(alen, adata, off):
+
+    # walk the segments by offset, rather than re-slicing what's left after
+    # each
+
+    segs = []
+    curp = off
+    endp = min(off + alen, len(adata))
+    while curp < endp:
+        if curp + 2 > endp:
+            raise struct.error, "truncated AS_PATH segment"
+        asp_t, asp_l = TLV_HDR_S.unpack_from(adata, curp)
+        seg   = Rv()
+        seg.T = asp_t
+        seg.L = asp_l
+        seg.V = []
+
+        nxtp = curp + 2 + 2*asp_l
+        if curp + 2 < endp and asp_t in AS_PATH_SEG_TYPES:
+            if nxtp > endp:
+                raise struct.error, "truncated AS_PATH segment"
+            seg.V = list(nStruct(ASNS_S, "H", asp_l).unpack_from(adata,
+                                                                  curp+2))
+
+        segs.append(seg)
+        curp = nxtp
+
+    return segs
+
+def fmtAsPath(segs, level):
+
+    ret = level*INDENT + "AS_PATH: "
+    for seg in segs:
+        if not seg["V"]:
+            continue
+
+        if seg["T"] in (AS_PATH_SEG_TYPES["SET"],
+                        AS_PATH_SEG_TYPES["CONFED_SET"]):
+            ret = ret + '(%s){ ' % AS_PATH_SEG_TYPES[seg["T"]]
+            for asn in seg["V"]:
+                ret = ret + "%d, " % asn
+            ret = ret + '}'
+
+        else:
+            ret = ret + '(%s)[ ' % AS_PATH_SEG_TYPES[seg["T"]]
+            for asn in seg["V"]:
+                ret = ret + "<- %d " % asn
+            ret = ret + ']'
+
+    return ret
+
+def decodeCommunity(alen, adata, off):
+
+    endp = min(off + alen, len(adata))
+    return [ adata[i:min(i+4, endp)] for i in range(off, off + 4*(alen/4), 4) ]
+
+def fmtCommunity(comms, level):
+
+    ret = ""
+    for i in range(len(comms)):
+        x,y = COMMUNITY_S.unpack(comms[i])
+        ret = ret + level*INDENT + "COMMUNITY %d: %d:%d\n" % (i+1, x, y)
+
+    return ret[:-1]
+
+def decodeClusterList(alen, adata, off):
+
+    # These are 'defined' in RFC 1966 (route reflectors).  Or so they should
+    # be.  In fact, the RFC talks complete bollocks re. CLUSTER_LIST -- it
+    # defines nothing and appears to be just plain wrong.  However, as usual,
+    # there is magic: from Cisco, we see
+    # http://www.cisco.com/networkers/nw99_pres/309.pdf, which says
+    # CLUSTER_LIST is "...just a list of ORIGINATOR_IDs...".  So there we go.
+    # I have _no idea_ what the encoding of the originator ids is here -- I
+    # assume the standard ">L" for convenience.
+
+    n = alen/4
+    if off + 4*n > len(adata):
+        raise struct.error, "truncated CLUSTER_LIST"
+    return list(nStruct(IDS_S, "L", n).unpack_from(adata, off))
+
+def fmtClusterList(ids, level):
+
+    ret = level*INDENT + "CLUSTER_LIST"
+    for id in ids:
+        ret = ret + ": %s" % id2str(id)
+
+    return ret
 
-            level = level + 1
-            cap_code, cap_len = struct.unpack("BB", opts[0:2])
+MP_REACH_NLRI   = PATH_ATTRIBUTES["MP_REACH_NLRI"]
+MP_UNREACH_NLRI = PATH_ATTRIBUTES["MP_UNREACH_NLRI"]
 
-            trv["V"] = { "T": cap_code,
-                         "L": cap_len,
-                         "V": {}
-                         }
+def mpNlriOffset(adata, off):
 
-            if verbose > 0:
-                if verbose > 1:
-                    print prtbin(level*INDENT, opts[0:2+cap_len])
-                print level*INDENT +\
-                      "capability:", CAP_CODES[cap_code], "len=" + `cap_len`
+    # RFC 2858: the NLRI of an MP_REACH_NLRI at off follow AFI, SAFI, next
+    # hop length, next hop, and the SNPAs (each a length in semi-octets and
+    # the SNPA) -- the SNPA count is a reserved 0 octet since RFC 4760
 
-                if verbose > 1:
-                    print prtbin(level*INDENT, opts[2:2+cap_len])
+    afi, safi, nhlen = MP_REACH_S.unpack_from(adata, off)
+    curp = off + MP_REACH_S.size + nhlen
+    (nsnpas, ) = UBYTE_S.unpack_from(adata, curp)
+    curp = curp + 1
+    for i in range(nsnpas):
+        (snpalen, ) = UBYTE_S.unpack_from(adata, curp)
+        curp = curp + 1 + (snpalen+1)/2
 
-                if cap_code == CAP_CODES["MULTIPROTOCOL_EXT"]:
-                    afi, safi = struct.unpack(">HH", opts[2:2+cap_len])
-                    if verbose > 0:
-                        print level*INDENT +\
-                              "afi:", AFI_TYPES[afi], "safi:", SAFI_TYPES[safi]
+    return curp
 
-                    trv["V"]["V"] = { "AFI": afi, "SAFI": safi }
+def decodeMpReach(alen, adata, off):
 
-                elif cap_code == CAP_CODES["GRACEFUL_RESTART"]:
-                    rinfo, afi, safi, af_flags = struct.unpack(">HHBB",
-                                                          opts[2:2+cap_len])
-                    flg_preserve_fwd_st = (af_flags & (1<<7)) >> 7
-                    if verbose > 0:
-                        print level*INDENT +\
-                              "restart flags:", (rinfo >> 12), \
-                              "restart time:", (rinfo & 0xFFF), \
-                              "afi:", AFI_TYPES[afi], "safi:", SAFI_TYPES[safi]
-                        print level*INDENT +\
-                              "address family flags: [ %s ]" % \
-                              ("forwarding state preserved"*flg_preserve_fwd_st)
+    endp = min(off + alen, len(adata))
+    afi, safi, nhlen = MP_REACH_S.unpack_from(adata, off)
+    nlrip = mpNlriOffset(adata, off)
+    if nlrip > endp:
+        raise struct.error, "truncated MP_REACH_NLRI"
 
-                    trv["V"]["V"] = { "AFI": afi, "SAFI": safi,
-                                      "RESTART_FLAGS": rinfo >> 12,
-                                      "RESTART_TIME":  rinfo & 0xfff,
-                                      "PRESERVED": flg_preserve_fwd_st,
-                                      }
+    nhp = off + MP_REACH_S.size
+    return MpNlri(AFI=afi, SAFI=safi, NEXT_HOP=adata[nhp:nhp+nhlen],
+                  NLRI=decodePfxs(adata, nlrip, endp))
 
+def decodeMpUnreach(alen, adata, off):
 
-                elif cap_code == CAP_CODES["ROUTE_REFRESH"]:
-                    pass
+    endp = min(off + alen, len(adata))
+    afi, safi = MP_UNREACH_S.unpack_from(adata, off)
+    if off + MP_UNREACH_S.size > endp:
+        raise struct.error, "truncated MP_UNREACH_NLRI"
 
-                elif cap_code == CAP_CODES["ROUTE_REFRESH_Z"]:
-                    pass
+    return MpNlri(AFI=afi, SAFI=safi,
+                  NLRI=decodePfxs(adata, off + MP_UNREACH_S.size, endp))
 
-                else:
-                    print level*INDENT +\
-                          "[ *** UNKNOWN CAPABILITY CODE: %d *** ]" % cap_code
-            level = level - 1
+def fmtMpNlri(name, mp, level):
 
+    if mp["AFI"] == AFI_TYPES["IP"]:
+        fmtPfx = pfx2str
+    elif mp["AFI"] == AFI_TYPES["IP6"]:
+        fmtPfx = pfx2str6
+    else:
+        fmtPfx = lambda pfx, plen: "%s/%d" % (str2hex(pfx), plen)
+
+    ret = level*INDENT + "%s: afi: %s, safi: %s" %\
+          (name, AFI_TYPES.get(mp["AFI"], mp["AFI"]),
+           SAFI_TYPES.get(mp["SAFI"], mp["SAFI"]))
+
+    if mp.has_key("NEXT_HOP"):
+        nh = mp["NEXT_HOP"]
+        if mp["AFI"] == AFI_TYPES["IP"] and len(nh) == 4:
+            nh = id2str(ULONG_S.unpack(nh)[0])
+        elif mp["AFI"] == AFI_TYPES["IP6"] and len(nh) in (16, 32):
+            # global, and maybe link-local, address
+            nh = string.join([ id2str6(words2id6(PFX6_S.unpack(nh[i:i+16])))
+                               for i in range(0, len(nh), 16) ], ", ")
         else:
-            if verbose > 0:
-                print level*INDENT +\
-                      "[ *** UNKNOWN OPTIONAL PARAMETER: %d *** ]" % opt_type
+            nh = str2hex(nh)
+        ret = ret + ", next hop: %s" % nh
 
-        rv.append(trv)
-        opts = opts[opt_len:]
+    rn = 0
+    for (pfx, plen) in mp["NLRI"]:
+        rn  = rn + 1
+        ret = ret + "\n" + (level+1)*INDENT + "%d: %s" % (rn, fmtPfx(pfx, plen))
 
-    return rv
+    return ret
 
 #-------------------------------------------------------------------------------
 
-def parseUpdate(msg_len, msg, verbose=1, level=0):
+# Path attribute handlers, keyed by type code.  A decoder takes (alen, adata,
+# off), the value being the alen octets of adata from off, and returns the
+# attribute value, "V"; a formatter takes (value, level) and returns the
+# display string.  Attributes without a decoder get a null value; those
+# without a formatter are noted, but not displayed.
 
-    rv = {"T": MSG_TYPES["UPDATE"],
-          "L": msg_len,
-          "V": { "UNFEASIBLE": [], "PATH_ATTRS": {}, "FEASIBLE": [] }
-          }
+ATTR_DECODERS   = {}
+ATTR_FORMATTERS = {}
 
-    curp = 0
+def registerAttr(atype, decoder, formatter=None):
 
-    # "BGP4: Inter-domain routing in the Internet" John W. Stewart III.
-    # Unfeasible (withdrawn) routes are a sequence of (len, pfx) pairs, where
-    # len is the length of the prefix in _bits_, and pfx is the prefix, padded
-    # to a whole number of octets.  All such padding must be ignored.
+    ATTR_DECODERS[atype] = decoder
+    if formatter:
+        ATTR_FORMATTERS[atype] = formatter
+    ATTR_MEMO.clear()
 
-    (unfeasible_len, ) = struct.unpack(">H", msg[curp:curp+2])
-    unfeasible_pfxs = "\n"
-    if verbose > 1:
-        unfeasible_pfxs = unfeasible_pfxs +\
-                          prtbin((level+1)*INDENT, msg[0:2+unfeasible_len])
-    unfeasible_pfxs = unfeasible_pfxs +\
-                      "\n" + (level+1)*INDENT + "UNFEASIBLE ROUTES:\n"
+def fixedAttr(s, single=1):
 
-    curp = curp + 2
-    endp = curp + unfeasible_len
+    # a decoder for an attribute that's a single struct s, which it must
+    # fill exactly
 
-    rn   = 0
-    while curp != endp:
+    def decoder(alen, adata, off):
+        if min(alen, len(adata) - off) != s.size:
+            raise struct.error, "attribute length %d, expected %d" %\
+                  (alen, s.size)
+        if single:
+            return s.unpack_from(adata, off)[0]
+        return s.unpack_from(adata, off)
 
-        rn = rn + 1
+    return decoder
 
-        (plen, )    = struct.unpack("B", msg[curp])
-        plen_octets = int(math.ceil(plen/8.0))
-        curp = curp + 1
+registerAttr(PATH_ATTRIBUTES["ORIGIN"], fixedAttr(UBYTE_S),
+             lambda v, level: level*INDENT + "ORIGIN: %s" % NLRI_SRC[v])
 
-        (pfx,) = struct.unpack("%ds" % plen_octets, msg[curp:curp+plen_octets])
-        unfeasible_pfxs = unfeasible_pfxs + (level+2)*INDENT +\
-                           "%d: %s\n" % (rn, pfx2str(pfx, plen))
+registerAttr(PATH_ATTRIBUTES["AS_PATH"], decodeAsPath, fmtAsPath)
 
-        rv["V"]["UNFEASIBLE"].append((pfx,plen))
-        curp = curp + plen_octets
+registerAttr(PATH_ATTRIBUTES["NEXT_HOP"], fixedAttr(ULONG_S),
+             lambda v, level: level*INDENT + "NEXT_HOP: " + id2str(v))
 
-    # "BGP4: Inter-domain routing in the Internet" John W. Stewart III,
-    # pp.37--40.  (T,L,V) encoded.  TYPE is 2 octets, split into FLAGS and
-    # TYPECODE.  LENGTH is 1 or 2 octets based on EXTENDED-LENGTH field in FLAGS
-    # and is in octets (bottom p.39).  VALUE is parsed as given by TYPE-CODE,
-    # cf. section 2.4
+registerAttr(PATH_ATTRIBUTES["MULTI_EXIT_DISCRIMINATOR"], fixedAttr(ULONG_S),
+             lambda v, level: level*INDENT + "MED: " + `v`)
 
-    (path_attr_len, ) = struct.unpack(">H", msg[curp:curp+2])
-    path_attrs = ""
-    if verbose > 1:
-        path_attrs = path_attrs +\
-                     prtbin((level+1)*INDENT, msg[curp:curp+2+path_attr_len])
-    path_attrs = path_attrs + "\n" + (level+1)*INDENT + "PATH ATTRIBUTES:\n"
+registerAttr(PATH_ATTRIBUTES["LOC_PREF"], fixedAttr(ULONG_S),
+             lambda v, level: level*INDENT + "LOC_PREF: " + `v`)
 
-    curp = curp + 2
-    endp = curp + path_attr_len
+registerAttr(PATH_ATTRIBUTES["AGGREGATOR"], fixedAttr(AGGREGATOR_S, 0),
+             lambda v, level: level*INDENT +
+                 "AGGREGATOR: formed by AS %d, router %s" % (v[0], id2str(v[1])))
 
-    rn   = 0
-    while curp != endp:
+registerAttr(PATH_ATTRIBUTES["COMMUNITY"], decodeCommunity, fmtCommunity)
 
-        rn = rn + 1
+registerAttr(PATH_ATTRIBUTES["ORIGINATOR_ID"], fixedAttr(ULONG_S),
+             lambda v, level: level*INDENT + "ORIGINATOR_ID: %s" % id2str(v))
 
-        aflags, atype = struct.unpack("BB", msg[curp:curp+2])
-        curp = curp + 2
+registerAttr(PATH_ATTRIBUTES["CLUSTER_LIST"], decodeClusterList, fmtClusterList)
 
-        flg_optional   = (aflags & (1<<7)) >> 7
-        flg_transitive = (aflags & (1<<6)) >> 6
-        flg_partial    = (aflags & (1<<5)) >> 5
-        flg_extlen     = (aflags & (1<<4)) >> 4
+registerAttr(MP_REACH_NLRI, decodeMpReach,
+             lambda v, level: fmtMpNlri("MP_REACH_NLRI", v, level))
 
-        # XXX this is a bit grim, but it seems that there's no way to
-        # do this more nicely :-(
+registerAttr(MP_UNREACH_NLRI, decodeMpUnreach,
+             lambda v, level: fmtMpNlri("MP_UNREACH_NLRI", v, level))
 
-        if flg_extlen+1 == 1:
-            (alen, ) = struct.unpack("B", msg[curp:curp+flg_extlen+1])
-        elif flg_extlen+1 == 2:
-            (alen, ) = struct.unpack(">H", msg[curp:curp+flg_extlen+1])
-        else:
-            error('flg_extlen was neither 0 nor 1 :-(')
-            sys.exit(1)
+#-------------------------------------------------------------------------------
 
-        curp  = curp + flg_extlen+1
-        adata = msg[curp:curp+alen]
+# Encoders: the decoders' inverses, for speakers with something to say (see
+# bgp-load.py).  AS_PATHs are sequences of (segment type, (asn, ...)), as
+# interned below; prefixes are (id, plen) pairs; COMMUNITYs are 32 bit
+# integers, (AS << 16) | value.
 
-        (pa_str, pa_trv) = parseBgpAttr(atype, alen, adata, verbose, level+2)
-        path_attrs = path_attrs + pa_str
+ATTR_WELL_KNOWN = 0x40 # transitive
+ATTR_OPTIONAL   = 0x80
+ATTR_OPT_TRANS  = 0xc0
+ATTR_EXT_LEN    = 0x10
 
-        flgs_str = "%s %s %s %s" %\
-                   ("optional"*flg_optional, "transitive"*flg_transitive,
-                    "partial"*flg_partial,   "extended length"*flg_extlen)
-        flgs_str = string.strip(flgs_str)
-        flgs_str = " [ %s ]\n" % flgs_str
-        path_attrs = path_attrs + flgs_str
-        pa_trv["FLAGS"] = {"optional":   flg_optional,
-                           "transitive": flg_transitive,
-                           "partial":    flg_partial,
-                           "extlen":     flg_extlen,
-                           }
-        rv["V"]["PATH_ATTRS"][ pa_trv["T"] ] = pa_trv
+EXT_ATTR_HDR_S  = struct.Struct(">BBH")
 
-        curp = curp + alen
+def packMsg(msg_type, msg):
 
-    # NLRI information: the prefixes to which path attributes apply
-    # <len(bits),pfx>*
+    return BGP_MARKER + PDU_HDR_S.pack(len(msg)+BGP_HDR_LEN, msg_type) + msg
 
-    nlri_pfxs = (level+1)*INDENT + "FEASIBLE ROUTES:\n"
-    endp = curp + len(msg[curp:])
-    rn   = 0
+def packAttr(atype, adata, aflags=ATTR_WELL_KNOWN):
 
-    while curp < endp:
+    if len(adata) > 255:
+        return EXT_ATTR_HDR_S.pack(aflags | ATTR_EXT_LEN, atype,
+                                   len(adata)) + adata
+    return ATTR_HDR_S.pack(aflags, atype, len(adata)) + adata
 
-        rn = rn + 1
+def packAsPath(segs):
 
-        (plen, )    = struct.unpack("B", msg[curp])
-        plen_octets = int(math.ceil(plen/8.0))
-        curp = curp + 1
+    return string.join([ TLV_HDR_S.pack(seg_t, len(asns)) +
+                         nStruct(ASNS_S, "H", len(asns)).pack(*asns)
+                         for (seg_t, asns) in segs ], "")
 
-        if verbose > 1:
-            nlri_pfxs = nlri_pfxs + prtbin((level+2)*INDENT,
-                                           msg[curp-1:curp+plen_octets]) + "\n"
+def packPfxs(pfxs):
 
-        (pfx,) = struct.unpack("%ds" % len(msg[curp:curp+plen_octets]),
-                               msg[curp:curp+plen_octets])
+    return string.join([ chr(plen) + ULONG_S.pack(pfx)[:PFX_OCTETS[plen]]
+                         for (pfx, plen) in pfxs ], "")
 
-        nlri_pfxs = nlri_pfxs +\
-                    (level+2)*INDENT + "%d: %s %s\n" %\
-                    (rn, pfx2str(pfx, plen),
-                     (len(msg[curp:curp+plen_octets]) != plen_octets)*
-                     '[ *** bogus NLRI field: plen_octets did not match *** ]')
+def packAttrs(origin, segs, next_hop, med=None, comms=()):
 
-        rv["V"]["FEASIBLE"].append((pfx,plen))
-        curp = curp + plen_octets
+    # the usual path attributes, in type code order
 
-    if verbose > 0:
-        print level*INDENT +\
-              "Update (len=%d): unfeasible_len=%d path_attr_len=%d%s%s%s" %\
-              (msg_len+BGP_HDR_LEN, unfeasible_len, path_attr_len,
-               unfeasible_pfxs, path_attrs, nlri_pfxs)
+    attrs = (packAttr(PATH_ATTRIBUTES["ORIGIN"], UBYTE_S.pack(origin)) +
+             packAttr(PATH_ATTRIBUTES["AS_PATH"], packAsPath(segs)) +
+             packAttr(PATH_ATTRIBUTES["NEXT_HOP"], ULONG_S.pack(next_hop)))
+    if med is not None:
+        attrs = attrs + packAttr(PATH_ATTRIBUTES["MULTI_EXIT_DISCRIMINATOR"],
+                                 ULONG_S.pack(med), ATTR_OPTIONAL)
+    if comms:
+        attrs = attrs + packAttr(PATH_ATTRIBUTES["COMMUNITY"],
+                                 string.join(map(ULONG_S.pack, comms), ""),
+                                 ATTR_OPT_TRANS)
+    return attrs
 
-    return rv
+def packUpdate(withdrawn="", attrs="", nlri=""):
+
+    # withdrawn and nlri already packed by packPfxs(), attrs by packAttr()s
+
+    return (USHORT_S.pack(len(withdrawn)) + withdrawn +
+            USHORT_S.pack(len(attrs)) + attrs + nlri)
 
 #-------------------------------------------------------------------------------
 
-def parseBgpAttr(atype, alen, adata, verbose=1, level=0):
+# Interned AS_PATHs and COMMUNITYs, for analysis over whole tables.  Each
+# distinct AS_PATH is held once, as a tuple of (segment type, (asn, ...))
+# pairs, and numbered in order of first sight, so paths can be kept and
+# compared as small integers; each distinct COMMUNITY is held once, as an
+# array of 32 bit integers, (AS << 16) | value.  Neither is ever released.
 
-    rv = {"T": atype,
-          "L": alen,
-          "V": None
-          }
-
-    if len(adata) == 0:
-        ret = level*INDENT + PATH_ATTRIBUTES[atype] + ": null"
-        return (ret, rv)
-
-    if atype in PATH_ATTRIBUTES.keys():
-
-        if atype == PATH_ATTRIBUTES["ORIGIN"]:
-            (nlri_src, ) = struct.unpack("B", adata)
-
-            ret = level*INDENT + "ORIGIN: %s" % NLRI_SRC[nlri_src]
-            rv["V"] = nlri_src
-
-        elif atype == PATH_ATTRIBUTES["AS_PATH"]:
-
-            ret     = level*INDENT + "AS_PATH: "
-            rv["V"] = []
-
-            while adata:
-                asp_t, asp_l = struct.unpack("BB", adata[0:2])
-                rv_cpt = { "T": asp_t, "L": asp_l, "V": [] }
-
-                asp_v = adata[2:2+2*asp_l]
-                if asp_v:
-                    path = struct.unpack(">%dH" % asp_l, asp_v)
-                    if(asp_t == AS_PATH_SEG_TYPES["SET"] or
-                       asp_t == AS_PATH_SEG_TYPES["CONFED_SET"]):
-
-                        ret = ret + '(%s){ ' % AS_PATH_SEG_TYPES[asp_t]
-                        for asn in path:
-                            ret = ret + "%d, " % asn
-                            rv_cpt["V"].append(asn)
-                        ret = ret + '}'
-
-                    elif(asp_t == AS_PATH_SEG_TYPES["SEQUENCE"] or
-                         asp_t == AS_PATH_SEG_TYPES["CONFED_SEQUENCE"]):
-
-                        ret = ret + '(%s)[ ' % AS_PATH_SEG_TYPES[asp_t]
-                        for asn in path:
-                            ret = ret + "<- %d " % asn
-                            rv_cpt["V"].append(asn)
-                        ret = ret + ']'
-
-                rv["V"].append(rv_cpt)
-                adata = adata[2+(asp_l*2):]
-
-        elif atype == PATH_ATTRIBUTES["NEXT_HOP"]:
-            (nh, ) = struct.unpack(">L", adata)
-            ret    = level*INDENT + "NEXT_HOP: " + id2str(nh)
-            rv["V"] = nh
-
-        elif atype == PATH_ATTRIBUTES["MULTI_EXIT_DISCRIMINATOR"]:
-            (med, ) = struct.unpack(">L", adata)
-            ret     = level*INDENT + "MED: " + `med`
-            rv["V"] = med
-
-        elif atype == PATH_ATTRIBUTES["LOC_PREF"]:
-            (lp, ) = struct.unpack(">L", adata)
-            ret    = level*INDENT + "LOC_PREF: " + `lp`
-            rv["V"] = lp
-
-        # ATOMIC_AGGREGATOR hit by null check at start...
-        elif atype == PATH_ATTRIBUTES["AGGREGATOR"]:
-            (asn, ip) = struct.unpack(">H L", adata)
-            ret = level*INDENT +\
-                  "AGGREGATOR: formed by AS %d, router %s" % (asn, id2str(ip))
-            rv["V"] = (asn, ip)
-
-        elif atype == PATH_ATTRIBUTES["COMMUNITY"]:
-
-            ret = ""
-            rv["V"] = []
-            for i in range(alen/4):
-                x,y = struct.unpack(">HH", adata[i*4:(i+1)*4])
-                ret = ret + level*INDENT + "COMMUNITY %d: %d:%d\n" % (i+1, x, y)
-                rv["V"].append(adata[i*4:(i+1)*4])
-            ret = ret[:-1]
-
-        elif atype == PATH_ATTRIBUTES["ORIGINATOR_ID"]:
-
-            (id,) = struct.unpack(">L", adata)
-            ret = level*INDENT + "ORIGINATOR_ID: %s" % id2str(id)
-            rv["V"] = id
-
-        elif atype == PATH_ATTRIBUTES["CLUSTER_LIST"]:
-
-            # These are 'defined' in RFC 1966 (route reflectors).  Or so they
-            # should be.  In fact, the RFC talks complete bollocks
-            # re. CLUSTER_LIST -- it defines nothing and appears to be just
-            # plain wrong.  However, as usual, there is magic: from Cisco, we
-            # see http://www.cisco.com/networkers/nw99_pres/309.pdf, which says
-            # CLUSTER_LIST is "...just a list of ORIGINATOR_IDs...".  So there
-            # we go.  I have _no idea_ what the encoding of the originator ids
-            # is here -- I assume the standard ">L" for convenience.
-
-            ret = level*INDENT + "CLUSTER_LIST"
-            rv["V"] = []
-            for i in range(alen/4):
-                (id,) = struct.unpack(">L", adata[:4])
-                ret = ret + ": %s" % id2str(id)
-                rv["V"].append(id)
+ASPATH_IDS  = {}    # AS_PATH tuple -> id
+ASPATHS     = []    # id -> AS_PATH tuple
+COMMUNITIES = {}    # raw COMMUNITY octets -> array
 
-        else:
-            ret = level*INDENT + "[ *** %s *** ]" % PATH_ATTRIBUTES[atype]
+def asPathId(segs):
 
-    else:
-        ret = level*INDENT +\
-              "[ *** UNKNOWN BGP path attribute: %d *** ]" % atype
+    # the id of a decoded AS_PATH value, interning it if new
+
+    key = tuple([ (seg["T"], tuple(seg["V"])) for seg in segs or () ])
+    try:
+        return ASPATH_IDS[key]
+    except KeyError:
+        pid = ASPATH_IDS[key] = len(ASPATHS)
+        ASPATHS.append(key)
+        return pid
+
+def asPath(pid):
+
+    return ASPATHS[pid]
+
+def originAs(pid):
+
+    # the origin AS of an interned AS_PATH: the last AS of its last segment,
+    # if that's a SEQUENCE; 0 if it's a SET, or the path is empty
+
+    path = ASPATHS[pid]
+    if path and path[-1][0] == AS_PATH_SEG_TYPES["SEQUENCE"] and path[-1][1]:
+        return path[-1][1][-1]
+    return 0
+
+def communities(comms):
+
+    # the interned array of a decoded COMMUNITY value; shared, so not to be
+    # modified
+
+    key = string.join([ c for c in comms or () if len(c) == 4 ], "")
+    try:
+        return COMMUNITIES[key]
+    except KeyError:
+        a = array.array(U32_CODE, key)
+        if sys.byteorder == "little":
+            a.byteswap()
+        COMMUNITIES[key] = a
+        return a
 
-    return (ret, rv)
+#-------------------------------------------------------------------------------
+
+ATTR_FLAG_STRS = {}
+
+def fmtAttrFlags(aflags):
+
+    # as for attrFlags(), there are only sixteen of these
+
+    aflags = aflags & 0xf0
+    try:
+        return ATTR_FLAG_STRS[aflags]
+    except KeyError:
+        flgs_str = "%s %s %s %s" %\
+                   ("optional"*((aflags & (1<<7)) >> 7),
+                    "transitive"*((aflags & (1<<6)) >> 6),
+                    "partial"*((aflags & (1<<5)) >> 5),
+                    "extended length"*((aflags & (1<<4)) >> 4))
+        s = ATTR_FLAG_STRS[aflags] = " [ %s ]" % string.strip(flgs_str)
+        return s
 
 #-------------------------------------------------------------------------------
 
 def parseNotify(msg_len, msg, verbose=1, level=0):
 
-    rv = {"T": MSG_TYPES["NOTIFICATION"],
-          "L": msg_len,
-          "V": None
-          }
+    rv = Rv(T=MSG_TYPES["NOTIFICATION"], L=msg_len, V=None)
 
     if verbose > 1:
         print prtbin(level*INDENT, msg[:msg_len])
 
-    code, subcode, data = struct.unpack("BB %ds" % (msg_len-2, ), msg)
+    code, subcode = TLV_HDR_S.unpack(msg[0:2])
     code    = code - 1
     subcode = subcode - 1
 
@@ -613,10 +1465,7 @@ def parseNotify(msg_len, msg, verbose=1, level=0):
 
 def parseKeepalive(msg_len, msg, verbose=1, level=0):
 
-    rv = {"T": MSG_TYPES["KEEPALIVE"],
-          "L": msg_len,
-          "V": None
-          }
+    rv = Rv(T=MSG_TYPES["KEEPALIVE"], L=msg_len, V=None)
 
     if verbose > 1:
         print prtbin(level*INDENT, msg)
@@ -630,10 +1479,7 @@ def parseKeepalive(msg_len, msg, verbose=1, level=0):
 
 def parseRouteRefresh(msg_len, msg, verbose=1, level=0):
 
-    rv = {"T": MSG_TYPES["ROUTE_REFRESH"],
-          "L": msg_len,
-          "V": None
-          }
+    rv = Rv(T=MSG_TYPES["ROUTE_REFRESH"], L=msg_len, V=None)
 
     if verbose > 1:
         print prtbin(level*INDENT, msg)
@@ -645,24 +1491,21 @@ def parseRouteRefresh(msg_len, msg, verbose=1, level=0):
 
 #-------------------------------------------------------------------------------
 
-def parseTableEntry(length, entries, verbose=1, level=0):
+def parseTableEntry(length, entries, verbose=1, level=0, attrs=None):
 
-    rv = {"T": MSG_TYPES["TABLE_DUMP_ENTRY"],
-          "L": 0,
-          "V": {}
-          }
+    # attrs, if given, are the only path attributes decoded; see
+    # decodeAttrs()
 
-    hfmt = ">LBBLLHH"
-    hfmt_l = struct.calcsize(hfmt)
+    rv = Rv(T=MSG_TYPES["TABLE_DUMP_ENTRY"], L=0, V=TableEntry())
 
     pfx, plen, status, uptime, peer_addr, peer_as, elen =\
-         struct.unpack(hfmt, entries[:hfmt_l])
+         TABLE_ENTRY_S.unpack_from(entries, 0)
 
-    rv["V"]["PREFIX"]  = (struct.pack(">L", pfx), plen)
-    rv["V"]["STATUS"]  = status
-    rv["V"]["UPTIME"]  = uptime
-    rv["V"]["PEER_IP"] = peer_addr
-    rv["V"]["PEER_AS"] = peer_as
+    rv.V.PREFIX  = (ULONG_S.pack(pfx), plen)
+    rv.V.STATUS  = status
+    rv.V.UPTIME  = uptime
+    rv.V.PEER_IP = peer_addr
+    rv.V.PEER_AS = peer_as
 
     if verbose:
         print level*INDENT +\
@@ -670,60 +1513,56 @@ def parseTableEntry(length, entries, verbose=1, level=0):
               (id2str(pfx), plen, id2str(peer_addr), peer_as)
         print level*INDENT + "updated: '%s'" % (time.ctime(uptime),)
 
-    entries = entries[TABLE_DUMP_ENTRY_HDR_LEN:]
-    rv["V"]["ATTRS"] = entries
+    # the path attributes are decoded just as for an UPDATE, by
+    # decodeAttrs(), and so are the same objects
 
-    # XXX This should reuse part of bgp.parseUpdate() -- need to further
-    # separate out the path attr. parsing.  Cut'n'paste for now since I'm in
-    # a hurry.
+    curp = TABLE_DUMP_ENTRY_HDR_LEN
+    endp = min(curp + elen, len(entries))
+    rv.V.ATTRS = entries[curp:]
+    rv.V._pa   = decodeAttrs(entries, curp, endp, attrs)
+    rv.L       = curp + elen
 
     if verbose:
         print level*INDENT + 'PATH ATTRIBUTES: len=%d' % elen
 
-    rv["L"] = TABLE_DUMP_ENTRY_HDR_LEN + elen
-    while elen:
-        if verbose > 1:
-            print prthex(level*INDENT + 'flags/type:', entries[:2])
+        for (aflags, atype, hdrp, valp, alen) in walkAttrs(entries, curp, endp):
+            if verbose > 1:
+                print prthex(level*INDENT + 'flags/type:',
+                             entries[hdrp:hdrp+2])
+                print prthex(level*INDENT + 'length:', entries[hdrp+2:valp])
+                print prthex(level*INDENT + 'value:',
+                             entries[valp:valp+alen])
 
-        aflags, atype = struct.unpack(">BB", entries[0:2])
+            if atype in rv.V._pa:
+                print fmtBgpAttr(rv.V._pa[atype], level+1) +\
+                      fmtAttrFlags(aflags)
 
-        flg_optional   = (aflags & (1<<7)) >> 7
-        flg_transitive = (aflags & (1<<6)) >> 6
-        flg_partial    = (aflags & (1<<5)) >> 5
-        flg_extlen     = (aflags & (1<<4)) >> 4
+        print
 
-        flgs_str = "%s %s %s %s" %\
-                   ("optional"*flg_optional, "transitive"*flg_transitive,
-                    "partial"*flg_partial,   "extended length"*flg_extlen)
-        flgs_str = string.strip(flgs_str)
-        flgs_str = " [ %s ]" % flgs_str
+    return rv
 
-        if verbose > 1:
-            print prthex(level*INDENT + 'length:',
-                         entries[2+flg_extlen:2+flg_extlen+1])
-        (alen, ) = struct.unpack("%dB" % (flg_extlen+1),
-                                 entries[2:2+flg_extlen+1])
-        (adata,) = struct.unpack("%ds" % alen,
-                                 entries[2+flg_extlen+1:2+flg_extlen+1+alen])
+#-------------------------------------------------------------------------------
 
-        if verbose > 1:
-            print prthex(level*INDENT +'value:',
-                         entries[2+flg_extlen+1:2+flg_extlen+1+alen])
+# Message parsers, keyed by BGP message type.  A parser takes (msg_len, msg,
+# verbose, level), msg being the message less its common header, and returns
+# an RV.
 
-        (astr, arv) = parseBgpAttr(atype, alen, adata, verbose, level+1)
+PDU_PARSERS = {}
 
-        rv["V"][atype] = arv
+def registerPdu(msg_type, parser):
 
-        if verbose:
-            print astr + flgs_str
-        entries = entries[2+flg_extlen+1+alen:]
-        elen    = elen - (2+flg_extlen+1+alen)
+    PDU_PARSERS[msg_type] = parser
 
-    if verbose: print
-    return rv
+registerPdu(MSG_TYPES["OPEN"],          parseOpen)
+registerPdu(MSG_TYPES["UPDATE"],        parseUpdate)
+registerPdu(MSG_TYPES["NOTIFICATION"],  parseNotify)
+registerPdu(MSG_TYPES["KEEPALIVE"],     parseKeepalive)
+registerPdu(MSG_TYPES["ROUTE_REFRESH"], parseRouteRefresh)
 
 ################################################################################
 
+class ClosedExc(Exception): pass
+
 class Bgp:
 
     _version = 4
@@ -731,7 +1570,7 @@ class Bgp:
     #---------------------------------------------------------------------------
 
 
-    def __init__(self, loc_name, asn, rem_name, port, holdtime):
+    def __init__(self, loc_name, asn, rem_name, port, holdtime, sock=None):
 
         self._bgp_id_str  = loc_name
         self._bgp_id_addr = socket.gethostbyname(loc_name)
@@ -746,73 +1585,147 @@ class Bgp:
 
         self._holdtime = holdtime
 
-        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._sock.bind((self._bgp_id_str, 0))
-        self._sock.connect((self._bgp_peer_str, self._bgp_peer_prt))
+        # sock, if given, is already connected, or connecting; see Collector
+
+        if sock:
+            self._sock = sock
+        else:
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._sock.bind((self._bgp_id_str, 0))
+            self._sock.connect((self._bgp_peer_str, self._bgp_peer_prt))
+        self._state = FSM_STATES["CONNECT"]
+
+        # the negotiated hold time, and when we last heard from and spoke to
+        # the peer; see timers()
+
+        self._hold   = holdtime
+        self._rcvd_t = time.time()
+        self._sent_t = self._rcvd_t
+
+        # UPDATEs received and recorded, but not yet decoded; see process()
+
+        self._backlog = collections.deque()
+
+        # octets sent, but not yet taken by the socket; see sendQueued()
+
+        self._sbuf = ""
+
+        # received octets not yet framed are self._rbuf[self._rhead:self._rtail];
+        # see fill()
 
-        self._rcvd = ""
-        self._mrt  = None
+        self._rbuf  = bytearray(RCV_RING_SZ)
+        self._rview = memoryview(self._rbuf)
+        self._rhead = 0
+        self._rtail = 0
+        self._mrt   = None
 
     def __repr__(self):
 
         ret = """Passive BGP speaker version %s:
         id: %s [%s] (%#0x), AS: %d
         peer: %s:%d [%s] (%#0x), AS: %d
-        holdtime: %d\n""" %\
+        holdtime: %d, state: %s\n""" %\
             (VERSION,
              self._bgp_id_str, self._bgp_id_addr, self._bgp_id, self._bgp_as,
              self._bgp_peer_str, self._bgp_peer_prt, self._bgp_peer_addr,
-             self._bgp_peer_id, self._bgp_peer_as, self._holdtime)
+             self._bgp_peer_id, self._bgp_peer_as, self._holdtime,
+             FSM_STATES[self._state])
 
         return ret
 
-    def close(self):
+    def close(self, mrt=1):
         # XXX RMM XXX should possibly be a __del__() method?
+        # (a Collector's sessions share its writer, so leave that open)
         self._sock.close()
-        self._mrt.close()
+        self._state = FSM_STATES["IDLE"]
+        if mrt:
+            self._mrt.close()
 
     #---------------------------------------------------------------------------
 
-    def recvMsg(self, verbose=1, level=0):
+    def recv(self):
 
-        while 1:
+        # Receive whatever's waiting into the buffer, which is allocated
+        # once, and received into directly.  What's been framed is only
+        # moved out of the way when what's left, and the rest of its
+        # message, mightn't fit after it.  Raises ClosedExc if the peer
+        # closes the session.
 
-            if len(self._rcvd) < BGP_MARKER_LEN+3:
-                self._rcvd = self._rcvd + self._sock.recv(RCV_BUF_SZ)
-                continue
+        if (self._rtail == len(self._rbuf) or
+            (self._rhead and self._rhead + BGP_MAX_LEN > len(self._rbuf))):
+            left = self._rtail - self._rhead
+            self._rbuf[0:left] = self._rview[self._rhead:self._rtail].tobytes()
+            (self._rhead, self._rtail) = (0, left)
 
-            ## guaranteed to have a BGP-msg-header-worth of data in buffer
+        got = self._sock.recv_into(self._rview[self._rtail:])
+        if not got:
+            raise ClosedExc, "peer closed the session"
+        self._rtail  = self._rtail + got
+        self._rcvd_t = time.time()
 
-            msg_start = string.find(self._rcvd, BGP_MARKER)
-            if msg_start < 0:
-                # no marker in buffer -- fill buffer and continue
-                self._rcvd = self._rcvd + self._sock.recv(RCV_BUF_SZ)
-                continue
+    def resync(self):
+
+        # The buffer doesn't start with a BGP header: skip to the next marker,
+        # or what might be the start of one, dumping the skipped data to
+        # debug
+
+        skipp = self._rbuf.find(BGP_MARKER, self._rhead+1, self._rtail)
+        if skipp < 0:
+            skipp = max(self._rhead+1, self._rtail-BGP_MARKER_LEN+1)
+
+        sys.stderr.write(prtbin("", self._rview[self._rhead:skipp].tobytes())
+                         + "\n---\n")
+        sys.stderr.flush()
 
-            elif msg_start > 0:
-                # marker not at buffer start -- dump skipped data to debug
-                sys.stderr.write(prtbin("", self._rcvd[:msg_start]) + "\n---\n")
-                sys.stderr.flush()
+        self._rhead = skipp
 
-            ## msg_start is now at the start of a message
+    def frame(self):
+
+        # Frame the next message out of what's been received, or return None
+        # if it's not all here yet.  Messages are framed by their lengths:
+        # the marker is only checked where the last message said the next
+        # would start.
+
+        while 1:
+            if self._rtail - self._rhead < BGP_HDR_LEN:
+                return None
+
+            msg_start = self._rhead
+            if not self._rbuf.startswith(BGP_MARKER, msg_start):
+                self.resync()
+                continue
 
             msg_len, msg_type =\
-                     struct.unpack(">HB",
-                                   self._rcvd[msg_start+BGP_MARKER_LEN :
-                                              msg_start+BGP_MARKER_LEN+3])
-            break
+                     PDU_HDR_S.unpack_from(self._rbuf, msg_start+BGP_MARKER_LEN)
+            if BGP_HDR_LEN <= msg_len <= BGP_MAX_LEN:
+                break
+            self.resync()
 
         ## message may not be completely received...
 
-        while msg_len > len(self._rcvd):
-            self._rcvd = self._rcvd + self._sock.recv(RCV_BUF_SZ)
-
         msg_end = msg_start + msg_len
+        if msg_end > self._rtail:
+            return None
 
         ## guaranteed to have the entire message in [msg_start..msg_end]
 
-        msg        = self._rcvd[msg_start:msg_end]
-        self._rcvd = self._rcvd[msg_end:]
+        msg = self._rview[msg_start:msg_end].tobytes()
+        if msg_end == self._rtail:
+            (self._rhead, self._rtail) = (0, 0)
+        else:
+            self._rhead = msg_end
+
+        return msg_type, msg_len, msg
+
+    def recvMsg(self, verbose=1, level=0):
+
+        while 1:
+            rv = self.frame()
+            if rv:
+                break
+            self.recv()
+
+        msg_type, msg_len, msg = rv
 
         ## have now advanced buffer past current message; current
         ## message available in msg
@@ -826,35 +1739,94 @@ class Bgp:
 
     def sendMsg(self, msg_type, msg_len, msg, verbose=1, level=0):
 
-        fmt = ">LLLLH B %ds" % msg_len
-        pkt = struct.pack(fmt,
-                          0xffffffff, 0xffffffff, 0xffffffff, 0xffffffff,
-                          msg_len+BGP_HDR_LEN, msg_type, msg)
+        pkt = packMsg(msg_type, msg[:msg_len])
 
         if DUMP_MRTD == 1:
-            self._mrt.writeBgp4pyMsg(msg_type, len(pkt), pkt)
+            self._mrt.writeBgp4pyMsg(msg_type, len(pkt), pkt, self)
         elif DUMP_MRTD == 2:
-            self._mrt.writeBgpMsg(msg_type, len(pkt), pkt)
+            self._mrt.writeBgpMsg(msg_type, len(pkt), pkt, self)
         elif DUMP_MRTD == 3:
-            self._mrt.writeBgp4mpMsg(msg_type, len(pkt), pkt)
+            self._mrt.writeBgp4mpMsg(msg_type, len(pkt), pkt, self)
 
         if verbose > 2:
             print "%ssendMsg: type=%s (%d), len=%d%s" %\
                   (level*INDENT, MSG_TYPES[msg_type], msg_type,
-                   struct.calcsize(fmt), prtbin((level+1)*INDENT, pkt))
+                   len(pkt), prtbin((level+1)*INDENT, pkt))
+
+        self._sbuf   = self._sbuf + pkt
+        self.sendQueued()
+        self._sent_t = time.time()
 
-        self._sock.send(pkt)
+    def sendQueued(self):
+
+        # Send what's queued, as far as the socket will take it: all of it,
+        # if the socket blocks; else what fits, leaving the rest for the
+        # Collector to send when the socket's writable.  A message is thus
+        # never half sent and then abandoned.  Returns the octets left.
+
+        while self._sbuf:
+            try:
+                n = self._sock.send(self._sbuf)
+            except socket.error, e:
+                if e[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            self._sbuf = self._sbuf[n:]
+
+        return len(self._sbuf)
 
     def parseMsg(self, verbose=1, level=0):
 
         msg_type, msg_len, msg = self.recvMsg()
+        return self.handleMsg(msg_type, msg_len, msg, verbose, level)
+
+    def process(self, verbose=1, level=0):
+
+        # The socket's readable: receive what's there, and record every
+        # message that completes, without waiting for any more.  UPDATEs
+        # are only queued for decoding, by decodeBacklog(), so that however
+        # slow that is, it can be fitted around the timers; the rest are
+        # handled now, in order that the session's state is kept up.
+
+        self.recv()
+        while 1:
+            rv = self.frame()
+            if not rv:
+                break
+            msg_type, msg_len, msg = rv
+            self.record(msg_type, msg_len, msg)
+            if msg_type == MSG_TYPES["UPDATE"]:
+                self._backlog.append(rv)
+            else:
+                self.decodeMsg(msg_type, msg_len, msg, verbose, level)
+
+    def decodeBacklog(self, n, verbose=1, level=0):
+
+        # decode up to n queued UPDATEs; returns how many remain
+
+        backlog = self._backlog
+        while backlog and n > 0:
+            msg_type, msg_len, msg = backlog.popleft()
+            self.decodeMsg(msg_type, msg_len, msg, verbose, level)
+            n = n - 1
+
+        return len(backlog)
+
+    def handleMsg(self, msg_type, msg_len, msg, verbose=1, level=0):
+
+        self.record(msg_type, msg_len, msg)
+        return self.decodeMsg(msg_type, msg_len, msg, verbose, level)
+
+    def record(self, msg_type, msg_len, msg):
 
         if DUMP_MRTD == 1:
-            self._mrt.writeBgp4pyMsg(msg_type, msg_len, msg)
+            self._mrt.writeBgp4pyMsg(msg_type, msg_len, msg, self)
         elif DUMP_MRTD == 2:
-            self._mrt.writeBgpMsg(msg_type, msg_len, msg)
+            self._mrt.writeBgpMsg(msg_type, msg_len, msg, self)
         elif DUMP_MRTD == 3:
-            self._mrt.writeBgp4mpMsg(msg_type, msg_len, msg)
+            self._mrt.writeBgp4mpMsg(msg_type, msg_len, msg, self)
+
+    def decodeMsg(self, msg_type, msg_len, msg, verbose=1, level=0):
 
         if verbose > 2:
             print "%sparseMsg: type=%s (%d) len=%d%s" %\
@@ -864,13 +1836,28 @@ class Bgp:
 
         rv = parseBgpPdu(msg_type, msg_len, msg, verbose, level)
 
+        # the wafeur-est thin state machine you ever did see :-)
+
+        if msg_type == MSG_TYPES["OPEN"]:
+            self._bgp_peer_as = rv["V"]["AS"]
+            self._hold = min(self._holdtime, rv["V"]["HT"])
+            self.sendKeepalive(verbose, level)
+            self._state = FSM_STATES["OPENCONFIRM"]
+
+        elif (msg_type == MSG_TYPES["KEEPALIVE"] and
+              self._state == FSM_STATES["OPENCONFIRM"]):
+            self._state = FSM_STATES["ESTABLISHED"]
+
         return rv # msg_type, msg_len, msg
 
     #---------------------------------------------------------------------------
 
-    def sendOpen(self, verbose=1, level=0):
+    def start(self, verbose=1, level=0):
 
-        print `type(self._bgp_id)`, `self._bgp_id`
+        self.sendOpen(verbose, level)
+        self._state = FSM_STATES["OPENSENT"]
+
+    def sendOpen(self, verbose=1, level=0):
 
         fmt = ">BHHLB"
         msg = struct.pack(fmt, Bgp._version,
@@ -885,6 +1872,29 @@ class Bgp:
         self.sendMsg(MSG_TYPES["OPEN"],
                      struct.calcsize(fmt), msg, verbose, level)
 
+    def sendUpdate(self, withdrawn="", attrs="", nlri="", verbose=1, level=0):
+
+        # see packUpdate()
+
+        msg = packUpdate(withdrawn, attrs, nlri)
+        if verbose > 2:
+            print "sendUpdate: len=%d%s" %\
+                  (len(msg), prtbin(level*INDENT, msg))
+
+        if verbose > 0:
+            parseUpdate(len(msg), msg, verbose, level)
+        self.sendMsg(MSG_TYPES["UPDATE"], len(msg), msg, verbose, level)
+
+    def sendNotify(self, code, subcode, data="", verbose=1, level=0):
+
+        msg = TLV_HDR_S.pack(code, subcode) + data
+        if verbose > 2:
+            print "sendNotify: len=%d%s" %\
+                  (len(msg), prtbin(level*INDENT, msg))
+
+        parseNotify(len(msg), msg, verbose, level)
+        self.sendMsg(MSG_TYPES["NOTIFICATION"], len(msg), msg, verbose, level)
+
     def sendKeepalive(self, verbose=1, level=0):
 
         fmt = ""
@@ -898,6 +1908,413 @@ class Bgp:
 
     #---------------------------------------------------------------------------
 
+    def timers(self, now, verbose=1, level=0):
+
+        # Run the hold and keepalive timers: if the peer's been silent for
+        # the hold time, tell it so and raise ClosedExc; if we've been
+        # silent for a third of it, send a KEEPALIVE.  Returns when next to
+        # call, or None if there are no timers running.  Hearing from the
+        # peer is receiving anything, decoded or not.
+
+        if self._state == FSM_STATES["OPENSENT"]:
+            hold = HOLD_OPEN
+        elif self._state in (FSM_STATES["OPENCONFIRM"],
+                             FSM_STATES["ESTABLISHED"]):
+            hold = self._hold
+        else:
+            return None
+
+        if not hold:
+            return None
+
+        if now - self._rcvd_t >= hold:
+            self.sendNotify(NOTIFY_CODES["HOLD_TIMER_EXPIRED"], 0, "",
+                            verbose, level)
+            raise ClosedExc, "hold timer expired"
+
+        due = self._rcvd_t + hold
+        if self._state != FSM_STATES["OPENSENT"]:
+            if now - self._sent_t >= hold/3.0:
+                self.sendKeepalive(verbose, level)
+            due = min(due, self._sent_t + hold/3.0)
+
+        return due
+
+    #---------------------------------------------------------------------------
+
+################################################################################
+
+def decodeWorker(queue, verbose=1, level=0, handler=None):
+
+    # A decoding worker process for a Collector: decode the batches of
+    # (peer AS, peer address, time received, count, msgs) it's queued, msgs
+    # being count messages end to end, until it queues None; printing as
+    # verbose says, and calling handler(peer AS, peer address, time
+    # received, rv) with each, if given -- to raise alerts, keep a live
+    # RIB, and so on.  ^C is the Collector's to handle.
+    #
+    # (One string per run of messages is far cheaper to get across than a
+    # tuple per message, and they're framed already.)
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    os.nice(DECODE_NICE)
+
+    while 1:
+        batch = queue.get()
+        if batch is None:
+            break
+
+        for (src_as, src_ip, ts, count, msgs) in batch:
+            off = 0
+            while off < len(msgs):
+                msg_len, msg_type =\
+                         PDU_HDR_S.unpack_from(msgs, off+BGP_MARKER_LEN)
+                msg = msgs[off:off+msg_len]
+                off = off + msg_len
+
+                rv = parseBgpPdu(msg_type, msg_len, msg, verbose, level)
+                if handler:
+                    handler(src_as, src_ip, ts, rv)
+
+#-------------------------------------------------------------------------------
+
+class Collector:
+
+    # Many sessions in one process: active ones to the peers added, retried
+    # CONNECT_RETRY seconds after they fail or close, and, if listening,
+    # passive ones accepted on the BGP port (from the peers added, if any;
+    # else from anyone).  All are driven from one poll() loop, and write to
+    # one Mrtd, self._mrt.
+    #
+    # UPDATEs are decoded in slices between times round the loop; or, if
+    # raw, not at all; or, given decoders, by that many worker processes
+    # (see decodeWorker()), each peer's always by the same one, and handler,
+    # if given, called there with each.
+
+    def __init__(self, loc_name, asn, holdtime, port=BGP_LISTEN_PORT,
+                 listen=0, raw=0, decoders=0, handler=None):
+
+        self._loc_name = loc_name
+        self._asn      = asn
+        self._holdtime = holdtime
+        self._port     = port
+        self._mrt      = None
+
+        self._peers    = {} # socket fd -> Bgp
+        self._addrs    = {} # peer address -> Bgp
+        self._active   = {} # peer address -> (name, port) to connect to
+        self._retry    = {} # peer address -> time to reconnect
+        self._backlog  = {} # Bgp -> 1, if it has UPDATEs to decode
+        self._events   = {} # socket fd -> poll() events registered for
+        self._poll     = select.poll()
+
+        if decoders and not multiprocessing:
+            raise ImportError, "decoding workers need multiprocessing"
+
+        self._raw      = raw
+        self._decoders = decoders
+        self._handler  = handler
+        self._workers  = [] # (process, queue, batch) per decoding worker
+        self._dropped  = 0  # UPDATEs the workers couldn't keep up with
+
+        self._sock     = None
+        if listen:
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._sock.bind((loc_name, port))
+            self._sock.listen(LISTEN_BACKLOG)
+            self._sock.setblocking(0)
+            self._poll.register(self._sock.fileno(), select.POLLIN)
+
+    def __repr__(self):
+
+        ret = """BGP collector version %s:
+        local: %s, AS: %d, holdtime: %d
+        listening: %s
+        peers: %s
+        decoding: %s\n""" %\
+            (VERSION, self._loc_name, self._asn, self._holdtime,
+             self._sock and self._port, string.join(self._active.keys(), ", "),
+             (self._decoders and "%d workers" % self._decoders) or
+             (self._raw and "none") or "inline")
+
+        return ret
+
+    def close(self):
+
+        for bgp in self._peers.values():
+            bgp.close(0)
+        if self._sock:
+            self._sock.close()
+        if self._mrt:
+            self._mrt.close()
+
+        self.flushBatches()
+        for (proc, queue, batch) in self._workers:
+            queue.put(None)
+        for (proc, queue, batch) in self._workers:
+            proc.join()
+        self._workers = []
+
+        if self._dropped:
+            error("[ decoding: %d UPDATEs dropped ]\n" % self._dropped)
+
+    #---------------------------------------------------------------------------
+
+    def startDecoders(self, verbose=1, level=0):
+
+        for i in range(self._decoders):
+            queue = multiprocessing.Queue(DECODE_QUEUE)
+            proc  = multiprocessing.Process(target=decodeWorker,
+                                            name="bgp decoder %d" % i,
+                                            args=(queue, verbose, level,
+                                                  self._handler))
+            proc.daemon = 1
+            proc.start()
+            self._workers.append((proc, queue, []))
+
+    def queued(self, bgp, verbose=1, level=0):
+
+        # bgp has UPDATEs queued: hand them to its worker, batched up with
+        # when they were received, or forget them, or leave them for run()
+
+        backlog = bgp._backlog
+        if self._workers:
+            (proc, queue, batch) =\
+                       self._workers[bgp._bgp_peer_id % len(self._workers)]
+            batch.append((bgp._bgp_peer_as, bgp._bgp_peer_id, bgp._rcvd_t,
+                          len(backlog),
+                          string.join([ msg for (t, l, msg) in backlog ], "")))
+            backlog.clear()
+            if len(batch) >= DECODE_BATCH:
+                self.flushBatch(queue, batch)
+
+        elif self._raw:
+            backlog.clear()
+
+        else:
+            self._backlog[bgp] = 1
+
+    def flushBatch(self, queue, batch):
+
+        # never wait for a worker: capture mustn't be held up by decoding
+
+        try:
+            queue.put_nowait(batch[:])
+        except Queue.Full:
+            for run in batch:
+                self._dropped = self._dropped + run[3]
+        del batch[:]
+
+    def flushBatches(self):
+
+        for (proc, queue, batch) in self._workers:
+            if batch:
+                self.flushBatch(queue, batch)
+
+    #---------------------------------------------------------------------------
+
+    def addPeer(self, rem_name, port=BGP_LISTEN_PORT):
+
+        addr = socket.gethostbyname(rem_name)
+        self._active[addr] = (rem_name, port)
+        self._retry[addr]  = 0
+
+    def connect(self, addr, verbose=1, level=0):
+
+        # start connecting, without waiting; see connected()
+
+        (rem_name, port) = self._active[addr]
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(0)
+        sock.bind((self._loc_name, 0))
+        err = sock.connect_ex((addr, port))
+        if err not in (0, errno.EINPROGRESS):
+            sock.close()
+            self.failed(addr, "connecting to %s:%d: %s" %
+                        (rem_name, port, os.strerror(err)))
+            return
+
+        bgp = Bgp(self._loc_name, self._asn, addr, port, self._holdtime, sock)
+        self.add(bgp)
+
+    def connected(self, bgp, verbose=1, level=0):
+
+        err = bgp._sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            raise socket.error, (err, os.strerror(err))
+
+        self.open(bgp, verbose, level)
+        self.watch(bgp)
+
+    def accept(self, verbose=1, level=0):
+
+        try:
+            (sock, (addr, port)) = self._sock.accept()
+        except socket.error:
+            return
+
+        if ((self._active and addr not in self._active) or
+            addr in self._addrs):
+            # not a peer of ours, or we've a session with it already
+            error("[ rejected %s:%d ]\n" % (addr, port))
+            sock.close()
+            return
+
+        sock.setblocking(0)
+        bgp = Bgp(self._loc_name, self._asn, addr, port, self._holdtime, sock)
+        self.add(bgp)
+        self.open(bgp, verbose, level)
+        self.watch(bgp)
+
+    def add(self, bgp):
+
+        bgp._mrt = self._mrt
+        self._peers[bgp._sock.fileno()] = bgp
+        self._addrs[bgp._bgp_peer_addr] = bgp
+        self.watch(bgp)
+
+    def watch(self, bgp):
+
+        # poll() for the socket's connecting, or for what it's received,
+        # and also for its being writable while it's anything queued to
+        # send; see Bgp.sendQueued()
+
+        fd = bgp._sock.fileno()
+        if bgp._state == FSM_STATES["CONNECT"]:
+            events = select.POLLOUT
+        elif bgp._sbuf:
+            events = select.POLLIN | select.POLLOUT
+        else:
+            events = select.POLLIN
+
+        if self._events.get(fd) != events:
+            if fd in self._events:
+                self._poll.unregister(fd)
+            self._poll.register(fd, events)
+            self._events[fd] = events
+
+    def open(self, bgp, verbose=1, level=0):
+
+        if verbose > 0:
+            print `bgp`
+        bgp.start(verbose, level)
+
+    def drop(self, bgp, why):
+
+        # the session's over: forget it, and reconnect if it's to a peer of
+        # ours.  Any UPDATEs it's left queued are still decoded; what it's
+        # left in the writer's buffer is written out now.
+
+        fd   = bgp._sock.fileno()
+        addr = bgp._bgp_peer_addr
+
+        self._poll.unregister(fd)
+        del self._events[fd]
+        bgp.close(0)
+        del self._peers[fd]
+        del self._addrs[addr]
+        if bgp._backlog:
+            self.queued(bgp)
+        if self._mrt:
+            self._mrt.flush()
+        self.failed(addr, "%s:%d: %s" % (addr, bgp._bgp_peer_prt, why))
+
+    def failed(self, addr, why):
+
+        error("[ %s ]\n" % why)
+        if addr in self._active:
+            self._retry[addr] = time.time() + CONNECT_RETRY
+
+    #---------------------------------------------------------------------------
+
+    def run(self, verbose=1, level=0):
+
+        # Each time round: (re)connect to peers that are due it; flush the
+        # writer if it's due (see Mrtd.flushDue()); run every session's
+        # timers; receive and record whatever's arrived; then
+        # decode up to DECODE_SLICE queued UPDATEs per session.  Timers and
+        # sockets thus come first, and decoding never holds them up for
+        # more than a slice, however far behind it falls.  Or, with
+        # decoding workers, hand them what's been received at the end of
+        # each time round.
+
+        if self._decoders and not self._workers:
+            self.startDecoders(verbose, level)
+
+        while 1:
+            now = time.time()
+            for (addr, when) in self._retry.items():
+                if when <= now:
+                    del self._retry[addr]
+                    self.connect(addr, verbose, level)
+
+            due = self._retry.values()
+            if self._mrt:
+                when = self._mrt.flushDue()
+                if when is not None:
+                    if when <= now:
+                        self._mrt.flush()
+                    else:
+                        due.append(when)
+
+            for bgp in self._peers.values():
+                try:
+                    when = bgp.timers(now, verbose, level)
+                    if when is not None:
+                        due.append(when)
+                except (ClosedExc, socket.error), e:
+                    self.drop(bgp, e)
+
+            timeout = None
+            if self._backlog:
+                timeout = 0
+            elif due:
+                timeout = max(0, min(due) - now) * 1000
+
+            try:
+                events = self._poll.poll(timeout)
+            except select.error, e:
+                if e[0] == errno.EINTR:
+                    continue
+                raise
+
+            for (fd, event) in events:
+                if self._sock and fd == self._sock.fileno():
+                    self.accept(verbose, level)
+                    continue
+
+                bgp = self._peers.get(fd)
+                if not bgp:
+                    continue
+
+                try:
+                    if bgp._state == FSM_STATES["CONNECT"]:
+                        self.connected(bgp, verbose, level)
+                        continue
+
+                    if event & select.POLLOUT:
+                        bgp.sendQueued()
+                    if event & ~select.POLLOUT:
+                        bgp.process(verbose, level)
+                        if bgp._backlog:
+                            self.queued(bgp, verbose, level)
+
+                except (ClosedExc, socket.error), e:
+                    self.drop(bgp, e)
+
+            # sessions with something left to send (an OPEN, a KEEPALIVE, a
+            # NOTIFICATION) wait for their sockets to be writable
+
+            for bgp in self._peers.values():
+                self.watch(bgp)
+
+            self.flushBatches()
+            for bgp in self._backlog.keys():
+                if not bgp.decodeBacklog(DECODE_SLICE, verbose, level):
+                    del self._backlog[bgp]
+
 ################################################################################
 
 if __name__ == "__main__":
@@ -906,19 +2323,27 @@ if __name__ == "__main__":
 
     #---------------------------------------------------------------------------
 
-    global VERBOSE, DUMP_MRTD
+    global VERBOSE
 
     VERBOSE   = 1
     DUMP_MRTD = 0
 
     file_pfx  = mrtd.DEFAULT_FILE
     file_sz   = mrtd.DEFAULT_SIZE
+    queue_len = mrtd.QUEUE_LEN
+    compress  = None
+    comp_bg   = 0
+    rot_time  = 0
+    blk_size  = 0
     mrtd_type = None
     loc_name  = None
-    rem_name  = None
+    rem_names = []
+    listen    = 0
     asn       = None
     port      = BGP_LISTEN_PORT
     holdtime  = 0
+    raw       = 0
+    decoders  = 0
 
     #---------------------------------------------------------------------------
 
@@ -935,13 +2360,31 @@ if __name__ == "__main__":
         -d|--dump     : Dump MRTd::PROTOCOL_BGP format
         -m|--dump-4mp : Dump MRTd::PROTOCOL_BGP4MP format
 
-        -p|--peer     : [*] BGP peer address/name
+        -p|--peer     : [*] BGP peer address/name; may be repeated
+        -L|--listen   : [*] Also accept sessions, from the peers given
+                        with -p|--peer, if any, else from anyone
         -a|--as       : [*] Local AS number
         -l|--local    : Address/name for local bind
-        -t|--port     : BGP peer listening port [def: %d]
-        -z|--size     : Size of output file(s) [min: %d]""" %\
+        -t|--port     : BGP port, of peers and to listen on [def: %d]
+        -o|--holdtime : Hold time to offer peers [def: 0, none]
+        -R|--raw      : Just record UPDATEs, don't decode them
+        -D|--decoders : Decode UPDATEs in this many worker processes
+                        [def: 0, inline]
+        -z|--size     : Size of output file(s) [min: %d]
+        -Q|--queue    : Queue up to this many messages for a writer
+                        thread [def: %d, write inline]
+        -r|--rotate-time : Also start a new output file every this many
+                        seconds [def: size only]
+        -c|--compress    : Compress output as it's written [%s]
+        -C|--compress-bg : Compress output files once they're rotated
+                        out [%s]
+        -B|--block-size  : Compress in blocks of this size, with a
+                        block index for seeking; records are written
+                        only as blocks fill, not every second
+                        [def: none]""" %\
             (os.path.basename(sys.argv[0]), mrtd.DEFAULT_FILE,
-             BGP_LISTEN_PORT, mrtd.MIN_FILE_SZ)
+             BGP_LISTEN_PORT, mrtd.MIN_FILE_SZ, mrtd.QUEUE_LEN,
+             string.join(mrtd.COMPRESSORS.keys(), "|"), string.join(mrtd.COMPRESSORS.keys(), "|"))
         sys.exit(0)
 
     #---------------------------------------------------------------------------
@@ -951,11 +2394,15 @@ if __name__ == "__main__":
 
     try:
         opts, args = getopt.getopt(sys.argv[1:],
-                                   "hqvVydmp:a:o:t:l:f:z:",
+                                   "hqvVydmp:La:o:t:l:f:z:Q:c:C:r:B:RD:",
                                    ("help", "quiet", "verbose", "VERBOSE",
                                     "dump-4py", "dump", "dump-4mp",
-                                    "file-pfx=", "peer=", "as=", "holdtime=",
-                                    "port=", "local=", "size=" ))
+                                    "file-pfx=", "peer=", "listen", "as=",
+                                    "holdtime=",
+                                    "port=", "local=", "size=", "queue=",
+                                    "compress=", "compress-bg=",
+                                    "rotate-time=", "block-size=", "raw",
+                                    "decoders=" ))
     except (getopt.error):
         usage()
 
@@ -985,7 +2432,10 @@ if __name__ == "__main__":
             mrtd_type = mrtd.MSG_TYPES["PROTOCOL_BGP4MP"]
 
         elif x in ('-p', '--peer'):
-            rem_name = y
+            rem_names.append(y)
+
+        elif x in ('-L', '--listen'):
+            listen = 1
 
         elif x in ('-a', '--as'):
             asn = string.atoi(y)
@@ -1005,10 +2455,31 @@ if __name__ == "__main__":
         elif x in ('-z', '--file-size'):
             file_sz = max(string.atof(y), mrtd.MIN_FILE_SZ)
 
+        elif x in ('-Q', '--queue'):
+            queue_len = string.atoi(y)
+
+        elif x in ('-c', '--compress', '-C', '--compress-bg'):
+            if y not in mrtd.COMPRESSORS:
+                usage()
+            compress = y
+            comp_bg  = x in ('-C', '--compress-bg')
+
+        elif x in ('-r', '--rotate-time'):
+            rot_time = string.atoi(y)
+
+        elif x in ('-B', '--block-size'):
+            blk_size = string.atoi(y)
+
+        elif x in ('-R', '--raw'):
+            raw = 1
+
+        elif x in ('-D', '--decoders'):
+            decoders = string.atoi(y)
+
         else:
             usage()
 
-    if not (rem_name and asn):
+    if not ((rem_names or listen) and asn):
         usage()
 
     if not loc_name:
@@ -1016,25 +2487,23 @@ if __name__ == "__main__":
 
     #---------------------------------------------------------------------------
 
-    bgp      = Bgp(loc_name, asn, rem_name, port, holdtime)
-    bgp._mrt = mrtd.Mrtd(file_pfx, "w+b", file_sz, mrtd_type, bgp)
+    collector      = Collector(loc_name, asn, holdtime, port, listen,
+                               raw, decoders)
+    collector._mrt = mrtd.Mrtd(file_pfx, "w+b", file_sz, mrtd_type, collector,
+                               queue_len=queue_len, compress=compress,
+                               compress_bg=comp_bg, rotate_time=rot_time,
+                               block_size=blk_size)
+    for rem_name in rem_names:
+        collector.addPeer(rem_name, port)
 
     if VERBOSE > 0:
-        print `bgp`
+        print `collector`
 
     try:
-
-        # the wafeur-est thin state machine you ever did see :-)
-        bgp.sendOpen(VERBOSE, 0)
-        rv = bgp.parseMsg(VERBOSE, 0)
-        bgp._bgp_peer_as = rv["V"]["AS"]
-        bgp.sendKeepalive(VERBOSE, 0)
-
-        while 1:
-            msg = bgp.parseMsg(VERBOSE, 0)
+        collector.run(VERBOSE, 0)
 
     except (KeyboardInterrupt):
-        bgp.close()
+        collector.close()
         sys.exit(1)
 
     #---------------------------------------------------------------------------
@@ -1,4 +1,4 @@
-#! /usr/bin/env python2.5
+#! /usr/bin/env python2.7
 
 ##     PyRT: Python Routeing Toolkit
 
@@ -78,9 +78,8 @@ if __name__ == "__main__":
             of  = open(fn + '.clean', 'w+b')
             mrt = mrtd.Mrtd(fn, "rb", mrtd.DEFAULT_SIZE)
             error('[ %s ] cleaning...' % fn)
-            while 1:
+            for msg_tup in mrt:
                 cnt = cnt + 1
-                msg_tup = mrt.read()
                 msg = msg_tup[-2] + msg_tup[-1]
 
                 try:
@@ -90,7 +89,7 @@ if __name__ == "__main__":
                     raise KeyboardInterrupt
 
                 except:
-                    rv["T"] = None
+                    rv = { "T": None }
 
                 if rv["T"]:
                     of.write(msg)
@@ -99,8 +98,8 @@ if __name__ == "__main__":
                         print prthex("msg %d: " % cnt, msg)
                     error('msg %d dirty...' % cnt)
 
-        except (mrtd.EOFExc):
             error("end of file: %u messages\n" % cnt)
+
         except (KeyboardInterrupt):
             error("interrupted!\n")
 
@@ -1,4 +1,4 @@
-#! /usr/bin/env python2.5
+#! /usr/bin/env python2.7
 
 ##     PyRT: Python Routeing Toolkit
 
@@ -104,6 +104,21 @@ ISIS_LSP_HDR_LEN   = 19
 ISIS_CSN_HDR_LEN   = 25
 ISIS_PSN_HDR_LEN   =  9
 
+# precompiled formats for the per-message and per-field paths
+
+MAC_HDR_S        = struct.Struct(">6s 6s H B B B B")
+ISIS_HDR_S       = struct.Struct(">8B")
+ISIS_HELLO_HDR_S = struct.Struct("> B 6s H H B 7s")
+ISIS_LSP_HDR_S   = struct.Struct("> HH 8s LHB")
+ISIS_CSN_HDR_S   = struct.Struct("> H 7s 8s 8s")
+ISIS_PSN_HDR_S   = struct.Struct("> H 7s")
+LSP_ID_S         = struct.Struct("> 6sBB")
+VLEN_HDR_S       = struct.Struct(">BB")
+METRICS_S        = struct.Struct("> 4B")
+IS_NEIGHBOR_S    = struct.Struct("> BBBB 7s")
+LSP_ENTRY_S      = struct.Struct("> H 8s L H")
+IP_REACH_S       = struct.Struct("> 4B LL")
+
 AllL1ISs = struct.pack("6B", 0x01, 0x80, 0xc2, 0x00, 0x00, 0x14)
 AllL2ISs = struct.pack("6B", 0x01, 0x80, 0xc2, 0x00, 0x00, 0x15)
 
@@ -217,7 +232,7 @@ def padPkt(tgt_len, pkt):
 def parseMacHdr(pkt):
 
     (dst_mac, src_mac, length, dsap, ssap, ctrl, nlpid) =\
-              struct.unpack(">6s 6s H B B B B", pkt[0:MAC_HDR_LEN+1])
+              MAC_HDR_S.unpack_from(pkt, 0)
 
     if (dsap, ssap, ctrl, nlpid) != ISIS_LLC_HDR:
         raise LLCExc
@@ -229,7 +244,7 @@ def parseMacHdr(pkt):
 def parseIsisHdr(pkt):
 
     (nlpid, hdr_len, ver_proto_id, resvd, msg_type, ver, eco, user_eco) =\
-            struct.unpack(">8B", pkt[0:ISIS_HDR_LEN])
+            ISIS_HDR_S.unpack_from(pkt, 0)
 
     return (nlpid, hdr_len, ver_proto_id, resvd,
             msg_type, ver, eco, user_eco)
@@ -238,7 +253,7 @@ def parseIsisHdr(pkt):
 
 def parsePsnHdr(pkt):
 
-    (pdu_len, src_id) = struct.unpack("> H 7s", pkt[:ISIS_PSN_HDR_LEN])
+    (pdu_len, src_id) = ISIS_PSN_HDR_S.unpack_from(pkt, 0)
 
     return (pdu_len, src_id)
 
@@ -247,7 +262,7 @@ def parsePsnHdr(pkt):
 def parseCsnHdr(pkt):
 
     (pdu_len, src_id, start_lsp_id, end_lsp_id) =\
-              struct.unpack("> H 7s 8s 8s", pkt[:ISIS_CSN_HDR_LEN])
+              ISIS_CSN_HDR_S.unpack_from(pkt, 0)
 
     return (pdu_len, src_id, start_lsp_id, end_lsp_id)
 
@@ -256,13 +271,46 @@ def parseCsnHdr(pkt):
 def parseLspHdr(pkt):
 
     (pdu_len, lifetime, lsp_id, seq_no, cksm, bits) =\
-              struct.unpack("> HH 8s LHB", pkt[:ISIS_LSP_HDR_LEN])
-    lsp_id = struct.unpack("> 6sBB", lsp_id)
+              ISIS_LSP_HDR_S.unpack_from(pkt, 0)
+    lsp_id = LSP_ID_S.unpack(lsp_id)
 
     return (pdu_len, lifetime, lsp_id, seq_no, cksm, bits)
 
 ################################################################################
 
+class IsisHdr(Slots):
+
+    # the RV "H" of an ISIS PDU: the MAC/LLC header and the ISIS common
+    # header
+
+    __slots__ = ("SRC_MAC", "DST_MAC", "LENGTH", "DSAP", "SSAP", "CTRL",
+                 "NLPID", "HDR_LEN", "VER_PROTO_ID", "VER", "ECO", "USER_ECO")
+
+class IsisPdu(Slots):
+
+    # the RV "V" of an ISIS PDU that isn't parsed; those that are have the
+    # keys their parser returns values for (see registerMsg())
+
+    __slots__ = ()
+
+class IsisHello(Slots):
+
+    __slots__ = ("CIRCUIT_TYPE", "SRC_ID", "HOLDTIMER", "PDU_LEN", "PRIO",
+                 "LAN_ID", "VFIELDS")
+
+class IsisLsp(Slots):
+
+    __slots__ = ("PDU_LEN", "LIFETIME", "LSP_ID", "SEQ_NO", "CKSM", "BITS",
+                 "VFIELDS")
+
+class IsisCsn(Slots):
+
+    __slots__ = ("PDU_LEN", "SRC_ID", "START_LSP_ID", "END_LSP_ID", "VFIELDS")
+
+class IsisPsn(Slots):
+
+    __slots__ = ("PDU_LEN", "SRC_ID", "VFIELDS")
+
 def parseIsisMsg(msg_len, msg, verbose=1, level=0):
 
     (src_mac, dst_mac, length, dsap, ssap, ctrl) = parseMacHdr(msg)
@@ -292,67 +340,38 @@ def parseIsisMsg(msg_len, msg, verbose=1, level=0):
               (hdr_len, ver_proto_id, ver) +\
               "eco: %d, user eco: %d" % (eco, user_eco)
 
-    rv = {"T": msg_type,
-          "L": msg_len,
-          "H": {},
-          "V": {}
-          }
-
-    rv["H"]["SRC_MAC"] = src_mac
-    rv["H"]["DST_MAC"] = dst_mac
-    rv["H"]["LENGTH"]  = length
-    rv["H"]["DSAP"]    = dsap
-    rv["H"]["SSAP"]    = ssap
-    rv["H"]["CTRL"]    = ctrl
-
-    rv["H"]["NLPID"]        = nlpid
-    rv["H"]["HDR_LEN"]      = hdr_len
-    rv["H"]["VER_PROTO_ID"] = ver_proto_id
-    rv["H"]["VER"]          = ver
-    rv["H"]["ECO"]          = eco
-    rv["H"]["USER_ECO"]     = user_eco
+    rv = Rv(T=msg_type, L=msg_len, H=IsisHdr())
+
+    rv.H.SRC_MAC = src_mac
+    rv.H.DST_MAC = dst_mac
+    rv.H.LENGTH  = length
+    rv.H.DSAP    = dsap
+    rv.H.SSAP    = ssap
+    rv.H.CTRL    = ctrl
+
+    rv.H.NLPID        = nlpid
+    rv.H.HDR_LEN      = hdr_len
+    rv.H.VER_PROTO_ID = ver_proto_id
+    rv.H.VER          = ver
+    rv.H.ECO          = eco
+    rv.H.USER_ECO     = user_eco
 
     msg = msg[MAC_HDR_LEN+ISIS_HDR_LEN:]
-    if msg_type in MSG_TYPES.keys():
-        if   msg_type in (MSG_TYPES["L1LANHello"], MSG_TYPES["L2LANHello"]):
-            (rv["V"]["CIRCUIT_TYPE"],
-             rv["V"]["SRC_ID"],
-             rv["V"]["HOLDTIMER"],
-             rv["V"]["PDU_LEN"],
-             rv["V"]["PRIO"],
-             rv["V"]["LAN_ID"],
-             rv["V"]["VFIELDS"]) = parseIsisIsh(msg_len, msg, verbose, level)
-
-        elif msg_type == MSG_TYPES["PPHello"]:
-            parseIsisPPIsh(msg_len, msg, verbose, level)
-
-        elif msg_type in (MSG_TYPES["L1LSP"], MSG_TYPES["L2LSP"]):
-            (rv["V"]["PDU_LEN"],
-             rv["V"]["LIFETIME"],
-             rv["V"]["LSP_ID"],
-             rv["V"]["SEQ_NO"],
-             rv["V"]["CKSM"],
-             rv["V"]["BITS"],
-             rv["V"]["VFIELDS"]) = parseIsisLsp(msg_len, msg, verbose, level)
-
-        elif msg_type in (MSG_TYPES["L1CSN"], MSG_TYPES["L2CSN"]):
-            (rv["V"]["PDU_LEN"],
-             rv["V"]["SRC_ID"],
-             rv["V"]["START_LSP_ID"],
-             rv["V"]["END_LSP_ID"],
-             rv["V"]["VFIELDS"]) = parseIsisCsn(msg_len, msg, verbose, level)
-
-        elif msg_type in (MSG_TYPES["L1PSN"], MSG_TYPES["L2PSN"]):
-            (rv["V"]["PDU_LEN"],
-             rv["V"]["SRC_ID"],
-             rv["V"]["VFIELDS"]) = parseIsisPsn(msg_len, msg, verbose, level)
+    if msg_type in MSG_PARSERS:
+        (parser, cls) = MSG_PARSERS[msg_type]
+        vals = parser(msg_len, msg, verbose, level)
+        rv.V = cls()
+        keys = cls.__slots__
+        for i in range(len(keys)):
+            setattr(rv.V, keys[i], vals[i])
 
-        else:
+    else:
+        rv.V = IsisPdu()
+        if msg_type in MSG_TYPES:
             if verbose > 0:
                 print level*INDENT + "[ *** %s *** ]" % MSG_TYPES[msg_type]
 
-    else:
-        if verbose > 0:
+        elif verbose > 0:
             print level*INDENT + "[ UNKNOWN ISIS message: ", `msg_type`, " ]"
 
     return rv
@@ -362,8 +381,7 @@ def parseIsisMsg(msg_len, msg, verbose=1, level=0):
 def parseIsisIsh(msg_len, msg, verbose=1, level=0):
 
     (circuit_type, src_id, holdtimer,
-     pdu_len, prio, lan_id) = struct.unpack("> B 6s H H B 7s",
-                                            msg[:ISIS_HELLO_HDR_LEN])
+     pdu_len, prio, lan_id) = ISIS_HELLO_HDR_S.unpack_from(msg, 0)
 
     if verbose > 1:
         print prtbin(level*INDENT, msg[:ISIS_HELLO_HDR_LEN])
@@ -383,7 +401,8 @@ def parseIsisIsh(msg_len, msg, verbose=1, level=0):
 
 def parseIsisPPIsh(msg_len, msg, verbose=1, level=0):
 
-    print level*INDENT + "[ *** PP ISH NOT PARSED *** ]"
+    if verbose > 0:
+        print level*INDENT + "[ *** PP ISH NOT PARSED *** ]"
 
 #-------------------------------------------------------------------------------
 
@@ -455,6 +474,30 @@ def parseIsisPsn(msg_len, msg, verbose=1, level=0):
 
 ################################################################################
 
+class VLenField(Slots):
+
+    # a variable length field; "V" is absent if the field isn't parsed
+
+    __slots__ = ("L", "V")
+
+class IsNeighbor(Slots):
+
+    __slots__ = ("DEFAULT", "DELAY", "EXPENSE", "ERROR", "NID")
+
+class EsNeighbors(Slots):
+
+    __slots__ = ("DEFAULT", "DELAY", "EXPENSE", "ERROR", "NIDS")
+
+class LspEntry(Slots):
+
+    __slots__ = ("ID", "PN", "NM", "LIFETIME", "SEQ_NO", "CKSM")
+
+class IpReach(Slots):
+
+    __slots__ = ("DEFAULT", "DELAY", "EXPENSE", "ERROR", "ADDR", "MASK")
+
+#-------------------------------------------------------------------------------
+
 def parseVLenFields(fields, verbose=1, level=0):
 
     vfields = {}
@@ -462,7 +505,7 @@ def parseVLenFields(fields, verbose=1, level=0):
     while len(fields) > 1:
         # XXX: strange -- have seen single null byte vfields...
 
-        (ftype, flen) = struct.unpack(">BB", fields[0:2])
+        (ftype, flen) = VLEN_HDR_S.unpack_from(fields, 0)
 
         if not vfields.has_key(ftype):
             vfields[ftype] = []
@@ -479,246 +522,287 @@ def parseVLenFields(fields, verbose=1, level=0):
 
 def parseVLenField(ftype, flen, fval, verbose=1, level=0):
 
-    rv = { "L" : flen,
-           }
+    rv = VLenField(L=flen)
 
     if verbose > 1 and ftype not in (VLEN_FIELDS["Padding"],
                                      VLEN_FIELDS["Null"]):
         print prtbin(level*INDENT, `ftype`+`flen`+fval)
 
-    if ftype in VLEN_FIELDS.keys():
+    if ftype in VLEN_FIELDS:
         if verbose > 0 and ftype not in (VLEN_FIELDS["Padding"],
                                          VLEN_FIELDS["Null"]):
             print level*INDENT +\
                   "field: %s, length: %d" % (VLEN_FIELDS[ftype], flen)
 
-        level = level + 1
-        if   ftype == VLEN_FIELDS["Null"]:
-            pass
+        parser = VLEN_PARSERS.get(ftype)
+        if parser:
+            rv.V = parser(flen, fval, verbose, level+1)
 
-        elif ftype == VLEN_FIELDS["AreaAddress"]:
-            ## 1
-            rv["V"] = []
-            areas = ""
-            while len(fval) > 0:
+        elif verbose > 0:
+            print (level+1)*INDENT + "[ *** %s *** ]" % VLEN_FIELDS[ftype]
 
-                (l,) = struct.unpack("> B", fval[0])
+    else:
+        if verbose > 0:
+            print level*INDENT + \
+                  "[ UNKNOWN ISIS variable length field: ", `ftype`, " ]"
 
-                rv["V"].append(fval[1:1+l])
+    return rv
 
-                areas = areas + '0x' + str2hex(fval[1:1+l]) + ", "
-                fval = fval[1+l:]
+#-------------------------------------------------------------------------------
 
-            if verbose > 0:
-                print level*INDENT + "area addresses: " + areas
-
-        elif ftype == VLEN_FIELDS["LSPIISNeighbor"]:
-            ## 2
-            rv["V"] = []
-            vflag = struct.unpack("> B", fval[0])
-            fval  = fval[1:]
-            cnt   = 0
-            while len(fval) > 0:
-                cnt = cnt + 1
-                default, delay, expense, error, nid =\
-                         struct.unpack("> BBBB 7s", fval[0:11])
-
-                is_neighbour = { 'DEFAULT': default,
-                                 'DELAY'  : delay,
-                                 'EXPENSE': expense,
-                                 'ERROR'  : error,
-                                 'NID'    : nid,
-                                 }
-                rv["V"].append(is_neighbour)
-
-                if verbose > 0:
-                    print level*INDENT +\
-                          "IS Neighbour %d: id: %s" % (cnt, str2hex(nid))
-                    print (level+1)*INDENT +\
-                          "default: %d, delay: %d, expense: %d, error: %d" %\
-                          (default, delay, expense, error)
-
-                fval = fval[11:]
-
-        elif ftype == VLEN_FIELDS["ESNeighbor"]:
-            ## 3
-            default, delay, expense, error = struct.unpack("> 4B", fval[0:4])
-            rv["V"] = { 'DEFAULT' : default,
-                        'DELAY'   : delay,
-                        'EXPENSE' : expense,
-                        'ERROR'   : error,
-                        'NIDS'    : []
-                        }
+def parseVfNull(flen, fval, verbose=1, level=0):
+    ## 0, 8 (Padding)
 
-            if verbose > 0:
-                print level*INDENT +\
-                      "default: %d, delay: %d, expense: %d, error: %d" %\
-                      (default, delay, expense, error)
+    return None
 
-            fval = fval[4:]
-            cnt  = 0
-            while len(fval) > 0:
-                cnt = cnt + 1
-                (nid,) = struct.unpack("> 6s", fval[0:6])
+def parseVfAreaAddress(flen, fval, verbose=1, level=0):
+    ## 1
 
-                rv["V"]["NIDS"].append(nid)
+    rv = []
+    while len(fval) > 0:
 
-                if verbose > 0:
-                    print level*INDENT +\
-                          "ES Neighbour %d: %s" % (cnt, str2hex(nid))
+        (l,) = struct.unpack("> B", fval[0])
 
-                fval = fval[6:]
+        rv.append(fval[1:1+l])
+        fval = fval[1+l:]
 
-        elif ftype == VLEN_FIELDS["IIHIISNeighbor"]:
-            ## 6
-            rv["V"] = []
-            cnt = 0
-            while len(fval) > 0:
-                cnt = cnt + 1
-                (nid,) = struct.unpack("> 6s", fval[0:6])
+    if verbose > 0:
+        areas = ""
+        for area in rv:
+            areas = areas + '0x' + str2hex(area) + ", "
+        print level*INDENT + "area addresses: " + areas
 
-                rv["V"].append(nid)
+    return rv
 
-                if verbose > 0:
-                    print level*INDENT +\
-                          "IS Neighbour %d: %s" % (cnt, str2hex(nid))
+def parseVfLSPIISNeighbor(flen, fval, verbose=1, level=0):
+    ## 2
+
+    rv = []
+    vflag = struct.unpack("> B", fval[0])
+    fval  = fval[1:]
+    cnt   = 0
+    while len(fval) > 0:
+        cnt = cnt + 1
+        default, delay, expense, error, nid = IS_NEIGHBOR_S.unpack(fval[0:11])
+
+        is_neighbour = IsNeighbor(DEFAULT = default,
+                                  DELAY   = delay,
+                                  EXPENSE = expense,
+                                  ERROR   = error,
+                                  NID     = nid,
+                                  )
+        rv.append(is_neighbour)
 
-                fval = fval[6:]
+        if verbose > 0:
+            print level*INDENT +\
+                  "IS Neighbour %d: id: %s" % (cnt, str2hex(nid))
+            print (level+1)*INDENT +\
+                  "default: %d, delay: %d, expense: %d, error: %d" %\
+                  (default, delay, expense, error)
 
-        elif ftype == VLEN_FIELDS["Padding"]:
-            ## 8
-            rv["V"] = None
-
-        elif ftype == VLEN_FIELDS["LSPEntries"]:
-            ## 9
-            rv["V"] = []
-            cnt = 0
-            while len(fval) > 0:
-                cnt = cnt + 1
-                lifetime, lsp_id, lsp_seq_no, cksm =\
-                          struct.unpack("> H 8s L H", fval[:16])
-                lsp_id = struct.unpack("> 6sBB", lsp_id)
-
-                lsp_entry = { "ID"       : lsp_id[0],
-                              "PN"       : lsp_id[1],
-                              "NM"       : lsp_id[2],
-                              "LIFETIME" : lifetime,
-                              "SEQ_NO"   : lsp_seq_no,
-                              "CKSM"     : cksm
-                              }
-
-                rv["V"].append(lsp_entry)
-
-                if verbose > 0:
-                    print level*INDENT +\
-                          "%d: LSP ID: src: %s, pn: %s, LSP no: %d" %\
-                          (cnt, str2hex(lsp_id[0]), int2hex(lsp_id[1]), lsp_id[2])
-                    print (level+1)*INDENT +\
-                          "lifetime: %d, seq.no: %d, cksm: %s" %\
-                          (lifetime, lsp_seq_no, int2hex(cksm))
-
-                fval = fval[16:]
-
-        elif ftype == VLEN_FIELDS["IPIntReach"]:
-            ## 128
-            rv["V"] = []
-            cnt = 0
-            while len(fval) > 0:
-                cnt = cnt + 1
-                default, delay, expense, error, addr, mask =\
-                         struct.unpack("> 4B LL", fval[0:12])
-
-                ipif = { 'DEFAULT': default,
-                         'DELAY'  : delay,
-                         'EXPENSE': expense,
-                         'ERROR'  : error,
-                         'ADDR'   : addr,
-                         'MASK'   : mask
-                         }
-                rv["V"].append(ipif)
-
-                if verbose > 0:
-                    print level*INDENT +\
-                          "%d: default: %d, delay: %d, expense: %d, error: %d" %\
-                          (cnt, default, delay, expense, error)
-                    print (level+1)*INDENT +\
-                          "addr/mask: %s/%s" % (id2str(addr), id2str(mask))
-
-                fval = fval[12:]
+        fval = fval[11:]
 
-        elif ftype == VLEN_FIELDS["ProtoSupported"]:
-            ## 129
-            prots = struct.unpack("> %dB" % flen, fval)
-            prots_strs = map(lambda x: '%s' % x,
-                             map(lambda x: NLPIDS[x], prots))
+    return rv
 
-            rv["V"] = prots_strs
+def parseVfESNeighbor(flen, fval, verbose=1, level=0):
+    ## 3
 
-            if verbose > 0:
-                print level*INDENT + "protocols supported: " + `prots_strs`
-
-        elif ftype == VLEN_FIELDS["IPExtReach"]:
-            ## 130
-            rv["V"] = []
-            cnt = 0
-            while len(fval) > 0:
-                cnt = cnt + 1
-                default, delay, expense, error, addr, mask =\
-                         struct.unpack("> 4B LL", fval[0:12])
-
-                ipif = { 'DEFAULT': default,
-                         'DELAY'  : delay,
-                         'EXPENSE': expense,
-                         'ERROR'  : error,
-                         'ADDR'   : addr,
-                         'MASK'   : mask
-                         }
-                rv["V"].append(ipif)
-
-                if verbose > 0:
-                    print level*INDENT +\
-                          "%d: default: %d, delay: %d, expense: %d, error: %d" %\
-                          (cnt, default, delay, expense, error)
-                    print (level+1)*INDENT +\
-                          "addr/mask: %s/%s" % (id2str(addr), id2str(mask))
-
-                fval = fval[12:]
-
-        elif ftype == VLEN_FIELDS["IPInterDomInfo"]:
-            ## 131
-            rv["V"] = None
+    default, delay, expense, error = METRICS_S.unpack(fval[0:4])
+    rv = EsNeighbors(DEFAULT = default,
+                     DELAY   = delay,
+                     EXPENSE = expense,
+                     ERROR   = error,
+                     NIDS    = []
+                     )
 
-            if verbose > 0:
-                print level*INDENT + "[ IPInterDomInfo ]"
+    if verbose > 0:
+        print level*INDENT +\
+              "default: %d, delay: %d, expense: %d, error: %d" %\
+              (default, delay, expense, error)
 
-        elif ftype == VLEN_FIELDS["IPIfAddr"]:
-            ## 132
-            addrs = struct.unpack("> %dL" % (flen/4, ), fval)
-            addrs_strs = map(lambda x: id2str(x), addrs)
+    fval = fval[4:]
+    cnt  = 0
+    while len(fval) > 0:
+        cnt = cnt + 1
+        nid = fval[0:6]
 
-            rv["V"] = addrs_strs
-            if verbose > 0:
-                print level*INDENT + "interface IP addresses: " + `addrs_strs`
+        rv.NIDS.append(nid)
 
-        elif ftype == VLEN_FIELDS["DynamicHostname"]:
-            ## 137
-            name = struct.unpack("> %ds" % flen, fval)
-            rv["V"] = name
+        if verbose > 0:
+            print level*INDENT +\
+                  "ES Neighbour %d: %s" % (cnt, str2hex(nid))
 
-            if verbose > 0:
-                print level*INDENT + "dynamic hostname: '%s'" % name
+        fval = fval[6:]
 
-        else:
-            if verbose > 0:
-                print level*INDENT + "[ *** %s *** ]" % VLEN_FIELDS[ftype]
+    return rv
+
+def parseVfIIHIISNeighbor(flen, fval, verbose=1, level=0):
+    ## 6
+
+    rv = []
+    cnt = 0
+    while len(fval) > 0:
+        cnt = cnt + 1
+        nid = fval[0:6]
+
+        rv.append(nid)
 
-    else:
         if verbose > 0:
-            print level*INDENT + \
-                  "[ UNKNOWN ISIS variable length field: ", `ftype`, " ]"
+            print level*INDENT +\
+                  "IS Neighbour %d: %s" % (cnt, str2hex(nid))
+
+        fval = fval[6:]
+
+    return rv
+
+def parseVfLSPEntries(flen, fval, verbose=1, level=0):
+    ## 9
+
+    rv = []
+    cnt = 0
+    while len(fval) > 0:
+        cnt = cnt + 1
+        lifetime, lsp_id, lsp_seq_no, cksm = LSP_ENTRY_S.unpack(fval[:16])
+        lsp_id = LSP_ID_S.unpack(lsp_id)
+
+        lsp_entry = LspEntry(ID       = lsp_id[0],
+                             PN       = lsp_id[1],
+                             NM       = lsp_id[2],
+                             LIFETIME = lifetime,
+                             SEQ_NO   = lsp_seq_no,
+                             CKSM     = cksm
+                             )
+
+        rv.append(lsp_entry)
+
+        if verbose > 0:
+            print level*INDENT +\
+                  "%d: LSP ID: src: %s, pn: %s, LSP no: %d" %\
+                  (cnt, str2hex(lsp_id[0]), int2hex(lsp_id[1]), lsp_id[2])
+            print (level+1)*INDENT +\
+                  "lifetime: %d, seq.no: %d, cksm: %s" %\
+                  (lifetime, lsp_seq_no, int2hex(cksm))
+
+        fval = fval[16:]
+
+    return rv
+
+def parseVfIPReach(flen, fval, verbose=1, level=0):
+    ## 128 (IPIntReach), 130 (IPExtReach)
+
+    rv = []
+    cnt = 0
+    while len(fval) > 0:
+        cnt = cnt + 1
+        default, delay, expense, error, addr, mask =\
+                 IP_REACH_S.unpack(fval[0:12])
+
+        ipif = IpReach(DEFAULT = default,
+                       DELAY   = delay,
+                       EXPENSE = expense,
+                       ERROR   = error,
+                       ADDR    = addr,
+                       MASK    = mask
+                       )
+        rv.append(ipif)
+
+        if verbose > 0:
+            print level*INDENT +\
+                  "%d: default: %d, delay: %d, expense: %d, error: %d" %\
+                  (cnt, default, delay, expense, error)
+            print (level+1)*INDENT +\
+                  "addr/mask: %s/%s" % (id2str(addr), id2str(mask))
+
+        fval = fval[12:]
 
     return rv
 
+def parseVfProtoSupported(flen, fval, verbose=1, level=0):
+    ## 129
+
+    prots = struct.unpack("> %dB" % flen, fval)
+    prots = map(lambda x: NLPIDS[x], prots)
+
+    if verbose > 0:
+        print level*INDENT + "protocols supported: " + `prots`
+
+    return prots
+
+def parseVfIPInterDomInfo(flen, fval, verbose=1, level=0):
+    ## 131
+
+    if verbose > 0:
+        print level*INDENT + "[ IPInterDomInfo ]"
+
+    return None
+
+def parseVfIPIfAddr(flen, fval, verbose=1, level=0):
+    ## 132
+
+    addrs = list(struct.unpack("> %dL" % (flen/4, ), fval))
+
+    if verbose > 0:
+        print level*INDENT + "interface IP addresses: " + `map(id2str, addrs)`
+
+    return addrs
+
+def parseVfDynamicHostname(flen, fval, verbose=1, level=0):
+    ## 137
+
+    name = (fval[:flen], )
+
+    if verbose > 0:
+        print level*INDENT + "dynamic hostname: '%s'" % name
+
+    return name
+
+#-------------------------------------------------------------------------------
+
+# Message and variable length field parsers, keyed by type.  A message parser
+# takes (msg_len, msg, verbose, level) and returns a tuple, the elements of
+# which are stored in rv["V"], an instance of the given class, under its keys
+# in order; a field parser takes (flen, fval, verbose, level) and returns the
+# field value.
+
+MSG_PARSERS  = {}
+VLEN_PARSERS = {}
+
+def registerMsg(msg_type, parser, cls=IsisPdu):
+
+    MSG_PARSERS[msg_type] = (parser, cls)
+
+def registerVLenField(ftype, parser):
+
+    VLEN_PARSERS[ftype] = parser
+
+for t in (MSG_TYPES["L1LANHello"], MSG_TYPES["L2LANHello"]):
+    registerMsg(t, parseIsisIsh, IsisHello)
+
+registerMsg(MSG_TYPES["PPHello"], parseIsisPPIsh)
+
+for t in (MSG_TYPES["L1LSP"], MSG_TYPES["L2LSP"]):
+    registerMsg(t, parseIsisLsp, IsisLsp)
+
+for t in (MSG_TYPES["L1CSN"], MSG_TYPES["L2CSN"]):
+    registerMsg(t, parseIsisCsn, IsisCsn)
+
+for t in (MSG_TYPES["L1PSN"], MSG_TYPES["L2PSN"]):
+    registerMsg(t, parseIsisPsn, IsisPsn)
+
+registerVLenField(VLEN_FIELDS["Null"],            parseVfNull)
+registerVLenField(VLEN_FIELDS["AreaAddress"],     parseVfAreaAddress)
+registerVLenField(VLEN_FIELDS["LSPIISNeighbor"],  parseVfLSPIISNeighbor)
+registerVLenField(VLEN_FIELDS["ESNeighbor"],      parseVfESNeighbor)
+registerVLenField(VLEN_FIELDS["IIHIISNeighbor"],  parseVfIIHIISNeighbor)
+registerVLenField(VLEN_FIELDS["Padding"],         parseVfNull)
+registerVLenField(VLEN_FIELDS["LSPEntries"],      parseVfLSPEntries)
+registerVLenField(VLEN_FIELDS["IPIntReach"],      parseVfIPReach)
+registerVLenField(VLEN_FIELDS["ProtoSupported"],  parseVfProtoSupported)
+registerVLenField(VLEN_FIELDS["IPExtReach"],      parseVfIPReach)
+registerVLenField(VLEN_FIELDS["IPInterDomInfo"],  parseVfIPInterDomInfo)
+registerVLenField(VLEN_FIELDS["IPIfAddr"],        parseVfIPIfAddr)
+registerVLenField(VLEN_FIELDS["DynamicHostname"], parseVfDynamicHostname)
+
 ################################################################################
 
 class LLCExc(Exception): pass
@@ -766,7 +850,7 @@ class Isis:
             fields = rx_ish[MAC_HDR_LEN+ISIS_HDR_LEN+ISIS_HELLO_HDR_LEN:]
             while len(fields) > 0:
 
-                (ftype, flen) = struct.unpack(">BB", fields[0:2])
+                (ftype, flen) = VLEN_HDR_S.unpack_from(fields, 0)
                 fval          = fields[2:2+flen]
                 if ftype == VLEN_FIELDS["AreaAddress"]:
                     while len(fval) > 0:
@@ -1060,6 +1144,11 @@ if __name__ == "__main__":
 
     file_pfx  = mrtd.DEFAULT_FILE
     file_sz   = mrtd.DEFAULT_SIZE
+    queue_len = mrtd.QUEUE_LEN
+    compress  = None
+    comp_bg   = 0
+    rot_time  = 0
+    blk_size  = 0
     mrtd_type = None
     area_addr = None
     src_id    = None
@@ -1084,9 +1173,21 @@ if __name__ == "__main__":
         -d|--dump       : Dump MRTd::PROTOCOL_ISIS format
         -y|--dump-isis2 : Dump MRTd::PROTOCOL_ISIS2 format
         -f|--file       : Set file prefix for MRTd dump (def: %s)
-        -z|--size       : Size of output file(s) (min: %d)""" %\
+        -z|--size       : Size of output file(s) (min: %d)
+        -Q|--queue      : Queue up to this many messages for a writer
+                          thread (def: %d, write inline)
+        -r|--rotate-time : Also start a new output file every this many
+                          seconds (def: size only)
+        -c|--compress    : Compress output as it's written (%s)
+        -C|--compress-bg : Compress output files once they're rotated
+                          out (%s)
+        -B|--block-size  : Compress in blocks of this size, with a
+                          block index for seeking; records are written
+                          only as blocks fill, not every second
+                          (def: none)""" %\
             (os.path.basename(sys.argv[0]), Isis._dev_str,
-             mrtd.DEFAULT_FILE, mrtd.MIN_FILE_SZ)
+             mrtd.DEFAULT_FILE, mrtd.MIN_FILE_SZ, mrtd.QUEUE_LEN,
+             string.join(mrtd.COMPRESSORS.keys(), "|"), string.join(mrtd.COMPRESSORS.keys(), "|"))
         sys.exit(0)
 
     #---------------------------------------------------------------------------
@@ -1096,11 +1197,13 @@ if __name__ == "__main__":
 
     try:
         opts, args = getopt.getopt(sys.argv[1:],
-                                   "hqvVdyf:s:l:a:z:i:",
+                                   "hqvVdyf:s:l:a:z:i:Q:c:C:r:B:",
                                    ("help", "quiet", "verbose", "VERBOSE",
                                     "dump", "dump-isis2",
                                     "file-pfx=", "file-size=", "device=",
-                                    "src-id=", "lan-id=", "area-addr=", "ip-addr=" ))
+                                    "src-id=", "lan-id=", "area-addr=", "ip-addr=",
+                                    "queue=", "compress=", "compress-bg=",
+                                    "rotate-time=", "block-size=" ))
     except (getopt.error):
         usage()
 
@@ -1159,6 +1262,21 @@ if __name__ == "__main__":
         elif x in ('-i', '--ip-addr'):
             src_ip = str2id(y)
 
+        elif x in ('-Q', '--queue'):
+            queue_len = string.atoi(y)
+
+        elif x in ('-c', '--compress', '-C', '--compress-bg'):
+            if y not in mrtd.COMPRESSORS:
+                usage()
+            compress = y
+            comp_bg  = x in ('-C', '--compress-bg')
+
+        elif x in ('-r', '--rotate-time'):
+            rot_time = string.atoi(y)
+
+        elif x in ('-B', '--block-size'):
+            blk_size = string.atoi(y)
+
         else:
             usage()
 
@@ -1168,7 +1286,10 @@ if __name__ == "__main__":
         usage()
 
     isis = Isis(Isis._dev_str, area_addr, src_id, lan_id, src_ip)
-    isis._mrtd = mrtd.Mrtd(file_pfx, "w+b", file_sz, mrtd_type, isis)
+    isis._mrtd = mrtd.Mrtd(file_pfx, "w+b", file_sz, mrtd_type, isis,
+                           queue_len=queue_len, compress=compress,
+                           compress_bg=comp_bg, rotate_time=rot_time,
+                           block_size=blk_size)
     if VERBOSE > 1:
         print `isis`
 
@@ -1176,11 +1297,21 @@ if __name__ == "__main__":
         timeout = Isis._holdtimer
         while 1: # main loop
 
+            # wake for the dump's buffer too; see Mrtd.flushDue()
             before  = time.time()
-            rfds, _, _ = select.select([isis._sock], [], [], timeout)
+            wait    = timeout
+            due     = isis._mrtd.flushDue()
+            if due is not None:
+                wait = max(0, min(wait, due - before))
+
+            rfds, _, _ = select.select([isis._sock], [], [], wait)
             after   = time.time()
             elapsed = after - before
 
+            due = isis._mrtd.flushDue()
+            if due is not None and after >= due:
+                isis._mrtd.flush()
+
             if rfds != []:
                 # need to rx pkt(s)
                 rv = isis.parseMsg(VERBOSE, 0)
@@ -1,4 +1,4 @@
-#! /usr/bin/env python2.5
+#! /usr/bin/env python2.7
 
 ##     PyRT: Python Routeing Toolkit
 
@@ -22,7 +22,26 @@
 ##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
 ##     02111-1307 USA
 
-import os, time, struct, getopt, sys, math, pprint, traceback
+import os, time, struct, getopt, sys, math, pprint, traceback, mmap, array
+import threading, Queue, gzip, bz2, zlib, binascii, collections, bisect
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
 
 try:
     import bgp
@@ -55,6 +74,87 @@ MIN_FILE_SZ  = 50*1024
 
 BUF_SZ       = 8192*8
 INDENT       = "    "
+
+# Records written are packed into a buffer, which goes out to the file once
+# it holds FLUSH_BYTES, or FLUSH_MSGS records, or its oldest record is
+# FLUSH_TIME seconds old (0 disables each; with all three disabled, every
+# record goes straight out).  The thresholds are checked as records are
+# written; so that a source gone quiet doesn't leave its last records
+# buffered indefinitely, callers writing inline must also flush() by
+# flushDue() (the writer thread, if any, does so itself).  Flushed data is
+# fsync()ed at most every SYNC_TIME seconds, and always on rotation and
+# close; -1 never does, leaving it to the OS.
+
+FLUSH_BYTES  = BUF_SZ
+FLUSH_MSGS   = 0
+FLUSH_TIME   = 1.0
+SYNC_TIME    = -1
+
+# With QUEUE_LEN > 0, records are handed to a writer thread through a queue
+# of that many records, so that a slow disk or a rotation doesn't hold up
+# the caller (eg. a collector's socket reads); 0 writes in the caller's
+# thread.  When the queue is full, the caller blocks if QUEUE_BLOCK is
+# set, else the record is dropped.  Either is counted; see writerStats().
+
+QUEUE_LEN    = 0
+QUEUE_BLOCK  = 1
+
+# Compressed output, by codec name: (file extension, file class).  Files are
+# either compressed as they're written, or written plain and compressed by a
+# background thread once they've been rotated out (and on close()).
+
+COMPRESSORS = { "gz":  (".gz",  gzip.GzipFile),
+                "bz2": (".bz2", bz2.BZ2File),
+                }
+if lzma:
+    COMPRESSORS["xz"] = (".xz", lzma.LZMAFile)
+
+# Given a block_size, output is instead written as a series of independently
+# compressed blocks of whole records (one gzip member, bzip2 or xz stream
+# each), with a block index alongside (see BIDX_EXTN).  Anything that reads
+# the codec reads the whole file as usual; with the index, Mrtd can seek to
+# a time or offset by inflating only from the block that holds it.  Only
+# full blocks are written until rotation or close, not every FLUSH_MSGS or
+# FLUSH_TIME, so the last block_size of records may be some time reaching
+# the file.  By codec name, the function compressing a block.
+
+BLOCK_SZ     = 256*1024
+
+def gzipBlock(data):
+
+    z = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED,
+                         16+zlib.MAX_WBITS)
+    return z.compress(data) + z.flush()
+
+BLOCK_COMPRESSORS = { "gz":  gzipBlock,
+                      "bz2": bz2.compress,
+                      }
+if lzma:
+    BLOCK_COMPRESSORS["xz"] = lzma.compress
+
+# Compressed input is recognised by its leading magic, whatever the file is
+# called, and inflated a raw INFLATE_SZ block at a time: by codec name,
+# (magic, decompressor factory).
+
+INFLATE_SZ   = 1024*1024
+
+DECOMPRESSORS = { "gz":  ("\x1f\x8b", lambda: zlib.decompressobj(16+zlib.MAX_WBITS)),
+                  "bz2": ("BZh",      bz2.BZ2Decompressor),
+                  }
+if lzma:
+    DECOMPRESSORS["xz"] = ("\xfd7zXZ\x00", lzma.LZMADecompressor)
+
+# bzip2 compresses in independent blocks of up to 900kB, each starting with
+# BZ2_BLOCK_MAGIC and the block's CRC, with BZ2_EOS_MAGIC and the stream CRC
+# after the last; neither is byte aligned.  Given inflate_procs > 1, bzip2
+# input is split at these and the blocks inflated by a pool of that many
+# processes; see Bz2Inflater.
+
+INFLATE_PROCS   = 0
+BZ2_BLOCK_MAGIC = 0x314159265359L
+BZ2_EOS_MAGIC   = 0x177245385090L
+BZ2_MAGIC_BITS  = 48
+
 VERSION      = "3.0"
 
 COMMON_HDR_LEN         = 12
@@ -70,6 +170,42 @@ ISIS2_SUBTYPE_HDR_LEN  = 4
 
 OSPF2_SUBTYPE_HDR_LEN  = 4
 
+# precompiled formats for the per-record paths
+
+COMMON_HDR_S         = struct.Struct(">LHHL")
+TABLE_DUMP_HDR_S     = struct.Struct(">HH")
+BGP_SUBTYPE_HDR_S    = struct.Struct(">HLHL")
+BGP4MP_SUBTYPE_HDR_S = struct.Struct(">HHHH LL")
+BGP4PY_SUBTYPE_HDR_S = struct.Struct(">HHHH LLL")
+STATE_CHANGE_S       = struct.Struct(">HH")
+TS_FRAC_S            = struct.Struct(">L")
+
+# sidecar index: a header giving the size of the MRT file indexed and
+# whether its records were in time order, followed by one fixed-width row
+# per record
+
+INDEX_EXTN     = ".idx"
+INDEX_MAGIC    = "MRTI"
+INDEX_VERSION  = 1
+INDEX_ORDERED  = 0x0001
+
+INDEX_HDR      = ">4sHHQ"  # magic, version, flags, MRT file size
+INDEX_HDR_LEN  = struct.calcsize(INDEX_HDR)
+INDEX_ROW      = ">QLHHL"  # offset, time, type, subtype, length
+INDEX_ROW_LEN  = struct.calcsize(INDEX_ROW)
+
+# block index of a block compressed file (see BLOCK_SZ and README.mrtd)
+
+BIDX_EXTN      = ".bidx"
+BIDX_MAGIC     = "MRTB"
+BIDX_VERSION   = 1
+BIDX_ORDERED   = INDEX_ORDERED
+
+BIDX_HDR       = ">4sHHQ"  # magic, version, flags, compressed file size
+BIDX_HDR_LEN   = struct.calcsize(BIDX_HDR)
+BIDX_ROW       = ">LQQ"    # first time, compressed offset, offset
+BIDX_ROW_LEN   = struct.calcsize(BIDX_ROW)
+
 ################################################################################
 
 DLIST = []
@@ -196,11 +332,49 @@ for d in DLIST:
     for k in d.keys():
         d[ d[k] ] = k
 
+#-------------------------------------------------------------------------------
+
+# Mrtd.batches() decodes BATCH_RECS records of BATCH_TYPES at a time into
+# BATCH_COLUMNS, one row per prefix: (name, array typecode, numpy dtype)
+
+BATCH_RECS    = 65536
+BATCH_TYPES   = (MSG_TYPES["PROTOCOL_BGP"],
+                 MSG_TYPES["PROTOCOL_BGP4MP"],
+                 MSG_TYPES["PROTOCOL_BGP4PY"],
+                 MSG_TYPES["TABLE_DUMP"])
+
+I32_CODE      = [ c for c in "il" if array.array(c).itemsize == 4 ][0]
+BATCH_COLUMNS = (("TIME",      "d",          "float64"),
+                 ("TYPE",      "H",          "uint16"),
+                 ("PEER_AS",   bgp.U32_CODE, "uint32"),
+                 ("PEER_IP",   bgp.U32_CODE, "uint32"),
+                 ("ANNOUNCE",  "B",          "uint8"),
+                 ("PFX",       bgp.U32_CODE, "uint32"),
+                 ("PLEN",      "B",          "uint8"),
+                 ("ORIGIN_AS", bgp.U32_CODE, "uint32"),
+                 ("PATH_ID",   I32_CODE,     "int32"))
+
+#-------------------------------------------------------------------------------
+
+# Record parsers, keyed by MRT type.  A parser is called as parser(mrt,
+# psubtype, plen, pdata, verbose, level) and returns an RV; subtypes, if
+# given, names the subtypes for display.  The Mrtd.parse*Msg() methods are
+# registered for the types supported here, after the class definition.
+
+PARSERS       = {}
+SUBTYPE_NAMES = {}
+
+def registerParser(ptype, parser, subtypes=None):
+
+    PARSERS[ptype] = parser
+    if subtypes is not None:
+        SUBTYPE_NAMES[ptype] = subtypes
+
 ################################################################################
 
 def parseBgp4mpMrtHdr(hdr, verbose=1, level=0):
 
-    src_as, dst_as, ifc, afi, src_ip, dst_ip = struct.unpack(">HHHH LL", hdr)
+    src_as, dst_as, ifc, afi, src_ip, dst_ip = BGP4MP_SUBTYPE_HDR_S.unpack(hdr)
 
     if verbose > 0:
         if afi == bgp.AFI_TYPES["IP"]:
@@ -220,7 +394,7 @@ def parseBgp4mpMrtHdr(hdr, verbose=1, level=0):
 def parseBgp4pyMrtHdr(hdr, verbose=1, level=0):
 
     src_as, dst_as, ifc, afi, src_ip, dst_ip, ts_frac =\
-            struct.unpack(">HHHH LLL", hdr)
+            BGP4PY_SUBTYPE_HDR_S.unpack(hdr)
 
     if verbose > 0:
         if afi == bgp.AFI_TYPES["IP"]:
@@ -231,14 +405,539 @@ def parseBgp4pyMrtHdr(hdr, verbose=1, level=0):
             print level*INDENT + "IP(src): %s, IP(dst): %s" %\
                   (id2str(src_ip), id2str(dst_ip))
         else:
-            print INDENT*LEVEL + "[ UNKNOWN ADDRESS FAMILY", `afi`, "]"
+            print INDENT*level + "[ UNKNOWN ADDRESS FAMILY", `afi`, "]"
 
     return src_as, dst_as, ifc, afi, src_ip, dst_ip, ts_frac
 
+#-------------------------------------------------------------------------------
+
+HDR_PAD = "\000" * (COMMON_HDR_LEN + BGP4PY_SUBTYPE_HDR_LEN)
+
+def padPkt(plen, pkt):
+
+    # pkt as exactly plen octets, as a "%ds" format would have it
+
+    if len(pkt) != plen:
+        pkt = struct.pack("%ds" % plen, pkt)
+    return pkt
+
+#-------------------------------------------------------------------------------
+
+class MrtHdr(Slots):
+
+    # the RV "H" of any MRTD record; each type sets the keys it has (see
+    # README.rv)
+
+    __slots__ = ("TIME", "SRC_AS", "SRC_IP", "DST_AS", "DST_IP", "IFC", "AFI",
+                 "VIEW", "SEQNO")
+
+#-------------------------------------------------------------------------------
+
+def splitRecord(ptype, psubtype, plen, pdata):
+
+    # Decode just the subtype header of a record, as the Mrtd.parse*Msg()
+    # methods would, returning (header, offset) where header is the RV "H"
+    # less the record's own timestamp, and offset locates the BGP PDU in
+    # pdata (None if there isn't one).  header is None if the type isn't
+    # one handled here, or the record is malformed; the caller should fall
+    # back to Mrtd.parse() for these.
+
+    if ptype == MSG_TYPES["PROTOCOL_BGP"]:
+        if psubtype in (BGP_SUBTYPES['BOGO_RIS_EXTN_1'],
+                        BGP_SUBTYPES['BOGO_RIS_EXTN_2']):
+            return (MrtHdr(TIME=0L), None)
+
+        if (len(pdata) < BGP_SUBTYPE_HDR_LEN+bgp.BGP_HDR_LEN or
+            pdata[BGP_SUBTYPE_HDR_LEN:
+                  BGP_SUBTYPE_HDR_LEN+bgp.BGP_MARKER_LEN] != bgp.BGP_MARKER):
+            return (None, None)
+
+        src_as, src_ip, dst_as, dst_ip =\
+                BGP_SUBTYPE_HDR_S.unpack_from(pdata, 0)
+        return (MrtHdr(TIME=0L,
+                       SRC_AS=src_as, SRC_IP=src_ip,
+                       DST_AS=dst_as, DST_IP=dst_ip), BGP_SUBTYPE_HDR_LEN)
+
+    elif ptype == MSG_TYPES["PROTOCOL_BGP4MP"]:
+        hdr = MrtHdr(TIME=0L)
+        if psubtype == BGP4MP_SUBTYPES["STATE_CHANGE"]:
+            if plen != 8:
+                splitBgp4mpHdr(pdata, hdr)
+            return (hdr, None)
+
+        elif psubtype == BGP4MP_SUBTYPES["MESSAGE"]:
+            # see the XXX HACKs in Mrtd.parseBgp4mpMsg()
+            if pdata[0:4+bgp.BGP_MARKER_LEN] == ("\000\000\000\000" +
+                                                 bgp.BGP_MARKER):
+                return (hdr, 4)
+
+            splitBgp4mpHdr(pdata, hdr)
+            return (hdr, BGP4MP_SUBTYPE_HDR_LEN)
+
+        return (hdr, None)
+
+    elif ptype == MSG_TYPES["PROTOCOL_BGP4PY"]:
+        src_as, dst_as, ifc, afi, src_ip, dst_ip, ts_frac =\
+                BGP4PY_SUBTYPE_HDR_S.unpack_from(pdata, 0)
+        hdr = MrtHdr(TIME=ts_frac*0.000001,
+                     SRC_AS=src_as, DST_AS=dst_as,
+                     SRC_IP=src_ip, DST_IP=dst_ip,
+                     IFC=ifc, AFI=afi)
+        if psubtype == BGP4PY_SUBTYPES["MESSAGE"]:
+            return (hdr, BGP4PY_SUBTYPE_HDR_LEN)
+        return (hdr, None)
+
+    elif ptype == MSG_TYPES["TABLE_DUMP"]:
+        view, seqno = TABLE_DUMP_HDR_S.unpack_from(pdata, 0)
+        return (MrtHdr(TIME=0L, VIEW=view, SEQNO=seqno), None)
+
+    return (None, None)
+
+def splitBgp4mpHdr(pdata, hdr):
+
+    (hdr.SRC_AS, hdr.DST_AS, hdr.IFC, hdr.AFI, hdr.SRC_IP, hdr.DST_IP) =\
+            BGP4MP_SUBTYPE_HDR_S.unpack_from(pdata, 0)
+
+#-------------------------------------------------------------------------------
+
+def mkIndex(file_name, index_name=None):
+
+    # walk the common headers only, seeking past each payload, and write one
+    # INDEX_ROW per complete record; a truncated final record is left out
+
+    if not index_name:
+        index_name = file_name + INDEX_EXTN
+
+    f  = open(file_name, "rb")
+    of = open(index_name, "w+b")
+    of.write(struct.pack(INDEX_HDR, INDEX_MAGIC, INDEX_VERSION, 0, 0))
+
+    fsz   = os.fstat(f.fileno()).st_size
+    off   = 0
+    cnt   = 0
+    last  = 0
+    flags = INDEX_ORDERED
+    while off + COMMON_HDR_LEN <= fsz:
+        f.seek(off)
+        ptime, ptype, psubtype, plen =\
+               COMMON_HDR_S.unpack(f.read(COMMON_HDR_LEN))
+        if off + COMMON_HDR_LEN + plen > fsz:
+            break
+
+        if ptime < last:
+            flags = flags & ~INDEX_ORDERED
+        last = ptime
+
+        of.write(struct.pack(INDEX_ROW, off, ptime, ptype, psubtype, plen))
+        off = off + COMMON_HDR_LEN + plen
+        cnt = cnt + 1
+
+    of.seek(0)
+    of.write(struct.pack(INDEX_HDR, INDEX_MAGIC, INDEX_VERSION, flags, fsz))
+    of.close()
+    f.close()
+
+    return cnt
+
 ################################################################################
 
 class EOFExc(Exception): pass
 class ParseExc(Exception): pass
+class CompressExc(Exception): pass
+
+#-------------------------------------------------------------------------------
+
+def compressFile(file_name, compress, block_size=0, keep=0):
+
+    # replace file_name by its compressed version, file_name plus the codec's
+    # extension, block compressed if block_size is given; the original goes
+    # only once that's complete, and not at all if keep is set
+
+    (extn, cls) = COMPRESSORS[compress]
+    tmp_name = file_name + extn + ".tmp"
+
+    if block_size:
+        mrt = Mrtd(file_name, "rb")
+        of  = BlockFile(tmp_name, compress)
+        blk = []
+        n   = 0
+        for msg in mrt:
+            blk.append(str(msg[4]))
+            blk.append(str(msg[5]))
+            n = n + COMMON_HDR_LEN + msg[3]
+            if n >= block_size:
+                of.write("".join(blk))
+                blk = []
+                n   = 0
+        if blk:
+            of.write("".join(blk))
+        of.close()
+        mrt.close()
+
+        os.rename(tmp_name + BIDX_EXTN, file_name + extn + BIDX_EXTN)
+
+    else:
+        inf = open(file_name, "rb")
+        of  = cls(tmp_name, "wb")
+        while 1:
+            data = inf.read(BUF_SZ)
+            if not data:
+                break
+            of.write(data)
+        of.close()
+        inf.close()
+
+    os.rename(tmp_name, file_name + extn)
+    if not keep:
+        os.unlink(file_name)
+
+#-------------------------------------------------------------------------------
+
+class BlockFile:
+
+    # write-only file of independently compressed blocks, one per write(),
+    # which must be given whole records; keeps the block index up to date
+    # as it goes, and completes its header on close()
+
+    def __init__(self, file_name, compress):
+
+        self._compress = BLOCK_COMPRESSORS[compress]
+        self._f        = open(file_name, "wb")
+        self._bf       = open(file_name + BIDX_EXTN, "wb")
+        self._size     = 0
+        self._csize    = 0
+        self._last     = 0
+        self._flags    = BIDX_ORDERED
+
+        self._bf.write(struct.pack(BIDX_HDR, BIDX_MAGIC, BIDX_VERSION, 0, 0))
+
+    def write(self, data):
+
+        if not data:
+            return
+
+        # note whether the records, and so the blocks, are in time order
+
+        off = 0
+        first = None
+        while off < len(data):
+            ptime, ptype, psubtype, plen = COMMON_HDR_S.unpack_from(data, off)
+            if first is None:
+                first = ptime
+            if ptime < self._last:
+                self._flags = self._flags & ~BIDX_ORDERED
+            self._last = ptime
+            off = off + COMMON_HDR_LEN + plen
+
+        blk = self._compress(data)
+        self._f.write(blk)
+        self._bf.write(struct.pack(BIDX_ROW, first, self._csize, self._size))
+
+        self._size  = self._size + len(data)
+        self._csize = self._csize + len(blk)
+
+    def tell(self):
+
+        return self._size
+
+    def flush(self):
+
+        self._f.flush()
+        self._bf.flush()
+
+    def fileno(self):
+
+        return self._f.fileno()
+
+    def close(self):
+
+        self._f.close()
+        self._bf.seek(0)
+        self._bf.write(struct.pack(BIDX_HDR, BIDX_MAGIC, BIDX_VERSION,
+                                   self._flags, self._csize))
+        self._bf.close()
+
+def loadBlockIndex(file_name, f):
+
+    # the rows of file_name's block index, if it has a current one, as
+    # (first time, compressed offset, offset) tuples, and its flags
+
+    try:
+        bf = open(file_name + BIDX_EXTN, "rb")
+    except IOError:
+        return (None, 0)
+
+    try:
+        magic, version, flags, csize =\
+               struct.unpack(BIDX_HDR, bf.read(BIDX_HDR_LEN))
+        if (magic != BIDX_MAGIC or version != BIDX_VERSION or
+            csize != os.fstat(f.fileno()).st_size):
+            return (None, 0)
+
+        data = bf.read()
+        rows = [ struct.unpack_from(BIDX_ROW, data, i)
+                 for i in range(0, len(data) - BIDX_ROW_LEN + 1, BIDX_ROW_LEN) ]
+        return (rows, flags)
+
+    finally:
+        bf.close()
+
+#-------------------------------------------------------------------------------
+
+def openIn(file_name, file_mode="rb", inflate_procs=INFLATE_PROCS):
+
+    # open file_name for reading, decompressing on the fly if it starts with
+    # one of the DECOMPRESSORS' magic
+
+    f = open(file_name, file_mode)
+    magic = f.read(8)
+    f.seek(0)
+
+    for codec, (m, dec) in DECOMPRESSORS.items():
+        if magic[:len(m)] == m:
+            if codec == "bz2" and inflate_procs > 1 and multiprocessing:
+                return Bz2Inflater(f, inflate_procs)
+            return Inflater(f, codec)
+
+    if magic[:6] == "\xfd7zXZ\x00":
+        raise CompressExc, "%s: xz, but there's no lzma module" % file_name
+    return f
+
+class Inflater:
+
+    # a read-only file over a compressed one, enough for Mrtd.read(): raw
+    # blocks are read and inflated as needed.  Streams concatenated into
+    # one file (multi-member gzip, parallel bzip2, ...) are read through,
+    # and trailing NUL padding ignored.
+
+    def __init__(self, f, codec):
+
+        self._f     = f
+        self._codec = codec
+        self._mkdec = DECOMPRESSORS[codec][1]
+        self._dec   = self._mkdec()
+        self._buf   = ""
+        self._off   = 0
+        self._pos   = 0
+        self._eof   = 0
+
+    def inflate(self):
+
+        data = self._f.read(INFLATE_SZ)
+        if not data:
+            self._eof = 1
+            if hasattr(self._dec, "flush"):
+                return self._dec.flush()
+            return ""
+
+        out = []
+        while data:
+            try:
+                out.append(self._dec.decompress(data))
+            except (EOFError):
+                self._dec = self._mkdec()
+                continue
+
+            data = self._dec.unused_data
+            if data:
+                if not data.lstrip("\x00"):
+                    break
+                self._dec = self._mkdec()
+
+        return "".join(out)
+
+    def read(self, n=-1):
+
+        while not self._eof and (n < 0 or len(self._buf) - self._off < n):
+            self._buf = self._buf[self._off:] + self.inflate()
+            self._off = 0
+
+        if n < 0:
+            n = len(self._buf) - self._off
+        rv = self._buf[self._off:self._off+n]
+        self._off = self._off + len(rv)
+        self._pos = self._pos + len(rv)
+
+        return rv
+
+    def tell(self):
+
+        return self._pos
+
+    def seek(self, off, whence=0):
+
+        # forwards only, by reading; backwards starts again
+
+        if whence == 1:
+            off = self._pos + off
+        elif whence != 0:
+            raise IOError, "can't seek from the end of a compressed file"
+
+        if off < self._pos:
+            self.restart()
+
+        while self._pos < off:
+            if not self.read(min(off - self._pos, INFLATE_SZ)):
+                break
+
+    def restart(self):
+
+        self.seekBlock(0, 0)
+
+    def seekBlock(self, coff, off):
+
+        # start inflating afresh from compressed offset coff, the start of
+        # a stream that inflates to the data from offset off on
+
+        self._f.seek(coff)
+        self._dec = self._mkdec()
+        self._buf = ""
+        self._off = 0
+        self._pos = off
+        self._eof = 0
+
+    def fileno(self):
+
+        return self._f.fileno()
+
+    def close(self):
+
+        self._f.close()
+
+#-------------------------------------------------------------------------------
+
+def findBits(data, magic, nbits=BZ2_MAGIC_BITS):
+
+    # the bit offsets in data of every occurrence of the nbits-long magic:
+    # for each of the 8 alignments, search for the whole octets the magic
+    # must cover, and check the bits at either end
+
+    rv   = []
+    mask = (1L << nbits) - 1
+    for shift in range(8):
+        nbytes = (shift + nbits + 7) / 8
+        val    = magic << (nbytes*8 - shift - nbits)
+        pat    = binascii.unhexlify("%0*x" % (nbytes*2, val))[1:-1]
+        i = data.find(pat, 1)
+        while i >= 0:
+            k = i - 1
+            if k + nbytes <= len(data):
+                w = long(binascii.hexlify(data[k:k+nbytes]), 16)
+                if (w >> (nbytes*8 - shift - nbits)) & mask == magic:
+                    rv.append(k*8 + shift)
+            i = data.find(pat, i + 1)
+
+    rv.sort()
+    return rv
+
+def inflateBz2Block(args):
+
+    # inflate one bzip2 block, cut out of its stream: data holds the nbits
+    # from bit shift of its first octet on.  Rebuild a stream of just this
+    # block, whose stream CRC is the block CRC, and decompress that; None if
+    # that doesn't work out.  Runs in the Bz2Inflater's worker processes.
+
+    data, shift, nbits = args
+    try:
+        w     = long(binascii.hexlify(data), 16)
+        block = (w >> (len(data)*8 - shift - nbits)) & ((1L << nbits) - 1)
+        crc   = (block >> (nbits - BZ2_MAGIC_BITS - 32)) & 0xffffffffL
+
+        n   = nbits + BZ2_MAGIC_BITS + 32
+        pad = -n % 8
+        w   = ((((block << BZ2_MAGIC_BITS) | BZ2_EOS_MAGIC) << 32) | crc) << pad
+        stream = "BZh9" + binascii.unhexlify("%0*x" % ((n+pad)/4, w))
+
+        return bz2.decompress(stream)
+
+    except (IOError, EOFError, ValueError):
+        return None
+
+class Bz2Inflater(Inflater):
+
+    # an Inflater for bzip2 that inflates blocks in parallel: find every
+    # block and end of stream marker in the (mapped) file, and hand each
+    # block, from its marker to the next, to a pool of processes, keeping up
+    # to 2 per process in flight.  Results come back in file order.  A block
+    # that fails to inflate most likely held a spurious marker, so it's
+    # retried running on to the marker after that.
+
+    def __init__(self, f, procs):
+
+        Inflater.__init__(self, f, "bz2")
+        self._procs = procs
+        self._pool  = None
+
+        try:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (EnvironmentError, ValueError):
+            self._map = ""
+
+        self._ends   = findBits(self._map, BZ2_BLOCK_MAGIC)
+        blocks       = dict.fromkeys(self._ends)
+        self._ends   = self._ends + findBits(self._map, BZ2_EOS_MAGIC)
+        self._ends.append(len(self._map)*8)
+        self._ends.sort()
+        self._blocks = [ (self._ends[i], self._ends[i+1])
+                         for i in range(len(self._ends)-1)
+                         if self._ends[i] in blocks ]
+        self._starts = [ start for (start, end) in self._blocks ]
+
+        self.restart()
+
+    def segment(self, start, end):
+
+        return (self._map[start/8:(end+7)/8], start % 8, end - start)
+
+    def seekBlock(self, coff, off):
+
+        Inflater.seekBlock(self, coff, off)
+        self._next    = bisect.bisect_left(self._starts, coff*8)
+        self._pending = collections.deque()
+
+    def inflate(self):
+
+        if not self._pool:
+            self._pool = multiprocessing.Pool(self._procs)
+
+        while (self._next < len(self._blocks) and
+               len(self._pending) < 2*self._procs):
+            start, end = self._blocks[self._next]
+            self._pending.append(
+                (start, end, self._pool.apply_async(inflateBz2Block,
+                                                    (self.segment(start, end),))))
+            self._next = self._next + 1
+
+        if not self._pending:
+            self._eof = 1
+            return ""
+
+        start, end, res = self._pending.popleft()
+        rv = res.get()
+        while rv is None:
+            i = bisect.bisect_right(self._ends, end)
+            if i >= len(self._ends):
+                raise IOError, "corrupt bzip2 data at bit %d" % start
+
+            end = self._ends[i]
+            while self._pending and self._pending[0][0] < end:
+                self._pending.popleft()
+            while (self._next < len(self._blocks) and
+                   self._blocks[self._next][0] < end):
+                self._next = self._next + 1
+
+            rv = inflateBz2Block(self.segment(start, end))
+
+        return rv
+
+    def close(self):
+
+        if self._pool:
+            self._pool.terminate()
+            self._pool = None
+        if self._map:
+            self._map.close()
+        Inflater.close(self)
 
 #-------------------------------------------------------------------------------
 
@@ -247,7 +946,12 @@ class Mrtd:
     _extn_fmt = ".%Y-%m-%d_%H.%M.%S"
 
     def __init__(self, file_pfx=DEFAULT_FILE, file_mode="w+b",
-                 file_size=None, mrt_type=None, msg_src=None):
+                 file_size=None, mrt_type=None, msg_src=None, file_mmap=1,
+                 flush_bytes=FLUSH_BYTES, flush_msgs=FLUSH_MSGS,
+                 flush_time=FLUSH_TIME, sync_time=SYNC_TIME,
+                 queue_len=QUEUE_LEN, queue_block=QUEUE_BLOCK,
+                 compress=None, compress_bg=0, rotate_time=0,
+                 inflate_procs=INFLATE_PROCS, block_size=0):
 
         self._mrt_type  = mrt_type
         self._msg_src   = msg_src # message source object, typed by mrt_type
@@ -256,14 +960,98 @@ class Mrtd:
         if not mrt_type:
             self._file_name = file_pfx
         else:
-            self._file_name = file_pfx +\
-                              time.strftime(Mrtd._extn_fmt, time.gmtime())
+            self._file_name = self.newName()
 
         self._file_size = file_size
         self._file_mode = file_mode
 
-        self._of        = open(self._file_name, file_mode)
+        # output compression, inline or in the background (see COMPRESSORS),
+        # and rotation every rotate_time seconds as well as by size
+
+        if compress and compress not in COMPRESSORS:
+            raise CompressExc, compress
+
+        self._compress    = compress
+        self._compress_bg = compress_bg
+        self._compressor  = None
+        self._cqueue      = None
+        self._cqueued     = None   # the last file handed to the compressor
+        self._rotate_time = rotate_time
+        self._period      = None
+
+        # block compression, and the block index if reading such a file
+
+        self._block_size  = block_size
+        self._bidx        = None
+        self._bidx_flags  = 0
+        if block_size:
+            # a block goes out only once full (or on rotation or close):
+            # flushing by count or time would cut it short
+            self._compress = compress or "gz"
+            flush_bytes    = block_size
+            flush_msgs     = 0
+            flush_time     = 0
+
+        if file_mode in ("r", "rb"):
+            self._of = openIn(self._file_name, file_mode, inflate_procs)
+            if isinstance(self._of, Inflater):
+                (self._bidx, self._bidx_flags) =\
+                             loadBlockIndex(self._file_name, self._of)
+                self._boffs = [ row[2] for row in self._bidx or () ]
+        else:
+            self.openOut()
         self._read      = ""
+        self._roff      = 0
+        self._attrs     = None   # path attribute projection; see parse()
+
+        # write buffer, and the policy for emptying it; see FLUSH_BYTES
+
+        self._of_size     = self._of.tell() # including what's buffered
+        self._wbuf        = array.array('c')
+        self._wmsgs       = 0
+        self._wtime       = 0
+        self._flush_bytes = flush_bytes
+        self._flush_msgs  = flush_msgs
+        self._flush_time  = flush_time
+        self._sync_time   = sync_time
+        self._synced      = time.time()
+
+        # the writer thread, if any, and its queue of (method, args)
+
+        self._queue       = None
+        self._queue_block = queue_block
+        self._writer      = None
+        self._werr        = None
+        self._wstats      = { "QUEUED":    0,
+                              "DROPPED":   0,
+                              "BLOCKED":   0,
+                              "MAX_DEPTH": 0,
+                              "WRITTEN":   0,
+                              }
+
+        if queue_len > 0 and file_mode not in ("r", "rb"):
+            self._queue  = Queue.Queue(queue_len)
+            self._writer = threading.Thread(target=self.writer,
+                                            name="mrtd writer")
+            self._writer.setDaemon(1)
+            self._writer.start()
+
+        # when reading, try to map the whole file: read() then hands back
+        # buffer() views onto the mapping rather than copying the data out;
+        # fall back to buffered reads if the file can't be mapped (empty
+        # file, pipe, ...)
+
+        self._map       = None
+        self._map_len   = 0
+        self._map_off   = 0
+
+        if file_mmap and file_mode in ("r", "rb") and type(self._of) is file:
+            try:
+                self._map = mmap.mmap(self._of.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+                self._map_len = len(self._map)
+            except (EnvironmentError, ValueError):
+                self._map = None
 
     def __repr__(self):
 
@@ -292,48 +1080,525 @@ class Mrtd:
 
     def close(self):
         # XXX RMM XXX this should possibly be __del__() method?
+        if self._writer:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+            self._queue  = None
+
         try:
-            self._of.flush()
+            self.flushBuf(1)
             self._of.close()
         except IOError:
             pass
 
+        if self._compress_bg and self._file_mode not in ("r", "rb"):
+            self.compressLater(self._file_name)
+            self._cqueue.put(None)
+            self._compressor.join()
+            self._compressor = None
+
+        # NB. don't close() the mapping: buffers handed out by read() may
+        # still refer to it; it goes away with the last of them
+        self._map = None
+
     def write(self, msg):
 
-        if self._of.tell() + len(msg) > self._file_size:
+        # write a whole record, already packed
+
+        if self._queue:
+            self.enqueue(self.packMsg, (time.time(), msg))
+        else:
+            self.packMsg(time.time(), msg)
+
+    def writeRec(self, ts, subtype, sub_s, sub_vals, pkt):
+
+        # write a record of our type and the given subtype, timestamped ts:
+        # the subtype header is packed from sub_vals by sub_s (or is absent,
+        # if sub_s is None), then the payload, pkt.  Both headers are packed
+        # in place in the write buffer, so pkt is copied into it just once.
+
+        if self._queue:
+            self.enqueue(self.packRec, (ts, subtype, sub_s, sub_vals, pkt))
+        else:
+            self.packRec(ts, subtype, sub_s, sub_vals, pkt)
+
+    def packMsg(self, ts, msg):
+
+        self.rotate(len(msg), ts)
+        self._wbuf.fromstring(msg)
+        self.written(len(msg), ts)
+
+    def packRec(self, ts, subtype, sub_s, sub_vals, pkt):
+
+        hdr_len = COMMON_HDR_LEN
+        if sub_s:
+            hdr_len = hdr_len + sub_s.size
+        rec_len = hdr_len + len(pkt)
+
+        self.rotate(rec_len, ts)
+
+        buf = self._wbuf
+        off = len(buf)
+        buf.fromstring(HDR_PAD[:hdr_len])
+        COMMON_HDR_S.pack_into(buf, off, int(ts), self._mrt_type, subtype,
+                               rec_len-COMMON_HDR_LEN)
+        if sub_s:
+            sub_s.pack_into(buf, off+COMMON_HDR_LEN, *sub_vals)
+        buf.fromstring(pkt)
+
+        self.written(rec_len, ts)
+
+    def written(self, n, now):
+
+        # account for n more octets buffered, and flush if that's due
+
+        self._of_size = self._of_size + n
+        if self._wmsgs == 0:
+            self._wtime = now
+        self._wmsgs = self._wmsgs + 1
+        self._wstats["WRITTEN"] = self._wstats["WRITTEN"] + 1
+
+        if ((self._flush_bytes and len(self._wbuf) >= self._flush_bytes) or
+            (self._flush_msgs and self._wmsgs >= self._flush_msgs) or
+            (self._flush_time and now - self._wtime >= self._flush_time) or
+            not (self._flush_bytes or self._flush_msgs or self._flush_time)):
+            self.flushBuf()
+
+    def flush(self, sync=0):
+
+        if self._queue:
+            self.enqueue(self.flushBuf, (sync, ))
+        else:
+            self.flushBuf(sync)
+
+    def flushDue(self):
+
+        # when the oldest record buffered will have waited flush_time, and so
+        # flush() is due; None if there's nothing buffered, or no time
+        # limit, or the writer thread's seeing to it
+
+        if self._queue or not (self._wmsgs and self._flush_time):
+            return None
+        return self._wtime + self._flush_time
+
+    def flushBuf(self, sync=0):
+
+        # write out the buffer, and fsync() if sync is set or SYNC_TIME says
+        # it's time to
+
+        # (compressed files can't take the array directly, and mayn't
+        # flush or have a descriptor to sync)
+
+        if self._wmsgs:
+            if type(self._of) is file:
+                self._wbuf.tofile(self._of)
+            else:
+                self._of.write(self._wbuf.tostring())
+            del self._wbuf[:]
+            self._wmsgs = 0
+
+        if hasattr(self._of, "flush"):
+            self._of.flush()
+
+        if self._sync_time >= 0 and hasattr(self._of, "fileno"):
+            now = time.time()
+            if sync or now - self._synced >= self._sync_time:
+                os.fsync(self._of.fileno())
+                self._synced = now
+
+    def rotate(self, n, now):
+
+        # start a new file if another n octets would overflow this one, or
+        # a new rotate_time period has started; periods are aligned to
+        # multiples of rotate_time since the epoch, so rotate_time=900
+        # rotates on the quarter hour
+
+        if (self._of_size + n > self._file_size or
+            (self._rotate_time and
+             int(now / self._rotate_time) != self._period)):
+
+            self.flushBuf(1)
             self._of.close()
-            self._file_name = self._file_pfx +\
-                              time.strftime(Mrtd._extn_fmt, time.gmtime())
+            if self._compress_bg:
+                self.compressLater(self._file_name)
+
+            self._file_name = self.newName()
+            self.openOut()
+            self._of_size = 0
+
+    def newName(self):
+
+        # a name for the next output file: the prefix and the time, plus a
+        # sequence number if that's taken (eg. rotating twice in a second),
+        # as reopening it would truncate it, and compressing it twice fail
+
+        stem = self._file_pfx + time.strftime(Mrtd._extn_fmt, time.gmtime())
+        name = stem
+        seq  = 0
+        while self.nameTaken(name):
+            seq  = seq + 1
+            name = "%s.%d" % (stem, seq)
+
+        return name
+
+    def nameTaken(self, name):
+
+        if os.path.exists(name):
+            return 1
+        for (extn, cls) in COMPRESSORS.values():
+            if (os.path.exists(name + extn) or
+                os.path.exists(name + extn + ".tmp")):
+                return 1
+        return 0
+
+    def openOut(self):
+
+        # open self._file_name for writing, compressing inline if so asked
+
+        if self._compress and not self._compress_bg:
+            (extn, cls) = COMPRESSORS[self._compress]
+            self._file_name = self._file_name + extn
+            if self._block_size:
+                self._of = BlockFile(self._file_name, self._compress)
+            else:
+                self._of = cls(self._file_name, "wb")
+        else:
             self._of = open(self._file_name, self._file_mode)
 
-        self._of.write(msg)
-        self._of.flush()
+        if self._rotate_time:
+            self._period = int(time.time() / self._rotate_time)
+
+    #---------------------------------------------------------------------------
+
+    def compressLater(self, file_name):
+
+        # hand a finished file to the compressor thread, starting it first
+        # if need be; each file just the once
+
+        if file_name == self._cqueued:
+            return
+        self._cqueued = file_name
+
+        if not self._compressor:
+            self._cqueue     = Queue.Queue()
+            self._compressor = threading.Thread(target=self.compressor,
+                                                name="mrtd compressor")
+            self._compressor.setDaemon(1)
+            self._compressor.start()
+
+        self._cqueue.put(file_name)
+
+    def compressor(self):
+
+        # the compressor thread: compress files as they're finished with,
+        # until close() queues None
+
+        while 1:
+            file_name = self._cqueue.get()
+            if file_name is None:
+                break
+
+            try:
+                compressFile(file_name, self._compress, self._block_size)
+            except EnvironmentError, e:
+                error("[ *** compressing %s: %s *** ]\n" % (file_name, e))
+
+    #---------------------------------------------------------------------------
+
+    def enqueue(self, fn, args):
+
+        # hand fn(*args) to the writer thread
+
+        if self._werr:
+            raise self._werr
+
+        q = self._queue
+        try:
+            q.put_nowait((fn, args))
+
+        except Queue.Full:
+            if not self._queue_block:
+                self._wstats["DROPPED"] = self._wstats["DROPPED"] + 1
+                return
+
+            self._wstats["BLOCKED"] = self._wstats["BLOCKED"] + 1
+            q.put((fn, args))
+
+        self._wstats["QUEUED"] = self._wstats["QUEUED"] + 1
+        depth = q.qsize()
+        if depth > self._wstats["MAX_DEPTH"]:
+            self._wstats["MAX_DEPTH"] = depth
+
+    def writer(self):
+
+        # the writer thread: apply queued writes until close() queues None.
+        # Being the only thread that touches the file, it can also flush
+        # records that have sat in the buffer for flush_time while the
+        # queue is idle.  After an error, it goes on draining the queue so
+        # that no caller is left blocked; the error is raised to the next
+        # caller of enqueue().
+
+        q = self._queue
+        while 1:
+            timeout = None
+            if self._wmsgs and self._flush_time:
+                timeout = max(0, self._wtime+self._flush_time - time.time())
+
+            try:
+                item = q.get(1, timeout)
+            except Queue.Empty:
+                item = (self.flushBuf, ())
+
+            if item is None:
+                break
+
+            if self._werr:
+                continue
+
+            (fn, args) = item
+            try:
+                fn(*args)
+            except EnvironmentError, e:
+                self._werr = e
+
+    def writerStats(self):
+
+        # counters for the write path: records queued, dropped (queue full,
+        # queue_block unset) and blocked (queue full, queue_block set), the
+        # current and greatest queue depth, and records written
+
+        stats = self._wstats.copy()
+        stats["DEPTH"] = 0
+        if self._queue:
+            stats["DEPTH"] = self._queue.qsize()
+        return stats
 
     def read(self):
 
-        if len(self._read) < COMMON_HDR_LEN:
-            self._read = self._read + self._of.read(BUF_SZ)
-            if len(self._read) < COMMON_HDR_LEN:
-                raise EOFExc
+        if self._map is not None:
+            return self.readMap()
+
+        # records are sliced out of self._read from self._roff on, so the
+        # unread remainder is only copied when the buffer's refilled
+
+        off = self._roff
+        if len(self._read) - off < COMMON_HDR_LEN:
+            self.fill(COMMON_HDR_LEN)
+            off = 0
 
         ptime, ptype, psubtype, plen =\
-               struct.unpack(">LHHL", self._read[:COMMON_HDR_LEN])
+               COMMON_HDR_S.unpack_from(self._read, off)
         plen = int(plen)
 
-        phdr       = self._read[:COMMON_HDR_LEN]
-        self._read = self._read[COMMON_HDR_LEN:]
+        end = off + COMMON_HDR_LEN + plen
+        if len(self._read) < end:
+            self.fill(COMMON_HDR_LEN + plen)
+            off = 0
+            end = COMMON_HDR_LEN + plen
+
+        phdr       = self._read[off:off+COMMON_HDR_LEN]
+        pdata      = self._read[off+COMMON_HDR_LEN:end]
+        self._roff = end
+
+        return (ptime, ptype, psubtype, plen, phdr, pdata)
+
+    def fill(self, n):
 
-        if len(self._read) < plen:
-            self._read = self._read + self._of.read(BUF_SZ)
-            if len(self._read) < plen:
+        # read until there are at least n unread octets buffered
+
+        rd = self._read[self._roff:]
+        self._roff = 0
+        while len(rd) < n:
+            data = self._of.read(max(BUF_SZ, n - len(rd)))
+            if not data:
+                self._read = rd
                 raise EOFExc
+            rd = rd + data
+        self._read = rd
+
+    def readMap(self):
+
+        off = self._map_off
+        if off + COMMON_HDR_LEN > self._map_len:
+            raise EOFExc
+
+        ptime, ptype, psubtype, plen =\
+               COMMON_HDR_S.unpack_from(self._map, off)
+        plen = int(plen)
+
+        if off + COMMON_HDR_LEN + plen > self._map_len:
+            raise EOFExc
 
-        pdata      = self._read[:plen]
-        self._read = self._read[plen:]
+        phdr  = buffer(self._map, off, COMMON_HDR_LEN)
+        pdata = buffer(self._map, off+COMMON_HDR_LEN, plen)
+        self._map_off = off + COMMON_HDR_LEN + plen
 
         return (ptime, ptype, psubtype, plen, phdr, pdata)
 
-    def parse(self, msg, verbose=1, level=0):
+    def seek(self, off):
+
+        # with a block index, inflate only from the start of off's block
+
+        if self._map is not None:
+            self._map_off = off
+        else:
+            if self._bidx:
+                i = bisect.bisect_right(self._boffs, off) - 1
+                if i >= 0 and not (self._bidx[i][2] <= self._of.tell() <= off):
+                    self._of.seekBlock(self._bidx[i][1], self._bidx[i][2])
+            self._of.seek(off)
+            self._read = ""
+            self._roff = 0
+
+    def seekTime(self, t):
+
+        # position the reader at the first record stamped at or after t,
+        # using the sidecar index if there is a current one for this file
+        # and it says the records are in time order; returns 1 if so, 0 if
+        # the reader was left where it was
+
+        if self._bidx:
+            # block compressed: start at the block before the first that
+            # starts at or after t, as that may end with records from t on
+
+            if not (self._bidx_flags & BIDX_ORDERED):
+                return 0
+
+            i = bisect.bisect_left([ row[0] for row in self._bidx ], t)
+            self.seek(self._bidx[max(i-1, 0)][2])
+            return 1
+
+        try:
+            f = open(self._file_name + INDEX_EXTN, "rb")
+        except IOError:
+            return 0
+
+        try:
+            magic, version, flags, fsz =\
+                   struct.unpack(INDEX_HDR, f.read(INDEX_HDR_LEN))
+            if (magic != INDEX_MAGIC or version != INDEX_VERSION or
+                not (flags & INDEX_ORDERED) or
+                fsz != os.fstat(self._of.fileno()).st_size):
+                return 0
+
+            f.seek(0, 2)
+            lo, hi = 0, (f.tell() - INDEX_HDR_LEN) / INDEX_ROW_LEN
+            end = hi
+            while lo < hi:
+                mid = (lo + hi) / 2
+                f.seek(INDEX_HDR_LEN + mid*INDEX_ROW_LEN)
+                off, ptime, ptype, psubtype, plen =\
+                     struct.unpack(INDEX_ROW, f.read(INDEX_ROW_LEN))
+                if ptime < t: lo = mid + 1
+                else:         hi = mid
+
+            if lo < end:
+                f.seek(INDEX_HDR_LEN + lo*INDEX_ROW_LEN)
+                (off, ) = struct.unpack(">Q", f.read(8))
+            else:
+                off = fsz
+
+            self.seek(off)
+            return 1
+
+        finally:
+            f.close()
+
+    #---------------------------------------------------------------------------
+
+    def __iter__(self):
+
+        return self.records()
+
+    def records(self, types=None, start_t=-1, end_t=-1):
+
+        # generate the records read(), passing only those whose type is in
+        # types (if given) and whose timestamp falls in [start_t, end_t] (< 0
+        # meaning unbounded).  Filtering is on the common header alone, so
+        # nothing is decoded for records that are dropped.  If there's an
+        # index, start by seeking to start_t, and stop at the first record
+        # after end_t.
+
+        indexed = 0
+        if start_t >= 0:
+            indexed = self.seekTime(start_t)
+
+        try:
+            while 1:
+                msg = self.read()
+
+                if end_t >= 0 and msg[0] > end_t:
+                    if indexed:
+                        return
+                    continue
+
+                if start_t >= 0 and msg[0] < start_t:
+                    continue
+
+                if types is not None and msg[1] not in types:
+                    continue
+
+                yield msg
+
+        except (EOFExc):
+            return
+
+    def rvs(self, types=None, start_t=-1, end_t=-1, verbose=0, level=0,
+            attrs=None):
+
+        # as records(), but generate the parsed RVs
+
+        for msg in self.records(types, start_t, end_t):
+            yield self.parse(msg, verbose, level, attrs)
+
+    def lazyRvs(self, types=None, start_t=-1, end_t=-1):
+
+        # as rvs(), but generate Records, which decode only what's asked of
+        # them
+
+        for msg in self.records(types, start_t, end_t):
+            yield Record(self, msg)
+
+    def batches(self, n=BATCH_RECS, types=None, start_t=-1, end_t=-1,
+                afi=bgp.AFI_TYPES["IP"]):
+
+        # as records(), but decode n records at a time into a dictionary of
+        # numpy arrays, one per column of BATCH_COLUMNS, with a row for each
+        # prefix of the given address family withdrawn or announced by an
+        # UPDATE, or in a TABLE_DUMP entry (IPv4 only); see Batch
+
+        if numpy is None:
+            raise ImportError, "Mrtd.batches() needs numpy"
+        if types is None:
+            types = BATCH_TYPES
+
+        batch = Batch(afi)
+        cnt   = 0
+        for msg in self.records(types, start_t, end_t):
+            if msg[1] == MSG_TYPES["TABLE_DUMP"]:
+                batch.addTableDump(self.parse(msg, 0, 0, Batch.ATTRS))
+            else:
+                batch.addUpdate(Record(self, msg))
+
+            cnt = cnt + 1
+            if cnt >= n:
+                if len(batch):
+                    yield batch.arrays()
+                batch = Batch(afi)
+                cnt   = 0
+
+        if len(batch):
+            yield batch.arrays()
+
+    #---------------------------------------------------------------------------
+
+    def parse(self, msg, verbose=1, level=0, attrs=None):
+
+        # attrs, if given, is the set of path attribute type codes to decode
+        # from BGP UPDATEs and TABLE_DUMP entries, the rest being skipped
+        # (bgp.NLRI_ONLY skips them all); see bgp.decodeAttrs().  The
+        # parsers find it in self._attrs
 
         (ptime, ptype, psubtype, plen, phdr, pdata) = msg
 
@@ -347,26 +1612,9 @@ class Mrtd:
                   (plen, MSG_TYPES.get(ptype, "UNKNOWN (%d)" % (ptype,))),
 
             try:
-                if   ptype == MSG_TYPES["PROTOCOL_BGP4MP"]:
-                    print BGP4MP_SUBTYPES[psubtype]
-
-                elif ptype == MSG_TYPES["PROTOCOL_BGP4PY"]:
-                    print BGP4MP_SUBTYPES[psubtype]
-
-                elif ptype == MSG_TYPES["PROTOCOL_BGP"]:
-                    print BGP_SUBTYPES[psubtype]
-
-                elif ptype == MSG_TYPES["PROTOCOL_ISIS"]:
-                    print ISIS_SUBTYPES[psubtype]
-
-                elif ptype == MSG_TYPES["PROTOCOL_ISIS2"]:
-                    print ISIS_SUBTYPES[psubtype]
-
-                elif ptype == MSG_TYPES["PROTOCOL_OSPF2"]:
-                    print OSPF_SUBTYPES[psubtype]
-
-                elif ptype == MSG_TYPES["TABLE_DUMP"]:
-                    print TABLE_DUMP_SUBTYPES[psubtype]
+                subtypes = SUBTYPE_NAMES.get(ptype)
+                if subtypes is not None:
+                    print subtypes[psubtype]
 
             except (KeyError):
                 if verbose:
@@ -374,29 +1622,16 @@ class Mrtd:
                           '[ *** Unsupported subtype: %d *** ]' % psubtype
                     return None
 
-        if   ptype == MSG_TYPES["PROTOCOL_BGP"]:
-            rv = self.parseBgpMsg(psubtype, plen, pdata, verbose, level+1)
-
-        elif ptype == MSG_TYPES["PROTOCOL_BGP4MP"]:
-            rv = self.parseBgp4mpMsg(psubtype, plen, pdata, verbose, level+1)
-
-        elif ptype == MSG_TYPES["PROTOCOL_BGP4PY"]:
-            rv = self.parseBgp4pyMsg(psubtype, plen, pdata, verbose, level+1)
-
-        elif ptype == MSG_TYPES["PROTOCOL_ISIS"]:
-            rv = self.parseIsisMsg(plen, pdata, verbose, level+1)
-
-        elif ptype == MSG_TYPES["PROTOCOL_ISIS2"]:
-            rv = self.parseIsis2Msg(plen, pdata, verbose, level+1)
-
-        elif ptype == MSG_TYPES["PROTOCOL_OSPF2"]:
-            rv = self.parseOspfMsg(plen, pdata, verbose, level+1)
-
-        elif ptype == MSG_TYPES["TABLE_DUMP"]:
-            rv = self.parseTableDump(psubtype, plen, pdata, verbose, level+1)
+        parser = PARSERS.get(ptype)
+        if parser:
+            self._attrs = attrs
+            try:
+                rv = parser(self, psubtype, plen, pdata, verbose, level+1)
+            finally:
+                self._attrs = None
 
         else:
-            rv = {"T": None, "L": 0, "V": None, "H": {"TIME":0L}}
+            rv = Rv(T=None, L=0, V=None, H=MrtHdr(TIME=0L))
             if verbose:
                 print level*INDENT +\
                       "[ *** Unsupported message type [ '%s' ] *** ]" %\
@@ -415,39 +1650,37 @@ class Mrtd:
     def mkHdr(self, subtype, msg_len):
 
         ts = time.time()
-        hdr = struct.pack(">LHHL", int(ts), self._mrt_type, subtype, msg_len)
+        hdr = COMMON_HDR_S.pack(int(ts), self._mrt_type, subtype, msg_len)
         return (ts, hdr)
 
     #---------------------------------------------------------------------------
 
-    def writeBgpMsg(self, msg_type, msg_len, msg):
+    def writeBgpMsg(self, msg_type, msg_len, msg, src=None):
 
         subtype = BGP_SUBTYPES[bgp.MSG_TYPES[msg_type]]
-        (ts, hdr) = self.mkHdr(subtype, msg_len+BGP_SUBTYPE_HDR_LEN)
 
-        src_as = self._msg_src._bgp_peer_as
-        src_ip = self._msg_src._bgp_peer_id
-        dst_as = self._msg_src._bgp_as
-        dst_ip = self._msg_src._bgp_id
+        # src is the session the message is to or from, if not our own
+        # msg_src (eg. when a bgp.Collector's sessions share one file)
+
+        src = src or self._msg_src
+        src_as = src._bgp_peer_as
+        src_ip = src._bgp_peer_id
+        dst_as = src._bgp_as
+        dst_ip = src._bgp_id
 
-        msg = struct.pack(">%ds HLHL %ds" % (COMMON_HDR_LEN, msg_len),
-                          hdr,
-                          src_as, src_ip, dst_as, dst_ip,
-                          msg)
-        self.write(msg)
+        self.writeRec(time.time(), subtype, BGP_SUBTYPE_HDR_S,
+                      (src_as, src_ip, dst_as, dst_ip),
+                      padPkt(msg_len, msg))
 
     def parseBgpMsg(self, psubtype, plen, pdata, verbose=1, level=0):
 
-        rv = { "T":  MSG_TYPES["PROTOCOL_BGP"],
-               "ST": psubtype,
-               "L":  plen,
-               "H":  { 'TIME': 0L },
-               "V":  {}
-               }
+        rv = Rv(T=MSG_TYPES["PROTOCOL_BGP"], ST=psubtype, L=plen,
+                H=MrtHdr(TIME=0L), V={})
 
         if psubtype in (BGP_SUBTYPES['BOGO_RIS_EXTN_1'],
                         BGP_SUBTYPES['BOGO_RIS_EXTN_2']):
-            print INDENT*level + '[ *** skipping *** ]'
+            if verbose > 0:
+                print INDENT*level + '[ *** skipping *** ]'
             return rv
 
         if verbose > 1:
@@ -455,19 +1688,21 @@ class Mrtd:
 
         try:
             src_as, src_ip, dst_as, dst_ip =\
-                    struct.unpack(">HLHL", pdata[:BGP_SUBTYPE_HDR_LEN])
-            rv["H"]["SRC_AS"] = src_as
-            rv["H"]["SRC_IP"] = src_ip
-            rv["H"]["DST_AS"] = dst_as
-            rv["H"]["DST_IP"] = dst_ip
+                    BGP_SUBTYPE_HDR_S.unpack(pdata[:BGP_SUBTYPE_HDR_LEN])
+            rv.H.SRC_AS = src_as
+            rv.H.SRC_IP = src_ip
+            rv.H.DST_AS = dst_as
+            rv.H.DST_IP = dst_ip
 
         except (struct.error):
-            print INDENT*level + '[ *** struct error: bogus RIS data?! *** ]'
+            if verbose > 0:
+                print INDENT*level + '[ *** struct error: bogus RIS data?! *** ]'
             if psubtype == BGP_SUBTYPES['STATE_CHANGE']:
-                src, dst = struct.unpack(">HH", pdata[-4:])
-                print INDENT*level +\
-                      'state change: %s -> %s' %\
-                      (ZEBRA_STATES[src], ZEBRA_STATES[dst])
+                src, dst = STATE_CHANGE_S.unpack(pdata[-4:])
+                if verbose > 0:
+                    print INDENT*level +\
+                          'state change: %s -> %s' %\
+                          (ZEBRA_STATES[src], ZEBRA_STATES[dst])
 
             return rv
 
@@ -483,8 +1718,7 @@ class Mrtd:
 
         else:
             msg_len, msg_type =\
-                     struct.unpack(">HB", pdata[len(bgp.BGP_MARKER):
-                                                len(bgp.BGP_MARKER)+3])
+                     bgp.PDU_HDR_S.unpack_from(pdata, bgp.BGP_MARKER_LEN)
 
         if verbose > 1:
             print prtbin(level*INDENT, pdata[:bgp.BGP_HDR_LEN])
@@ -493,7 +1727,8 @@ class Mrtd:
             print level*INDENT + "BGP message type: %s len=%d" %\
                   (bgp.MSG_TYPES[msg_type], msg_len)
 
-        rv["V"] = bgp.parseBgpPdu(msg_type, msg_len, pdata, verbose, level+1)
+        rv.V = bgp.parseBgpPdu(msg_type, msg_len, pdata, verbose, level+1,
+                               self._attrs)
 
         return rv
 
@@ -504,32 +1739,25 @@ class Mrtd:
     # traces -- workarounds to patch things up before calling into the bgp
     # module are below.
 
-    def writeBgp4mpMsg(self, ptype, plen, pkt):
+    def writeBgp4mpMsg(self, ptype, plen, pkt, src=None):
 
         subtype = BGP4MP_SUBTYPES["MESSAGE"]
-        (ts, hdr) = self.mkHdr(subtype, plen+BGP4MP_SUBTYPE_HDR_LEN)
 
-        src_as = self._msg_src._bgp_peer_as
-        dst_as = self._msg_src._bgp_as
+        src = src or self._msg_src
+        src_as = src._bgp_peer_as
+        dst_as = src._bgp_as
 
-        src_ip = self._msg_src._bgp_peer_id
-        dst_ip = self._msg_src._bgp_id
+        src_ip = src._bgp_peer_id
+        dst_ip = src._bgp_id
 
-        msg = struct.pack(">%ds HHHHLL %ds" % (COMMON_HDR_LEN, plen),
-                          hdr,
-                          src_as, dst_as, 0, bgp.AFI_TYPES["IP"], src_ip, dst_ip,
-                          pkt)
-
-        self.write(msg)
+        self.writeRec(time.time(), subtype, BGP4MP_SUBTYPE_HDR_S,
+                      (src_as, dst_as, 0, bgp.AFI_TYPES["IP"], src_ip, dst_ip),
+                      padPkt(plen, pkt))
 
     def parseBgp4mpMsg(self, psubtype, plen, pdata, verbose=1, level=0):
 
-        rv = { "T":  MSG_TYPES["PROTOCOL_BGP4MP"],
-               "ST": psubtype,
-               "L":  plen,
-               "H":  { "TIME": 0L },
-               "V":  {}
-               }
+        rv = Rv(T=MSG_TYPES["PROTOCOL_BGP4MP"], ST=psubtype, L=plen,
+                H=MrtHdr(TIME=0L), V={})
 
         if psubtype == BGP4MP_SUBTYPES["STATE_CHANGE"]:
             if verbose > 1:
@@ -551,17 +1779,17 @@ class Mrtd:
                         parseBgp4mpMrtHdr(pdata[0:BGP4MP_SUBTYPE_HDR_LEN],
                                           verbose, level)
 
-                rv["H"]["SRC_AS"] = src_as
-                rv["H"]["DST_AS"] = dst_as
-                rv["H"]["SRC_IP"] = src_ip
-                rv["H"]["DST_IP"] = dst_ip
-                rv["H"]["IFC"]    = ifc
-                rv["H"]["AFI"]    = afi
+                rv.H.SRC_AS = src_as
+                rv.H.DST_AS = dst_as
+                rv.H.SRC_IP = src_ip
+                rv.H.DST_IP = dst_ip
+                rv.H.IFC    = ifc
+                rv.H.AFI    = afi
 
                 pdata = pdata[BGP4MP_SUBTYPE_HDR_LEN:]
 
-            start_st, end_st = struct.unpack(">HH", pdata)
-            rv["V"] = (start_st, end_st)
+            start_st, end_st = STATE_CHANGE_S.unpack(pdata)
+            rv.V = (start_st, end_st)
             if verbose > 0:
                 print level*INDENT + "%s -> %s\n" %\
                       (ZEBRA_STATES[start_st], ZEBRA_STATES[end_st])
@@ -585,54 +1813,49 @@ class Mrtd:
                         parseBgp4mpMrtHdr(pdata[0:BGP4MP_SUBTYPE_HDR_LEN],
                                           verbose, level)
 
-                rv["H"]["SRC_AS"] = src_as
-                rv["H"]["DST_AS"] = dst_as
-                rv["H"]["SRC_IP"] = src_ip
-                rv["H"]["DST_IP"] = dst_ip
-                rv["H"]["IFC"]    = ifc
-                rv["H"]["AFI"]    = afi
+                rv.H.SRC_AS = src_as
+                rv.H.DST_AS = dst_as
+                rv.H.SRC_IP = src_ip
+                rv.H.DST_IP = dst_ip
+                rv.H.IFC    = ifc
+                rv.H.AFI    = afi
 
                 pdata = pdata[BGP4MP_SUBTYPE_HDR_LEN:]
 
             msg_len, msg_type =\
-                     struct.unpack(">HB",
-                                   pdata[bgp.BGP_MARKER_LEN:bgp.BGP_HDR_LEN])
-            rv["V"] = bgp.parseBgpPdu(msg_type, msg_len, pdata, verbose, level)
+                     bgp.PDU_HDR_S.unpack_from(pdata, bgp.BGP_MARKER_LEN)
+            rv.V = bgp.parseBgpPdu(msg_type, msg_len, pdata, verbose, level,
+                                   self._attrs)
 
-        else:
+        elif verbose > 0:
             print level*INDENT + "[ *** SUBTYPE: %d NOT PARSED *** ]" % psubtype
 
         return rv
 
     #---------------------------------------------------------------------------
 
-    def writeBgp4pyMsg(self, ptype, plen, pkt):
+    def writeBgp4pyMsg(self, ptype, plen, pkt, src=None):
 
         subtype = BGP4PY_SUBTYPES["MESSAGE"]
-        (ts, hdr) = self.mkHdr(subtype, plen+BGP4PY_SUBTYPE_HDR_LEN)
 
-        src_as = self._msg_src._bgp_peer_as
-        dst_as = self._msg_src._bgp_as
+        src = src or self._msg_src
+        src_as = src._bgp_peer_as
+        dst_as = src._bgp_as
 
-        src_ip = self._msg_src._bgp_peer_id
-        dst_ip = self._msg_src._bgp_id
+        src_ip = src._bgp_peer_id
+        dst_ip = src._bgp_id
 
+        ts = time.time()
         (ts_frac, ts_int) = math.modf(ts)
-        msg = struct.pack(">%ds HH HH LLL %ds" % (COMMON_HDR_LEN, plen),
-                          hdr,
-                          src_as, dst_as, 0, bgp.AFI_TYPES["IP"],
-                          src_ip, dst_ip, ts_frac*1000000,
-                          pkt)
-        self.write(msg)
+        self.writeRec(ts, subtype, BGP4PY_SUBTYPE_HDR_S,
+                      (src_as, dst_as, 0, bgp.AFI_TYPES["IP"],
+                       src_ip, dst_ip, int(ts_frac*1000000)),
+                      padPkt(plen, pkt))
 
     def parseBgp4pyMsg(self, psubtype, plen, pdata, verbose=1, level=0):
 
-        rv = { "T":  MSG_TYPES["PROTOCOL_BGP4PY"],
-               "ST": psubtype,
-               "L":  plen,
-               "H":  { "TIME": 0L },
-               "V":  {}
-               }
+        rv = Rv(T=MSG_TYPES["PROTOCOL_BGP4PY"], ST=psubtype, L=plen,
+                H=MrtHdr(TIME=0L), V={})
 
         if verbose > 1:
             print prtbin(level*INDENT, pdata[:BGP4PY_SUBTYPE_HDR_LEN])
@@ -640,20 +1863,20 @@ class Mrtd:
         src_as, dst_as, ifc, afi, src_ip, dst_ip, ts_frac =\
                 parseBgp4pyMrtHdr(pdata[0:BGP4PY_SUBTYPE_HDR_LEN], verbose, level)
 
-        rv["H"]["SRC_AS"] = src_as
-        rv["H"]["DST_AS"] = dst_as
-        rv["H"]["SRC_IP"] = src_ip
-        rv["H"]["DST_IP"] = dst_ip
-        rv["H"]["IFC"]    = ifc
-        rv["H"]["AFI"]    = afi
-        rv["H"]["TIME"]   = ts_frac*0.000001
+        rv.H.SRC_AS = src_as
+        rv.H.DST_AS = dst_as
+        rv.H.SRC_IP = src_ip
+        rv.H.DST_IP = dst_ip
+        rv.H.IFC    = ifc
+        rv.H.AFI    = afi
+        rv.H.TIME   = ts_frac*0.000001
 
         pdata = pdata[BGP4PY_SUBTYPE_HDR_LEN:]
 
         if psubtype == BGP4PY_SUBTYPES["STATE_CHANGE"]:
 
-            start_st, end_st = struct.unpack(">HH", pdata)
-            rv["V"] = (start_st, end_st)
+            start_st, end_st = STATE_CHANGE_S.unpack(pdata)
+            rv.V = (start_st, end_st)
             if verbose > 0:
                 print level*INDENT + "%s -> %s\n" %\
                       (ZEBRA_STATES[start_st], ZEBRA_STATES[end_st])
@@ -661,11 +1884,11 @@ class Mrtd:
         elif psubtype == BGP4PY_SUBTYPES["MESSAGE"]:
 
             msg_len, msg_type =\
-                     struct.unpack(">HB",
-                                   pdata[bgp.BGP_MARKER_LEN:bgp.BGP_HDR_LEN])
-            rv["V"] = bgp.parseBgpPdu(msg_type, msg_len, pdata, verbose, level)
+                     bgp.PDU_HDR_S.unpack_from(pdata, bgp.BGP_MARKER_LEN)
+            rv.V = bgp.parseBgpPdu(msg_type, msg_len, pdata, verbose, level,
+                                   self._attrs)
 
-        else:
+        elif verbose > 0:
             print level*INDENT + "[ *** SUBTYPE: %d NOT PARSED *** ]" % psubtype
 
         return rv
@@ -674,99 +1897,78 @@ class Mrtd:
 
     def writeIsisMsg(self, ptype, plen, pkt):
 
-        (ts, hdr) = self.mkHdr(ptype, plen+ISIS_SUBTYPE_HDR_LEN)
-        msg = struct.pack(">%ds %ds" % (len(hdr), len(pkt)), hdr, pkt)
-        self.write(msg)
+        self.writeRec(time.time(), ptype, None, (), pkt)
 
     def parseIsisMsg(self, plen, pdata, verbose=1, level=0):
 
-        rv = { "T":  MSG_TYPES["PROTOCOL_ISIS"],
-               "ST": 0L,
-               "L":  plen,
-               "H":  { "TIME": 0L },
-               "V":  {}
-               }
+        rv = Rv(T=MSG_TYPES["PROTOCOL_ISIS"], ST=0L, L=plen,
+                H=MrtHdr(TIME=0L))
 
-        rv["V"].update(isis.parseIsisMsg(plen, pdata, verbose, level))
+        rv.V = isis.parseIsisMsg(plen, pdata, verbose, level)
         return rv
 
     #---------------------------------------------------------------------------
 
     def writeIsis2Msg(self, ptype, plen, pkt):
 
-        (ts, hdr) = self.mkHdr(ptype, plen+ISIS2_SUBTYPE_HDR_LEN)
+        ts = time.time()
         (ts_frac, ts_int) = math.modf(ts)
-        msg = struct.pack(">%ds L %ds" % (COMMON_HDR_LEN, len(pkt)),
-                          hdr, ts_frac*1000000, pkt)
-        self.write(msg)
+        self.writeRec(ts, ptype, TS_FRAC_S, (int(ts_frac*1000000), ), pkt)
 
     def parseIsis2Msg(self, plen, pdata, verbose=1, level=0):
 
-        rv = { "T":  MSG_TYPES["PROTOCOL_ISIS2"],
-               "ST": 0L,
-               "L":  plen,
-               "H":  { "TIME": 0L },
-               "V":  {}
-               }
-
-        (ts_frac, )     = struct.unpack(">L", pdata[:ISIS2_SUBTYPE_HDR_LEN])
-        rv["H"]["TIME"] = ts_frac*0.000001
-        rv["V"].update(isis.parseIsisMsg(plen, pdata[ISIS2_SUBTYPE_HDR_LEN:],
-                                         verbose, level))
+        rv = Rv(T=MSG_TYPES["PROTOCOL_ISIS2"], ST=0L, L=plen,
+                H=MrtHdr(TIME=0L))
+
+        (ts_frac, ) = TS_FRAC_S.unpack_from(pdata, 0)
+        rv.H.TIME   = ts_frac*0.000001
+        rv.V = isis.parseIsisMsg(plen, pdata[ISIS2_SUBTYPE_HDR_LEN:],
+                                 verbose, level)
         return rv
 
     #---------------------------------------------------------------------------
 
     def writeOspfMsg(self, ptype, plen, pkt):
 
-        (ts, hdr) = self.mkHdr(ptype, plen+OSPF2_SUBTYPE_HDR_LEN)
+        ts = time.time()
         (ts_frac, ts_int) = math.modf(ts)
-        msg = struct.pack(">%ds L %ds" %(
-            COMMON_HDR_LEN, len(pkt)), hdr, ts_frac*1000000, pkt)
-        self.write(msg)
+        self.writeRec(ts, ptype, TS_FRAC_S, (int(ts_frac*1000000), ), pkt)
 
     def parseOspfMsg(self, plen, pdata, verbose=1, level=0):
 
-        rv = { "T": MSG_TYPES["PROTOCOL_OSPF2"],
-               "ST": 0L,
-               "L": plen,
-               "H": { "TIME": 0L, },
-               "V": {}
-            }
+        rv = Rv(T=MSG_TYPES["PROTOCOL_OSPF2"], ST=0L, L=plen,
+                H=MrtHdr(TIME=0L))
 
-        (ts_frac, ) = struct.unpack(">L", pdata[:OSPF2_SUBTYPE_HDR_LEN])
-        rv["H"]["TIME"] = ts_frac * 0.000001
+        (ts_frac, ) = TS_FRAC_S.unpack_from(pdata, 0)
+        rv.H.TIME = ts_frac * 0.000001
         ospfh = ospf.parseOspfHdr(pdata[OSPF2_SUBTYPE_HDR_LEN+ospf.IP_HDR_LEN:
                                         OSPF2_SUBTYPE_HDR_LEN+ospf.IP_HDR_LEN+ospf.OSPF_HDR_LEN], 0, 0)
-        rv["ST"] = ospfh["TYPE"]
-        rv["V"].update(ospf.parseOspfMsg(pdata[OSPF2_SUBTYPE_HDR_LEN:], verbose, level))
+        rv.ST = ospfh["TYPE"]
+        rv.V = ospf.parseOspfMsg(pdata[OSPF2_SUBTYPE_HDR_LEN:], verbose, level)
         return rv
 
     #---------------------------------------------------------------------------
 
     def parseTableDump(self, psubtype, plen, pdata, verbose=1, level=0):
 
-        rv = { "T":  MSG_TYPES["TABLE_DUMP"],
-               "ST": psubtype,
-               "L":  plen,
-               "H":  { "TIME": 0L },
-               "V":  []
-               }
+        rv = Rv(T=MSG_TYPES["TABLE_DUMP"], ST=psubtype, L=plen,
+                H=MrtHdr(TIME=0L), V=[])
 
         if verbose > 1:
             print prtbin(level*INDENT, pdata[:TABLE_DUMP_HDR_LEN])
 
-        view, seqno = struct.unpack(">HH", pdata[:TABLE_DUMP_HDR_LEN])
+        view, seqno = TABLE_DUMP_HDR_S.unpack_from(pdata, 0)
 
-        rv["H"]["VIEW"]  = view
-        rv["H"]["SEQNO"] = seqno
+        rv.H.VIEW  = view
+        rv.H.SEQNO = seqno
 
         if verbose:
             print INDENT*level + "view: %d, seqno: %d" % (view, seqno)
 
         pdata = pdata[TABLE_DUMP_HDR_LEN:]
         while len(pdata):
-            erv = bgp.parseTableEntry(plen, pdata, verbose, level)
+            erv = bgp.parseTableEntry(plen, pdata, verbose, level,
+                                      self._attrs)
             pdata = pdata[erv["L"]:]
             rv["V"].append(erv)
 
@@ -776,12 +1978,384 @@ class Mrtd:
 
 ################################################################################
 
+class Record(object):
+
+    # A lazily decoded record.  The common header, and the subtype header of
+    # BGP and TABLE_DUMP records, are decoded on construction; the payload is
+    # kept raw until something asks for it, and each part is decoded at most
+    # once.  Indexing gives the RV exactly as Mrtd.parse() would (see
+    # README.rv), so a Record can stand in for one.  The properties give the
+    # parts of a BGP message without decoding the rest of it.
+
+    __slots__ = ("_mrt", "_msg", "_rv", "_pdu", "_upd", "_parts",
+                 "_hdr", "_off")
+
+    def __init__(self, mrt, msg):
+
+        (ptime, ptype, psubtype, plen, phdr, pdata) = msg
+
+        self._mrt   = mrt
+        self._msg   = msg
+        self._rv    = None     # as Mrtd.parse(), if we've had to
+        self._pdu   = None     # the BGP PDU RV
+        self._upd   = None     # UPDATE part offsets, as bgp.updateBounds()
+        self._parts = {}       # UPDATE value entries decoded so far
+
+        try:
+            (self._hdr, self._off) = splitRecord(ptype, psubtype, plen, pdata)
+        except (struct.error):
+            (self._hdr, self._off) = (None, None)
+
+        if self._hdr is not None:
+            self._hdr.TIME = self._hdr.TIME + ptime
+
+    def __repr__(self):
+
+        return "<Record %s: %s/%s, %d octets>" %\
+               (self._msg[0], MSG_TYPES.get(self._msg[1], self._msg[1]),
+                self._msg[2], self._msg[3])
+
+    #---------------------------------------------------------------------------
+
+    def parse(self):
+
+        if self._rv is None:
+            self._rv = self._mrt.parse(self._msg, 0)
+        return self._rv
+
+    def _getType(self):
+
+        if self._hdr is None:
+            return self.parse()["T"]
+        return self._msg[1]
+
+    def _getSubtype(self):
+
+        if self._hdr is None:
+            return self.parse()["ST"]
+        return self._msg[2]
+
+    def _getLength(self):
+
+        if self._hdr is None:
+            return self.parse()["L"]
+        return self._msg[3]
+
+    def _getHdr(self):
+
+        if self._hdr is None:
+            return self.parse()["H"]
+        return self._hdr
+
+    def _getTime(self):
+
+        return self._getHdr()["TIME"]
+
+    def _getValue(self):
+
+        if self._off is None:
+            return self.parse()["V"]
+        return self._getPdu()
+
+    type    = property(_getType)
+    subtype = property(_getSubtype)
+    length  = property(_getLength)
+    hdr     = property(_getHdr)
+    time    = property(_getTime)
+    value   = property(_getValue)
+
+    #---------------------------------------------------------------------------
+
+    def _pduHdr(self):
+
+        # (length, type) of the BGP PDU
+
+        pdata = self._msg[5]
+        msg_len, msg_type =\
+                 bgp.PDU_HDR_S.unpack_from(pdata,
+                                           self._off+bgp.BGP_MARKER_LEN)
+        return (msg_len, msg_type)
+
+    def _getPdu(self):
+
+        if self._off is None:
+            return None
+
+        if self._pdu is None:
+            msg_len, msg_type = self._pduHdr()
+            if msg_type == bgp.MSG_TYPES["UPDATE"]:
+                self._pdu = Rv(T=msg_type, L=msg_len-bgp.BGP_HDR_LEN,
+                               V=self._getUpdate())
+            else:
+                self._pdu = bgp.parseBgpPdu(msg_type, msg_len,
+                                            self._msg[5][self._off:], 0)
+        return self._pdu
+
+    def _getPart(self, part):
+
+        if self._off is None:
+            return None
+
+        # each part is decoded straight out of the payload, by offset
+
+        if part not in self._parts:
+            if self._upd is None:
+                msg_len, msg_type = self._pduHdr()
+                if msg_type != bgp.MSG_TYPES["UPDATE"]:
+                    return None
+                self._upd = bgp.updateBounds(self._msg[5],
+                                             self._off+bgp.BGP_HDR_LEN)
+
+            (up, ap, np, endp) = self._upd
+            pdata = self._msg[5]
+            if   part == "UNFEASIBLE":
+                self._parts[part] = bgp.decodePfxs(pdata, up, ap-2)
+            elif part == "PATH_ATTRS":
+                self._parts[part] = bgp.decodeAttrs(pdata, ap, np)
+            elif part == "FEASIBLE":
+                self._parts[part] = bgp.decodePfxs(pdata, np, endp)
+            elif part[0] == "ATTR":
+                # ("ATTR", atype): just the one path attribute
+                self._parts[part] = bgp.decodeAttrs(pdata, ap, np,
+                                                    frozenset(part[1:]))
+            else:
+                # ("IDS", afi): withdrawn and announced together
+                self._parts[part] = bgp.updatePfxIds(pdata, self._upd,
+                                                     part[1])
+
+        return self._parts[part]
+
+    def _getUpdate(self):
+
+        attrs = self._getPart("PATH_ATTRS")
+        if attrs is None:
+            return None
+
+        return bgp.Update(UNFEASIBLE=self._getPart("UNFEASIBLE"),
+                          PATH_ATTRS=attrs,
+                          FEASIBLE=self._getPart("FEASIBLE"))
+
+    pdu       = property(_getPdu)
+    update    = property(_getUpdate)
+    withdrawn = property(lambda self: self._getPart("UNFEASIBLE"))
+    attrs     = property(lambda self: self._getPart("PATH_ATTRS"))
+    nlri      = property(lambda self: self._getPart("FEASIBLE"))
+
+    # as withdrawn and nlri, but as (prefix, length) integer pairs, batched
+    # as bgp.PfxIds, and including those of any MP_UNREACH_NLRI and
+    # MP_REACH_NLRI; IPv4 and IPv6.  See bgp.updatePfxIds()
+
+    def pfxIds(self, afi=bgp.AFI_TYPES["IP"]):
+
+        # (withdrawn, announced), or None if this isn't an UPDATE
+
+        return self._getPart(("IDS", afi))
+
+    def _getIds(self, afi, i):
+
+        ids = self.pfxIds(afi)
+        if ids is None:
+            return None
+        return ids[i]
+
+    withdrawnIds  = property(lambda self: self._getIds(bgp.AFI_TYPES["IP"], 0))
+    nlriIds       = property(lambda self: self._getIds(bgp.AFI_TYPES["IP"], 1))
+    withdrawn6Ids = property(lambda self: self._getIds(bgp.AFI_TYPES["IP6"], 0))
+    nlri6Ids      = property(lambda self: self._getIds(bgp.AFI_TYPES["IP6"], 1))
+
+    # the interned AS_PATH id and COMMUNITY array (see bgp.asPathId() and
+    # bgp.communities()), or None if the UPDATE hasn't the attribute; unless
+    # the path attributes have been decoded already, only the one wanted is
+
+    def _getInterned(self, atype, intern):
+
+        attrs = self._parts.get("PATH_ATTRS")
+        if attrs is None:
+            attrs = self._getPart(("ATTR", atype))
+        if attrs is None or atype not in attrs:
+            return None
+        return intern(attrs[atype]["V"])
+
+    asPathId    = property(lambda self: self._getInterned(
+        bgp.PATH_ATTRIBUTES["AS_PATH"], bgp.asPathId))
+    communities = property(lambda self: self._getInterned(
+        bgp.PATH_ATTRIBUTES["COMMUNITY"], bgp.communities))
+
+    #---------------------------------------------------------------------------
+
+    def __getitem__(self, k):
+
+        if self._hdr is None:
+            return self.parse()[k]
+
+        if   k == "T": return self._msg[1]
+        elif k == "ST": return self._msg[2]
+        elif k == "L": return self._msg[3]
+        elif k == "H": return self._hdr
+        elif k == "V": return self._getValue()
+        raise KeyError, k
+
+    def keys(self):
+
+        if self._hdr is None:
+            return self.parse().keys()
+        return ["T", "ST", "L", "H", "V"]
+
+    def has_key(self, k):
+
+        return k in self.keys()
+
+    __contains__ = has_key
+
+    def get(self, k, d=None):
+
+        if self.has_key(k):
+            return self[k]
+        return d
+
+################################################################################
+
+class Batch:
+
+    # The columns of a batch of prefixes under construction (see
+    # Mrtd.batches()), as one array per column of BATCH_COLUMNS, so rows are
+    # added in bulk straight from the bgp.PfxIds of each UPDATE.  Withdrawn
+    # prefixes have ANNOUNCE 0, ORIGIN_AS 0 and PATH_ID -1; so do announced
+    # ones without an AS_PATH.  PATH_ID is as bgp.asPathId(), and ORIGIN_AS
+    # as bgp.originAs(); TYPE is the MRTD type.  IPv6 prefixes take four
+    # words of PFX each, most significant first.
+
+    # only the AS_PATH of TABLE_DUMP entries is wanted
+    ATTRS = frozenset([ bgp.PATH_ATTRIBUTES["AS_PATH"] ])
+
+    def __init__(self, afi=bgp.AFI_TYPES["IP"]):
+
+        self.afi  = afi
+        self.cols = {}
+        for (name, code, dtype) in BATCH_COLUMNS:
+            self.cols[name] = array.array(code)
+
+    def __len__(self):
+
+        return len(self.cols["PLEN"])
+
+    def add(self, t, mtype, peer_as, peer_ip, announce, pid, ids):
+
+        # a row for each of ids, a bgp.PfxIds, all alike but for the prefix
+
+        n = len(ids)
+        if not n:
+            return
+
+        if pid is None:
+            (pid, origin) = (-1, 0)
+        else:
+            origin = bgp.originAs(pid)
+
+        cols = self.cols
+        for (name, v) in (("TIME", t), ("TYPE", mtype),
+                          ("PEER_AS", peer_as), ("PEER_IP", peer_ip),
+                          ("ANNOUNCE", announce),
+                          ("ORIGIN_AS", origin), ("PATH_ID", pid)):
+            c = cols[name]
+            c.extend(array.array(c.typecode, [v]) * n)
+        cols["PFX"].extend(ids.words)
+        cols["PLEN"].extend(ids.plens)
+
+    def addUpdate(self, rec):
+
+        # the rows of a Record; nothing unless it's an UPDATE
+
+        ids = rec.pfxIds(self.afi)
+        if ids is None:
+            return
+
+        (wids, nids) = ids
+        if not len(wids) and not len(nids):
+            return
+
+        hdr = rec.hdr
+        t   = rec.time
+        peer_as = hdr.get("SRC_AS", 0)
+        peer_ip = hdr.get("SRC_IP", 0)
+        self.add(t, rec.type, peer_as, peer_ip, 0, None, wids)
+        if len(nids):
+            self.add(t, rec.type, peer_as, peer_ip, 1, rec.asPathId, nids)
+
+    def addTableDump(self, rv):
+
+        # the rows of a parsed TABLE_DUMP record
+
+        if (self.afi != bgp.AFI_TYPES["IP"] or
+            rv["ST"] != TABLE_DUMP_SUBTYPES["IP"]):
+            return
+
+        as_path = bgp.PATH_ATTRIBUTES["AS_PATH"]
+        for erv in rv["V"]:
+            e = erv["V"]
+            (pfx, plen) = e["PREFIX"]
+            ids = bgp.PfxIds()
+            ids.words.append(bgp.ULONG_S.unpack(pfx)[0] & bgp.PFX_MASKS[plen])
+            ids.plens.append(plen)
+
+            pid = None
+            if as_path in e:
+                pid = bgp.asPathId(e[as_path]["V"])
+
+            self.add(rv["H"]["TIME"], rv["T"], e["PEER_AS"], e["PEER_IP"], 1,
+                     pid, ids)
+
+    def arrays(self):
+
+        # the columns as numpy arrays, keyed by name
+
+        rv = {}
+        for (name, code, dtype) in BATCH_COLUMNS:
+            c = self.cols[name]
+            if len(c):
+                rv[name] = numpy.frombuffer(c, dtype)
+            else:
+                rv[name] = numpy.zeros(0, dtype)
+
+        if self.afi == bgp.AFI_TYPES["IP6"]:
+            rv["PFX"] = rv["PFX"].reshape(-1, 4)
+
+        return rv
+
+#-------------------------------------------------------------------------------
+
+registerParser(MSG_TYPES["PROTOCOL_BGP"],    Mrtd.parseBgpMsg, BGP_SUBTYPES)
+registerParser(MSG_TYPES["PROTOCOL_BGP4MP"], Mrtd.parseBgp4mpMsg,
+               BGP4MP_SUBTYPES)
+registerParser(MSG_TYPES["PROTOCOL_BGP4PY"], Mrtd.parseBgp4pyMsg,
+               BGP4PY_SUBTYPES)
+registerParser(MSG_TYPES["TABLE_DUMP"],      Mrtd.parseTableDump,
+               TABLE_DUMP_SUBTYPES)
+
+registerParser(MSG_TYPES["PROTOCOL_ISIS"],
+               lambda mrt, st, plen, pdata, verbose, level:
+                   mrt.parseIsisMsg(plen, pdata, verbose, level),
+               ISIS_SUBTYPES)
+registerParser(MSG_TYPES["PROTOCOL_ISIS2"],
+               lambda mrt, st, plen, pdata, verbose, level:
+                   mrt.parseIsis2Msg(plen, pdata, verbose, level),
+               ISIS_SUBTYPES)
+registerParser(MSG_TYPES["PROTOCOL_OSPF2"],
+               lambda mrt, st, plen, pdata, verbose, level:
+                   mrt.parseOspfMsg(plen, pdata, verbose, level),
+               OSPF_SUBTYPES)
+
+################################################################################
+
 if __name__ == "__main__":
 
-    VERBOSE = 1
+    VERBOSE  = 1
+    INDEX    = 0
+    COMPRESS = None
 
     file_name  = DEFAULT_FILE
     file_size  = -1
+    block_size = BLOCK_SZ
 
     #---------------------------------------------------------------------------
 
@@ -793,8 +2367,13 @@ if __name__ == "__main__":
         -v|--verbose   : Be verbose
 
         -f|--file      : Set file name to parse (def: %s)
+        -i|--index     : Write a sidecar index for the file, and exit
+        -c|--compress  : Write a block compressed copy of the file,
+                         with its block index, and exit [%s]
+        -B|--block-size: Block size for -c (def: %d)
         -z|--file-size : Set size of output file(s)""" %\
-            (os.path.basename(sys.argv[0]), DEFAULT_FILE)
+            (os.path.basename(sys.argv[0]), DEFAULT_FILE,
+             string.join(BLOCK_COMPRESSORS.keys(), "|"), BLOCK_SZ)
         sys.exit(0)
 
     #---------------------------------------------------------------------------
@@ -805,9 +2384,10 @@ if __name__ == "__main__":
     try:
         try:
             opts, args = getopt.getopt(sys.argv[1:],
-                                       "hqvVf:z:",
+                                       "hqvVif:z:c:B:",
                                        ("help", "quiet", "verbose", "VERBOSE",
-                                        "file=", "size=" ))
+                                        "index", "file=", "size=",
+                                        "compress=", "block-size=" ))
         except (getopt.error):
             usage()
 
@@ -824,24 +2404,46 @@ if __name__ == "__main__":
             elif x in ('-V', '--VERBOSE'):
                 VERBOSE = 3
 
+            elif x in ('-i', '--index'):
+                INDEX = 1
+
             elif x in ('-f', '--file'):
                 file_name = y
 
             elif x in ('-z', '--size'):
                 file_size = string.atof(y)
 
+            elif x in ('-c', '--compress'):
+                if y not in BLOCK_COMPRESSORS:
+                    usage()
+                COMPRESS = y
+
+            elif x in ('-B', '--block-size'):
+                block_size = string.atoi(y)
+
             else:
                 usage()
 
         #-----------------------------------------------------------------------
 
-        mrt = Mrtd(file_name, "rb", file_size)
-        while 1:
-            rv = mrt.parse(mrt.read(), VERBOSE)
-            if VERBOSE > 2: pprint.pprint(rv)
+        if INDEX:
+            cnt = mkIndex(file_name)
+            if VERBOSE > 0:
+                print "%s: indexed %d messages" % (file_name+INDEX_EXTN, cnt)
+            sys.exit(0)
 
-    except (EOFExc):
+        if COMPRESS:
+            compressFile(file_name, COMPRESS, block_size, keep=1)
+            if VERBOSE > 0:
+                print "%s: block compressed" %\
+                      (file_name+COMPRESSORS[COMPRESS][0])
+            sys.exit(0)
+
+        mrt = Mrtd(file_name, "rb", file_size)
+        for rv in mrt.rvs(verbose=VERBOSE):
+            if VERBOSE > 2: pprint.pprint(rv2dict(rv))
         print "End of file"
+
     except (KeyboardInterrupt):
         print "Interrupted"
 
@@ -97,6 +97,26 @@ def pfx2str(pfx, plen=None):
 
 #-------------------------------------------------------------------------------
 
+def pfx2str6(pfx, plen=None):
+
+    # as pfx2str(), for an IPv6 prefix
+
+    if plen == None:
+        plen = int(pfx[1])
+        pfx  = pfx[0]
+
+    p = 0L
+    for i in range(min(len(pfx), 16)):
+        p = p << 8
+        p = p | ord(pfx[i])
+    p = p << (8 * (16-min(len(pfx), 16)))
+    if plen <= 128:
+        p = p & (((1L << plen) - 1) << (128-plen))
+
+    return "%s/%d" % (id2str6(p), plen)
+
+#-------------------------------------------------------------------------------
+
 def rpfx2str(pfxtup):
 
     plen, pfx = pfxtup
@@ -132,6 +152,31 @@ def id2str(id):
 
 #-------------------------------------------------------------------------------
 
+def id2str6(id):
+
+    # an IPv6 address, as eight groups of hex, the longest run of two or
+    # more zero groups elided (RFC 5952)
+
+    grps = [ int((id >> (16*(7-i))) & 0xffff) for i in range(8) ]
+
+    best, bestn = -1, 1
+    i = 0
+    while i < 8:
+        j = i
+        while j < 8 and grps[j] == 0:
+            j = j + 1
+        if j - i > bestn:
+            best, bestn = i, j - i
+        i = j + 1
+
+    if best < 0:
+        return string.join([ "%x" % g for g in grps ], ":")
+
+    return string.join([ "%x" % g for g in grps[:best] ], ":") + "::" +\
+           string.join([ "%x" % g for g in grps[best+bestn:] ], ":")
+
+#-------------------------------------------------------------------------------
+
 def str2id(str):
 
     quads = string.split(str, '.')
@@ -265,5 +310,231 @@ def int2hex(i):
 
     return ret[:-1]
 
+################################################################################
+
+class Slots(object):
+
+    # Base for the compact classes that parsed return values (RVs; see
+    # README.rv) are built from.  A subclass lists its keys as __slots__,
+    # so an instance carries no per-instance dictionary, but it can still be
+    # used as if it were the dictionary it replaces: rv["V"], rv.keys(),
+    # rv.has_key("ST"), rv == {...} all work as before.  Keys that were
+    # never set are absent, exactly as for a dictionary; slots whose names
+    # begin with "_" are private, and are not keys.
+
+    __slots__ = ()
+    __hash__  = None
+
+    def __init__(self, **kw):
+
+        for k, v in kw.items():
+            setattr(self, k, v)
+
+    def _keys(self):
+
+        return [ k for k in self.__slots__ if k[0] != "_" ]
+
+    def __getitem__(self, k):
+
+        if k.__class__ is str and k[0] != "_" and k in self.__slots__:
+            try:
+                return getattr(self, k)
+            except (AttributeError):
+                pass
+        raise KeyError, k
+
+    def __setitem__(self, k, v):
+
+        if k.__class__ is not str or k[0] == "_" or k not in self.__slots__:
+            raise KeyError, k
+        setattr(self, k, v)
+
+    def __delitem__(self, k):
+
+        self[k]
+        delattr(self, k)
+
+    def keys(self):
+
+        return [ k for k in self._keys() if hasattr(self, k) ]
+
+    def values(self):
+
+        return [ self[k] for k in self.keys() ]
+
+    def items(self):
+
+        return [ (k, self[k]) for k in self.keys() ]
+
+    def has_key(self, k):
+
+        try:
+            self[k]
+            return 1
+        except (KeyError):
+            return 0
+
+    __contains__ = has_key
+
+    def get(self, k, d=None):
+
+        try:
+            return self[k]
+        except (KeyError):
+            return d
+
+    def update(self, d):
+
+        for k in d.keys():
+            self[k] = d[k]
+
+    def __iter__(self):
+
+        return iter(self.keys())
+
+    def __len__(self):
+
+        return len(self.keys())
+
+    def __eq__(self, other):
+
+        if isinstance(other, (Slots, dict)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other):
+
+        rv = self.__eq__(other)
+        if rv is NotImplemented:
+            return rv
+        return not rv
+
+    def __repr__(self):
+
+        return repr(dict(self.items()))
+
+#-------------------------------------------------------------------------------
+
+class Rv(Slots):
+
+    # the common shape of an RV: type, subtype, length, header, value
+
+    __slots__ = ("T", "ST", "L", "H", "V")
+
+#-------------------------------------------------------------------------------
+
+def rv2dict(rv):
+
+    # an RV as plain dictionaries, lists and tuples all the way down, for
+    # pprint and friends
+
+    if isinstance(rv, (Slots, dict)):
+        d = {}
+        for k, v in rv.items():
+            d[k] = rv2dict(v)
+        return d
+
+    elif isinstance(rv, list):
+        return map(rv2dict, rv)
+
+    elif isinstance(rv, tuple):
+        return tuple(map(rv2dict, rv))
+
+    return rv
+
+################################################################################
+
+class Lru:
+
+    # A bounded memo: holds at most size values, dropping the least recently
+    # used first, and counts hits and misses.  Entries are kept on a
+    # circular doubly linked list of [prev, next, key, value] links, most
+    # recently used first, so that both get() and put() are O(1).  A size of
+    # 0 holds nothing.
+
+    def __init__(self, size):
+
+        self.size   = size
+        self.hits   = 0
+        self.misses = 0
+        self.clear()
+
+    def clear(self):
+
+        self._links = {}
+        root = self._root = []
+        root[:] = [root, root, None, None]
+
+    def get(self, k, d=None):
+
+        try:
+            link = self._links[k]
+        except KeyError:
+            self.misses = self.misses + 1
+            return d
+
+        self.hits = self.hits + 1
+        root = self._root
+        if root[1] is not link:
+            # move to the front
+            prv, nxt = link[0], link[1]
+            prv[1] = nxt
+            nxt[0] = prv
+            fst = root[1]
+            link[0] = root
+            link[1] = fst
+            fst[0]  = link
+            root[1] = link
+
+        return link[3]
+
+    def put(self, k, v):
+
+        if self.size <= 0:
+            return v
+
+        links = self._links
+        if k in links:
+            links[k][3] = v
+            return v
+
+        if len(links) >= self.size:
+            self._drop(len(links) - self.size + 1)
+
+        root = self._root
+        fst  = root[1]
+        link = [root, fst, k, v]
+        fst[0]   = link
+        root[1]  = link
+        links[k] = link
+
+        return v
+
+    def resize(self, size):
+
+        self.size = size
+        if len(self._links) > max(size, 0):
+            self._drop(len(self._links) - max(size, 0))
+
+    def _drop(self, n):
+
+        # drop the n least recently used
+
+        root = self._root
+        for i in range(n):
+            lst = root[0]
+            prv = lst[0]
+            prv[1]  = root
+            root[0] = prv
+            del self._links[lst[2]]
+
+    def __len__(self):
+
+        return len(self._links)
+
+    def __contains__(self, k):
+
+        return k in self._links
+
 ################################################################################
 ################################################################################
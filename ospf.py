@@ -1,4 +1,4 @@
-#! /usr/bin/env python2.5
+#! /usr/bin/env python2.7
 
 ##     PyRT: Python Routeing Toolkit
 
@@ -231,6 +231,73 @@ for d in DLIST:
 
 ################################################################################
 
+# The RVs of OSPF packets, and of the headers, LSAs and the like within them
+# (see README.rv); tables keyed by number (LSAs, links, metrics) remain
+# dictionaries.
+
+class IpHdr(Slots):
+
+    __slots__ = ("VER", "HLEN", "TOS", "IPLEN", "IPID", "FRAG", "TTL", "PROTO",
+                 "CKSUM", "SRC", "DST")
+
+class OspfHdr(Slots):
+
+    # the packet header, and the packet body as "V"
+
+    __slots__ = ("VER", "TYPE", "LEN", "RID", "AID", "CKSUM", "AUTYPE",
+                 "AUTH1", "AUTH2", "V")
+
+class OspfOpts(Slots):
+
+    __slots__ = ("Q", "E", "MC", "NP", "EA", "DC", "O")
+
+class OspfLsaHdr(Slots):
+
+    __slots__ = ("AGE", "OPTS", "T", "LSID", "ADVRTR", "LSSEQNO", "CKSUM", "L")
+
+class OspfLsaRtr(Slots):
+
+    __slots__ = ("VIRTUAL", "EXTERNAL", "BORDER", "NLINKS", "LINKS")
+
+class OspfLink(Slots):
+
+    __slots__ = ("ID", "DATA", "T", "NTOS", "METRICS")
+
+class OspfLsaNet(Slots):
+
+    __slots__ = ("MASK", "RTRS")
+
+class OspfLsaSummary(Slots):
+
+    __slots__ = ("MASK", "METRICS")
+
+class OspfLsaExt(Slots):
+
+    __slots__ = ("MASK", "METRICS")
+
+class OspfExtMetric(Slots):
+
+    __slots__ = ("EXT", "METRIC", "FWD", "TAG")
+
+class OspfHello(Slots):
+
+    __slots__ = ("NETMASK", "HELLO", "OPTS", "PRIO", "DEAD", "DESIG", "BDESIG",
+                 "NBORS")
+
+class OspfDesc(Slots):
+
+    __slots__ = ("MTU", "OPTS", "INIT", "MORE", "MASTERSLAVE")
+
+class OspfLsUpd(Slots):
+
+    __slots__ = ("NLSAS", "LSAS")
+
+class OspfLsAck(Slots):
+
+    __slots__ = ("LSAS",)
+
+#-------------------------------------------------------------------------------
+
 def parseIpHdr(msg, verbose=1, level=0):
 
     if verbose > 1: print prtbin(level*INDENT, msg[:IP_HDR_LEN])
@@ -249,18 +316,18 @@ def parseIpHdr(msg, verbose=1, level=0):
         print (level+1)*INDENT +\
               "src:%s, dst:%s" % (id2str(src), id2str(dst))
 
-    return { "VER"   : ver,
-             "HLEN"  : hlen,
-             "TOS"   : tos,
-             "IPLEN" : iplen,
-             "IPID"  : ipid,
-             "FRAG"  : frag,
-             "TTL"   : ttl,
-             "PROTO" : proto,
-             "CKSUM" : cksum,
-             "SRC"   : src,
-             "DST"   : dst
-             }
+    return IpHdr(VER   = ver,
+                 HLEN  = hlen,
+                 TOS   = tos,
+                 IPLEN = iplen,
+                 IPID  = ipid,
+                 FRAG  = frag,
+                 TTL   = ttl,
+                 PROTO = proto,
+                 CKSUM = cksum,
+                 SRC   = src,
+                 DST   = dst
+                 )
 
 def parseOspfHdr(msg, verbose=1, level=0):
 
@@ -271,16 +338,16 @@ def parseOspfHdr(msg, verbose=1, level=0):
               "OSPF: ver:%s, type:%s, len:%s, rtr id:%s, area id:%s, cksum:%x, autype:%s" %\
               (ver, MSG_TYPES[typ], len, id2str(rid), id2str(aid), cksum, AU_TYPES[autype],)
 
-    return { "VER"    : ver,
-             "TYPE"   : typ,
-             "LEN"    : len,
-             "RID"    : rid,
-             "AID"    : aid,
-             "CKSUM"  : cksum,
-             "AUTYPE" : autype,
-             "AUTH1"  : auth1,
-             "AUTH2"  : auth2,
-             }
+    return OspfHdr(VER    = ver,
+                   TYPE   = typ,
+                   LEN    = len,
+                   RID    = rid,
+                   AID    = aid,
+                   CKSUM  = cksum,
+                   AUTYPE = autype,
+                   AUTH1  = auth1,
+                   AUTH2  = auth2,
+                   )
 
 def parseOspfOpts(opts, verbose=1, level=0):
 
@@ -298,14 +365,14 @@ def parseOspfOpts(opts, verbose=1, level=0):
         print level*INDENT + "options: %s %s %s %s %s %s %s" %(
             qbit*"Q", ebit*"E", mcbit*"MC", npbit*"NP", eabit*"EA", dcbit*"DC", obit*"O")
 
-    return { "Q"  : qbit,
-             "E"  : ebit,
-             "MC" : mcbit,
-             "NP" : npbit,
-             "EA" : eabit,
-             "DC" : dcbit,
-             "O"  : obit,
-             }
+    return OspfOpts(Q  = qbit,
+                    E  = ebit,
+                    MC = mcbit,
+                    NP = npbit,
+                    EA = eabit,
+                    DC = dcbit,
+                    O  = obit,
+                    )
 
 def parseOspfLsaHdr(hdr, verbose=1, level=0):
 
@@ -318,15 +385,15 @@ def parseOspfLsaHdr(hdr, verbose=1, level=0):
                   age, LSA_TYPES[typ], id2str(lsid), id2str(advrtr), lsseqno, cksum, length)
     opts = parseOspfOpts(opts, verbose, level)
 
-    return { "AGE"     : age,
-             "OPTS"    : opts,
-             "T"       : typ,
-             "LSID"    : lsid,
-             "ADVRTR"  : advrtr,
-             "LSSEQNO" : lsseqno,
-             "CKSUM"   : cksum,
-             "L"       : length,
-             }
+    return OspfLsaHdr(AGE     = age,
+                      OPTS    = opts,
+                      T       = typ,
+                      LSID    = lsid,
+                      ADVRTR  = advrtr,
+                      LSSEQNO = lsseqno,
+                      CKSUM   = cksum,
+                      L       = length,
+                      )
 
 def parseOspfLsaRtr(lsa, verbose=1, level=0):
 
@@ -362,19 +429,19 @@ def parseOspfLsaRtr(lsa, verbose=1, level=0):
             metrics[tos] = metric
             lsa = lsa[OSPF_METRIC_LEN:]
 
-        links[i] = { "ID"      : lid,
-                     "DATA"    : ldata,
-                     "T"       : ltype,
-                     "NTOS"    : ntos,
-                     "METRICS" : metrics,
-                     }
+        links[i] = OspfLink(ID      = lid,
+                            DATA    = ldata,
+                            T       = ltype,
+                            NTOS    = ntos,
+                            METRICS = metrics,
+                            )
 
-    return { "VIRTUAL"  : v,
-             "EXTERNAL" : e,
-             "BORDER"   : b,
-             "NLINKS"   : nlinks,
-             "LINKS"    : links,
-             }
+    return OspfLsaRtr(VIRTUAL  = v,
+                      EXTERNAL = e,
+                      BORDER   = b,
+                      NLINKS   = nlinks,
+                      LINKS    = links,
+                      )
 
 def parseOspfLsaNet(lsa, verbose=1, level=0):
 
@@ -394,9 +461,9 @@ def parseOspfLsaNet(lsa, verbose=1, level=0):
         rtrs.append(rtr)
         lsa = lsa[OSPF_LSANET_LEN:]
 
-    return { "MASK" : mask,
-             "RTRS" : rtrs
-             }
+    return OspfLsaNet(MASK = mask,
+                      RTRS = rtrs
+                      )
 
 def parseOspfLsaSummary(lsa, verbose=1, level=0):
 
@@ -429,9 +496,9 @@ def parseOspfLsaSummary(lsa, verbose=1, level=0):
         metrics[tos] = metric
         lsa = lsa[OSPF_METRIC_LEN:]
 
-    return { "MASK"    : mask,
-             "METRICS" : metrics
-             }
+    return OspfLsaSummary(MASK    = mask,
+                          METRICS = metrics
+                          )
 
 def parseOspfLsaExt(lsa, verbose=1, level=0):
 
@@ -458,18 +525,18 @@ def parseOspfLsaExt(lsa, verbose=1, level=0):
                   "%s: ext:%s, tos:%s, %s, fwd:%s, tag:0x%x" %(
                       cnt, ext, int2bin(tos), mstr, id2str(fwd), tag)
 
-        metrics[tos] = { "EXT"    : ext,
-                         "METRIC" : metric,
-                         "FWD"    : fwd,
-                         "TAG"    : tag,
-                         }
+        metrics[tos] = OspfExtMetric(EXT    = ext,
+                                     METRIC = metric,
+                                     FWD    = fwd,
+                                     TAG    = tag,
+                                     )
 
         lsa = lsa[OSPF_LSAEXT_METRIC_LEN:]
         cnt += 1
 
-    return { "MASK": mask,
-             "METRICS": metrics,
-             }
+    return OspfLsaExt(MASK    = mask,
+                      METRICS = metrics,
+                      )
 
 def parseOspfLsas(lsas, verbose=1, level=0):
 
@@ -478,7 +545,7 @@ def parseOspfLsas(lsas, verbose=1, level=0):
     cnt = 0
     while len(lsas) > 0:
         cnt += 1
-        rv[cnt] = {}
+        rv[cnt] = Rv()
 
         if verbose > 0: print level*INDENT + "LSA %s" % cnt
         rv[cnt]["H"] = parseOspfLsaHdr(lsas[:OSPF_LSAHDR_LEN], verbose, level+1)
@@ -528,15 +595,15 @@ def parseOspfHello(msg, verbose=1, level=0):
         msg = msg[nbor_len:]
 
 
-    return { "NETMASK" : netmask,
-             "HELLO"   : hello,
-             "OPTS"    : parseOspfOpts(opts, verbose, level),
-             "PRIO"    : prio,
-             "DEAD"    : dead,
-             "DESIG"   : desig,
-             "BDESIG"  : bdesig,
-             "NBORS"   : nbors
-             }
+    return OspfHello(NETMASK = netmask,
+                     HELLO   = hello,
+                     OPTS    = parseOspfOpts(opts, verbose, level),
+                     PRIO    = prio,
+                     DEAD    = dead,
+                     DESIG   = desig,
+                     BDESIG  = bdesig,
+                     NBORS   = nbors
+                     )
 
 def parseOspfDesc(msg, verbose=1, level=0):
 
@@ -552,12 +619,12 @@ def parseOspfDesc(msg, verbose=1, level=0):
                masterslave*" MASTER" + (1-masterslave)*" SLAVE",
                ddseqno)
 
-    return { "MTU"         : mtu,
-             "OPTS"        : parseOspfOpts(opts, verbose, level),
-             "INIT"        : init,
-             "MORE"        : more,
-             "MASTERSLAVE" : masterslave,
-             }
+    return OspfDesc(MTU         = mtu,
+                    OPTS        = parseOspfOpts(opts, verbose, level),
+                    INIT        = init,
+                    MORE        = more,
+                    MASTERSLAVE = masterslave,
+                    )
 
 def parseOspfLSReq(msg, verbose=1, level=0):
 
@@ -571,9 +638,9 @@ def parseOspfLsUpd(msg, verbose=1, level=0):
     if verbose > 0:
         print level*INDENT + "LSUPD: nlsas:%s" % (nlsas)
 
-    return { "NLSAS" : nlsas,
-             "LSAS"  : parseOspfLsas(msg[OSPF_LSUPD_LEN:], verbose, level+1),
-             }
+    return OspfLsUpd(NLSAS = nlsas,
+                     LSAS  = parseOspfLsas(msg[OSPF_LSUPD_LEN:], verbose, level+1),
+                     )
 
 def parseOspfLsAck(msg, verbose=1, level=0):
 
@@ -586,19 +653,15 @@ def parseOspfLsAck(msg, verbose=1, level=0):
         lsas[cnt] = parseOspfLsaHdr(msg[:OSPF_LSAHDR_LEN], verbose, level+1)
         msg = msg[OSPF_LSAHDR_LEN:]
 
-    return { "LSAS"  : lsas
-             }
+    return OspfLsAck(LSAS  = lsas
+                     )
 
 def parseOspfMsg(msg, verbose=1, level=0):
 
     iph   = parseIpHdr(msg[:IP_HDR_LEN], verbose, level)
     msg   = msg[IP_HDR_LEN:]
     ospfh = parseOspfHdr(msg[:OSPF_HDR_LEN], verbose, level+1)
-    rv = { "T": ospfh["TYPE"],
-           "L": len(msg),
-           "H": iph,
-           "V": ospfh,
-           }
+    rv = Rv(T=ospfh["TYPE"], L=len(msg), H=iph, V=ospfh)
 
     if MSG_TYPES[ospfh["TYPE"]] == "HELLO":
         rv["V"]["V"] = parseOspfHello(msg[OSPF_HDR_LEN:], verbose, level+2)
@@ -734,6 +797,11 @@ if __name__ == "__main__":
 
     file_pfx  = mrtd.DEFAULT_FILE
     file_sz   = mrtd.DEFAULT_SIZE
+    queue_len = mrtd.QUEUE_LEN
+    compress  = None
+    comp_bg   = 0
+    rot_time  = 0
+    blk_size  = 0
     mrtd_type = None
 
     #---------------------------------------------------------------------------
@@ -749,19 +817,33 @@ if __name__ == "__main__":
         -d|--dump     : Dump protocol MRTD file
         -f|--file     : Set file prefix for MRTd dump [def: %s]
         -z|--size     : Size of output file(s) [min: %d]
+        -Q|--queue    : Queue up to this many messages for a writer
+                        thread [def: %d, write inline]
+        -r|--rotate-time : Also start a new output file every this many
+                        seconds [def: size only]
+        -c|--compress    : Compress output as it's written [%s]
+        -C|--compress-bg : Compress output files once they're rotated
+                        out [%s]
+        -B|--block-size  : Compress in blocks of this size, with a
+                        block index for seeking; records are written
+                        only as blocks fill, not every second
+                        [def: none]
         -b|--bind <ipaddr> : local IP address for bind """ %\
             (os.path.basename(sys.argv[0]),
              mrtd.DEFAULT_FILE,
-             mrtd.MIN_FILE_SZ)
+             mrtd.MIN_FILE_SZ, mrtd.QUEUE_LEN,
+             string.join(mrtd.COMPRESSORS.keys(), "|"), string.join(mrtd.COMPRESSORS.keys(), "|"))
         sys.exit(0)
 
     #---------------------------------------------------------------------------
 
     try:
         opts, args = getopt.getopt(sys.argv[1:],
-                                   "hqvVdf:z:",
+                                   "hqvVdf:z:Q:c:C:r:B:",
                                    ("help", "quiet", "verbose", "VERBOSE",
-                                    "dump", "file=", "size=", ))
+                                    "dump", "file=", "size=", "queue=",
+                                    "compress=", "compress-bg=",
+                                    "rotate-time=", "block-size=", ))
     except (getopt.error):
         usage()
 
@@ -788,6 +870,21 @@ if __name__ == "__main__":
         elif x in ('-z', '--file-size'):
             file_sz = max(string.atof(y), mrtd.MIN_FILE_SZ)
 
+        elif x in ('-Q', '--queue'):
+            queue_len = string.atoi(y)
+
+        elif x in ('-c', '--compress', '-C', '--compress-bg'):
+            if y not in mrtd.COMPRESSORS:
+                usage()
+            compress = y
+            comp_bg  = x in ('-C', '--compress-bg')
+
+        elif x in ('-r', '--rotate-time'):
+            rot_time = string.atoi(y)
+
+        elif x in ('-B', '--block-size'):
+            blk_size = string.atoi(y)
+
         elif x in ('-b', '--bind'):
             ADDRESS = y
 
@@ -799,7 +896,10 @@ if __name__ == "__main__":
     #---------------------------------------------------------------------------
 
     ospf       = Ospf()
-    ospf._mrtd = mrtd.Mrtd(file_pfx, "w+b", file_sz, mrtd.MSG_TYPES["PROTOCOL_OSPF2"], ospf)
+    ospf._mrtd = mrtd.Mrtd(file_pfx, "w+b", file_sz, mrtd.MSG_TYPES["PROTOCOL_OSPF2"], ospf,
+                           queue_len=queue_len, compress=compress,
+                           compress_bg=comp_bg, rotate_time=rot_time,
+                           block_size=blk_size)
 
     if VERBOSE > 0: print ospf
 
@@ -808,11 +908,21 @@ if __name__ == "__main__":
 
         rv = None
         while 1:
+            # wake for the dump's buffer too; see Mrtd.flushDue()
             before = time.time()
-            rfds, _, _ = select.select([ospf._sock], [], [], timeout)
+            wait = timeout
+            due = ospf._mrtd.flushDue()
+            if due is not None:
+                wait = max(0, min(wait, due - before))
+
+            rfds, _, _ = select.select([ospf._sock], [], [], wait)
             after = time.time()
             elapsed = after - before
 
+            due = ospf._mrtd.flushDue()
+            if due is not None and after >= due:
+                ospf._mrtd.flush()
+
             if len(rfds) > 0: rv = ospf.parseMsg(VERBOSE, 0)
             else:
                 ## tx some pkts to form adjacency
@@ -1,4 +1,4 @@
-#! /usr/bin/env python2.5
+#! /usr/bin/env python2.7
 
 ##     PyRT: Python Routeing Toolkit
 
@@ -21,7 +21,7 @@
 ##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
 ##     02111-1307 USA
 
-import os, time, struct, getopt, sys, mrtd, pprint, ospf
+import os, time, struct, getopt, sys, mrtd, bgp, pprint, ospf
 from mutils import *
 
 ################################################################################
@@ -31,6 +31,8 @@ if __name__ == "__main__":
     VERBOSE = 1
     START_T = -1
     END_T   = -1
+    JOBS    = mrtd.INFLATE_PROCS
+    ATTRS   = None
 
     #---------------------------------------------------------------------------
 
@@ -42,8 +44,14 @@ if __name__ == "__main__":
         -q|--quiet     : Be quiet
 
         -s|--start-time: Start time of packets of interest [inclusive]
-        -t|--end-time  : End time of packets of interest [inclusive]""" %\
-            (os.path.basename(sys.argv[0]),)
+        -t|--end-time  : End time of packets of interest [inclusive]
+        -a|--attrs     : Decode only these path attributes, a comma
+                         separated list of names or type codes
+                         ("" for none) [def: all]
+
+        -j|--jobs      : Decompress bzip2 input with this many
+                         processes [def: %d]""" %\
+            (os.path.basename(sys.argv[0]), mrtd.INFLATE_PROCS)
         sys.exit(0)
 
     #---------------------------------------------------------------------------
@@ -53,9 +61,10 @@ if __name__ == "__main__":
 
     try:
         opts, args = getopt.getopt(sys.argv[1:],
-                                   "hqvVs:t:",
+                                   "hqvVs:t:a:j:",
                                    ("help", "verbose", "VERBOSE", "quiet",
-                                    "start-time=", "end-time=", ))
+                                    "start-time=", "end-time=", "attrs=",
+                                    "jobs=", ))
     except (getopt.error):
         usage()
 
@@ -78,6 +87,24 @@ if __name__ == "__main__":
         elif x in ('-t', '--end-time'):
             END_T = time.mktime(time.strptime(y))
 
+        elif x in ('-a', '--attrs'):
+            ATTRS = []
+            for a in string.split(y, ","):
+                a = string.strip(a)
+                if not a:
+                    continue
+                try:
+                    a = string.atol(a)
+                except ValueError:
+                    a = bgp.PATH_ATTRIBUTES.get(string.upper(a))
+                    if a is None:
+                        usage()
+                ATTRS.append(a)
+            ATTRS = frozenset(ATTRS)
+
+        elif x in ('-j', '--jobs'):
+            JOBS = string.atoi(y)
+
     filenames = args
     if not filenames:
         usage()
@@ -87,19 +114,18 @@ if __name__ == "__main__":
     for fn in filenames:
         cnt = 0
         try:
-            mrt = mrtd.Mrtd(fn, "rb", mrtd.DEFAULT_SIZE)
+            mrt = mrtd.Mrtd(fn, "rb", mrtd.DEFAULT_SIZE, inflate_procs=JOBS)
             error('[ %s ] parsing...\n' % fn)
-            while 1:
-                msg = mrt.read()
-                if (((START_T < 0) or (msg[0] >= START_T)) and
-                    ((END_T   < 0) or (msg[0] <= END_T))):
 
-                    rv = mrt.parse(msg, VERBOSE)
-                    cnt = cnt + 1
-                    if VERBOSE > 2: pprint.pprint(rv)
+            # with a sidecar index (mrtd.py -i) records() skips straight to
+            # the start of the window, and stops at its end
+            for rv in mrt.rvs(start_t=START_T, end_t=END_T, verbose=VERBOSE,
+                              attrs=ATTRS):
+                cnt = cnt + 1
+                if VERBOSE > 2: pprint.pprint(rv2dict(rv))
 
-        except mrtd.EOFExc:
             error("end of file: %u messages\n" % cnt)
+
         except KeyboardInterrupt:
             error("interrupted!\n")
 
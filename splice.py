@@ -1,4 +1,4 @@
-#! /usr/bin/env python2.5
+#! /usr/bin/env python2.7
 
 ##     PyRT: Python Routeing Toolkit
 
@@ -30,11 +30,19 @@ from mutils import *
 
 class Msg:
 
-    def __init__(self, mrt, msg):
+    # the current record of an Mrtd.records() generator; next() advances,
+    # raising StopIteration when the generator is exhausted
+
+    def __init__(self, mrt, msgs):
 
         self._mrt  = mrt
-        self._msg  = msg
-        self._time = msg[0]
+        self._msgs = msgs
+        self.next()
+
+    def next(self):
+
+        self._msg  = self._msgs.next()
+        self._time = self._msg[0]
 
     def __repr__(self):
 
@@ -136,18 +144,16 @@ if __name__ == "__main__":
         msgs  = []
         mrtds = {}
 
+        # records() does the windowing, seeking to START_T and stopping
+        # after END_T if the file has an index
+
         for f in filenames:
             mrtds[f] = mrtd.Mrtd(f, "rb")
             try:
-                while 1:
-                    msg = mrtds[f].read()
-                    if (((START_T < 0) or (msg[0] >= START_T)) and
-                        ((END_T   < 0) or (msg[0] <= END_T))):
-
-                        msgs.append( Msg(mrtds[f], msg) )
-                        break
+                msgs.append(Msg(mrtds[f],
+                                mrtds[f].records(start_t=START_T, end_t=END_T)))
 
-            except (mrtd.EOFExc):
+            except (StopIteration):
                 del mrtds[f]
 
         msgs.sort()
@@ -166,19 +172,15 @@ if __name__ == "__main__":
                                             time.localtime(msgs[0]._time)),
                               "w+b")
 
-                if (((START_T < 0) or (msgs[0]._time >= START_T)) and
-                    ((END_T   < 0) or (msgs[0]._time <= END_T))):
-
-                    of.write(msg)
-                    if VERBOSE > 2:
-                        print prtbin("", msg)
-                    rv = msgs[0].parse(VERBOSE)
+                of.write(msg)
+                if VERBOSE > 2:
+                    print prtbin("", msg)
+                rv = msgs[0].parse(VERBOSE)
 
-                msg = msgs[0]._mrt.read()
-                msgs[0] = Msg(msgs[0]._mrt, msg)
+                msgs[0].next()
                 msgs.sort()
 
-            except (mrtd.EOFExc):
+            except (StopIteration):
                 del msgs[0]
 
     except (KeyboardInterrupt):
@@ -1,4 +1,4 @@
-#! /usr/bin/env python2.5
+#! /usr/bin/env python2.7
 
 ##     PyRT: Python Routeing Toolkit
 
@@ -31,8 +31,24 @@ VIEW_NO      = 0x00
 STATUS       = 0x01
 MINS_TO_SECS = 60
 
+# only these can carry UPDATEs; other records are dropped undecoded
+BGP_TYPES    = (mrtd.MSG_TYPES["PROTOCOL_BGP"],
+                mrtd.MSG_TYPES["PROTOCOL_BGP4MP"],
+                mrtd.MSG_TYPES["PROTOCOL_BGP4PY"])
+
+# most prefixes share one of comparatively few sets of path attributes, so
+# the table keeps one copy of each set's octets
+
+ATTRS_STRS   = {}
+
 ################################################################################
 
+def internAttrs(astr):
+
+    return ATTRS_STRS.setdefault(astr, astr)
+
+#-------------------------------------------------------------------------------
+
 def processEntry(rv):
 
     def mkStr(attr, aval):
@@ -116,7 +132,7 @@ def processEntry(rv):
         rstr = mkStr(attr, rv["V"]["V"]["PATH_ATTRS"][attr])
         astr = struct.pack('%ds%ds' % (len(astr), len(rstr)),
                            astr, rstr)
-
+    astr = internAttrs(astr)
 
     for pfx in rv["V"]["V"]["FEASIBLE"]:
         TABLE[pfx] = {"TIME"   : msg_tm,
@@ -173,6 +189,7 @@ if __name__ == "__main__":
     OUTPUT_F = 'bview'
     TABLE_F = None
     TABLE   = {}
+    JOBS    = mrtd.INFLATE_PROCS
 
     #---------------------------------------------------------------------------
 
@@ -186,8 +203,10 @@ if __name__ == "__main__":
         -f|--file       : Filename prefix for output
         -s|--start-time : Start time of packets of interest [inclusive]
         -i|--interval   : Table dump invterval (minutes)
-        -t|--table      : Initial table [def.: none]""" %\
-            (os.path.basename(sys.argv[0]),)
+        -t|--table      : Initial table [def.: none]
+        -j|--jobs       : Decompress bzip2 input with this many
+                          processes [def.: %d]""" %\
+            (os.path.basename(sys.argv[0]), mrtd.INFLATE_PROCS)
         sys.exit(0)
 
     #---------------------------------------------------------------------------
@@ -198,9 +217,10 @@ if __name__ == "__main__":
     try:
         opts, args =\
               getopt.getopt(sys.argv[1:],
-                            "hqvf:s:i:t:",
+                            "hqvf:s:i:t:j:",
                             ("help", "quiet", "verbose",
-                             "file=", "start-time=", "interval=", "table=" ))
+                             "file=", "start-time=", "interval=", "table=",
+                             "jobs=" ))
     except (getopt.error):
         usage()
 
@@ -226,6 +246,9 @@ if __name__ == "__main__":
         elif x in ('-t', '--table'):
             TABLE_F = y
 
+        elif x in ('-j', '--jobs'):
+            JOBS = string.atoi(y)
+
         else:
             usage()
 
@@ -243,9 +266,8 @@ if __name__ == "__main__":
         cnt = 0
         error('[ %s ] initializing table...' % TABLE_F)
         try:
-            mrt = mrtd.Mrtd(TABLE_F, "rb")
-            while 1:
-                rv = mrt.parse(mrt.read(), VERBOSE)
+            mrt = mrtd.Mrtd(TABLE_F, "rb", inflate_procs=JOBS)
+            for rv in mrt.rvs(verbose=VERBOSE):
                 cnt = cnt + 1
                 if rv["T"] == mrtd.MSG_TYPES["TABLE_DUMP"]:
                     for v in rv["V"]:
@@ -253,12 +275,12 @@ if __name__ == "__main__":
                         entry = { "TIME"   : v["V"]["UPTIME"],
                                   "PEER_IP": v["V"]["PEER_IP"],
                                   "PEER_AS": v["V"]["PEER_AS"],
-                                  "ATTRS"  : v["V"]["ATTRS"],
+                                  "ATTRS"  : internAttrs(v["V"]["ATTRS"]),
                                   }
 
                         TABLE[pfx] = entry
-        except (mrtd.EOFExc):
             error("end of file: %u messages\n" % cnt)
+
         except (KeyboardInterrupt):
             error("interrupted: %u messages\n" % cnt)
         mrt.close()
@@ -272,33 +294,31 @@ if __name__ == "__main__":
         cnt = 0
         try:
             error('[ %s ] parsing...' % fn)
-            mrt = mrtd.Mrtd(fn, "rb")
-            while 1:
-                msg = mrt.read()
+            mrt = mrtd.Mrtd(fn, "rb", inflate_procs=JOBS)
+            for msg in mrt.records(BGP_TYPES, START_T):
                 cnt = cnt + 1
-                if (START_T < 0) or (msg[0] >= START_T):
-                    rv = mrt.parse(msg, VERBOSE)
-                    if ((rv["T"] == mrtd.MSG_TYPES["PROTOCOL_BGP"] and
-                         rv["ST"] == mrtd.BGP_SUBTYPES["UPDATE"])
-                        or
-                        (rv["T"] == mrtd.MSG_TYPES["PROTOCOL_BGP4MP"] and
-                         rv["ST"] == mrtd.BGP4MP_SUBTYPES["MESSAGE"] and
-                         rv["V"]["T"] == bgp.MSG_TYPES["UPDATE"])
-                        or
-                        (rv["T"] == mrtd.MSG_TYPES["PROTOCOL_BGP4PY"] and
-                         rv["ST"] == mrtd.BGP4MP_SUBTYPES["MESSAGE"] and
-                         rv["V"]["T"] == bgp.MSG_TYPES["UPDATE"])
-                        ):
-
-                        processEntry(rv)
-
-                        LAST_TM = msg[0]
-                        if (LAST_TM > NEXT_DUMP and NEXT_DUMP > START_T):
-                            dumpTable()
-                            NEXT_DUMP = NEXT_DUMP + INTERVAL
-
-        except (mrtd.EOFExc):
+                rv = mrt.parse(msg, VERBOSE)
+                if ((rv["T"] == mrtd.MSG_TYPES["PROTOCOL_BGP"] and
+                     rv["ST"] == mrtd.BGP_SUBTYPES["UPDATE"])
+                    or
+                    (rv["T"] == mrtd.MSG_TYPES["PROTOCOL_BGP4MP"] and
+                     rv["ST"] == mrtd.BGP4MP_SUBTYPES["MESSAGE"] and
+                     rv["V"]["T"] == bgp.MSG_TYPES["UPDATE"])
+                    or
+                    (rv["T"] == mrtd.MSG_TYPES["PROTOCOL_BGP4PY"] and
+                     rv["ST"] == mrtd.BGP4MP_SUBTYPES["MESSAGE"] and
+                     rv["V"]["T"] == bgp.MSG_TYPES["UPDATE"])
+                    ):
+
+                    processEntry(rv)
+
+                    LAST_TM = msg[0]
+                    if (LAST_TM > NEXT_DUMP and NEXT_DUMP > START_T):
+                        dumpTable()
+                        NEXT_DUMP = NEXT_DUMP + INTERVAL
+
             error("end of file: %u messages..." % cnt)
+
         except (KeyboardInterrupt):
             error("interrupted: %u messages..." % cnt)
         error('done\n')